@@ -309,7 +309,9 @@ class BSNServicePlugin(service_base.ServicePluginBase,
 
     # public CRUD methods for Topology Sync command
     def update_forcesynctopology(self, context, id, forcesynctopology):
-        eventlet.spawn(self.servers.force_topo_sync, **{'check_ts': False})
+        eventlet.spawn(self.servers.force_topo_sync,
+                       **{'check_ts': False,
+                          'trigger': servermanager.TOPO_SYNC_TRIGGER_USER})
         return {'id': '1',
                 'tenant_id': context.project_id,
                 'project_id': context.project_id,
@@ -334,20 +336,27 @@ class BSNServicePlugin(service_base.ServicePluginBase,
                     timestamp_datetime = consistency_db.convert_ts_to_datetime(
                         timestamp_ms)
                     result = 'Topology sync complete.'
+                # requests merged into the last topology sync
+                triggers = (context.session.query(
+                    consistency_db.ConsistencyHash).filter_by(
+                        hash_id=consistency_db.TOPO_SYNC_TRIGGERS_HASH_ID).
+                    first())
                 # return the result
                 return [{'id': '1',
                          'tenant_id': context.project_id,
                          'project_id': context.project_id,
                          'timestamp_ms': timestamp_ms,
                          'timestamp_datetime': timestamp_datetime,
-                         'status': result}]
+                         'status': result,
+                         'triggers': triggers.hash if triggers else ''}]
             else:
                 return [{'id': '1',
                          'tenant_id': context.project_id,
                          'project_id': context.project_id,
                          'timestamp_ms': '0',
                          'timestamp_datetime': '0',
-                         'status': 'FAILURE'}]
+                         'status': 'FAILURE',
+                         'triggers': ''}]
 
     def get_forcesynctopology(self, context, id, fields=None):
         return self.get_forcesynctopologies(context=context)[0]
@@ -45,10 +45,34 @@ restproxy_opts = [
                 help=_("Disables SSL certificate validation for controllers")),
     cfg.BoolOpt('cache_connections', default=True,
                 help=_("Re-use HTTP/HTTPS connections to the controller.")),
+    cfg.IntOpt('connection_pool_size', default=8,
+               help=_("Maximum number of idle HTTP/HTTPS connections kept "
+                      "open to each controller when cache_connections is "
+                      "enabled.")),
+    cfg.IntOpt('connection_idle_timeout', default=60,
+               help=_("Number of seconds an idle cached connection to a "
+                      "controller is kept before it is closed.")),
+    cfg.StrOpt('http_transport', default='httplib',
+               choices=['httplib', 'bounded'],
+               help=_("How requests are sent to the controller. 'httplib' "
+                      "opens a connection for every concurrent request. "
+                      "'bounded' allows at most connection_pool_size "
+                      "concurrent requests, each on its own blocking "
+                      "keep-alive connection, the others wait for a free "
+                      "connection up to the request timeout.")),
+    cfg.BoolOpt('request_compression', default=True,
+                help=_("Gzip compress large request bodies and accept gzip "
+                       "compressed responses if the controller advertises "
+                       "support for it.")),
+    cfg.IntOpt('request_compression_threshold', default=16384,
+               help=_("Minimum size in bytes of a request body before it "
+                      "is compressed.")),
     cfg.StrOpt('ssl_cert_directory',
                default='/etc/neutron/plugins/bigswitch/ssl',
                help=_("Directory containing ca_certs and host_certs "
-                      "certificate directories.")),
+                      "certificate directories. Certificates are loaded "
+                      "once per controller and reloaded when they change; "
+                      "TLS sessions are not resumed.")),
     cfg.BoolOpt('sync_data', default=False,
                 help=_("Sync data on connect")),
     cfg.BoolOpt('auto_sync_on_failure', default=True,
@@ -56,15 +80,70 @@ restproxy_opts = [
                        "the backend controller doesn't know of a dependency, "
                        "the plugin automatically triggers a full data "
                        "synchronization to the controller.")),
+    cfg.BoolOpt('topo_sync_delta', default=True,
+                help=_("Send only the objects that changed since the last "
+                       "topology sync, if the controller supports it. A full "
+                       "topology sync is performed if the controller state "
+                       "does not match.")),
     cfg.IntOpt('consistency_interval', default=60,
                help=_("Time between verifications that the backend controller "
                       "database is consistent with Neutron. (0 to disable)")),
     cfg.IntOpt('server_timeout', default=10,
                help=_("Maximum number of seconds to wait for proxy request "
                       "to connect and complete.")),
+    cfg.IntOpt('circuit_breaker_threshold', default=3,
+               help=_("Number of consecutive failed requests to a controller "
+                      "after which requests skip it until it recovers. "
+                      "(0 to disable)")),
+    cfg.IntOpt('circuit_breaker_reset_timeout', default=5,
+               help=_("Number of seconds a controller is skipped after it "
+                      "failed, before a trial request is sent to it. Doubles "
+                      "every time the trial request fails.")),
+    cfg.IntOpt('health_probe_interval', default=30,
+               help=_("Time between background health checks of each "
+                      "controller. (0 to disable)")),
     cfg.IntOpt('thread_pool_size', default=4,
                help=_("Maximum number of threads to spawn to handle large "
                       "volumes of port creations.")),
+    cfg.BoolOpt('async_dispatch', default=False,
+                help=_("Send ML2 postcommit and security group updates to "
+                       "the controller in the background instead of in the "
+                       "API request. Updates of the same object are sent in "
+                       "order, superseded updates are dropped.")),
+    cfg.IntOpt('async_dispatch_queue_size', default=1000,
+               help=_("Maximum number of queued background updates per "
+                      "worker before API requests wait for the queue to "
+                      "drain.")),
+    cfg.FloatOpt('network_update_debounce', default=0,
+                 help=_("Number of seconds during which network updates "
+                        "caused by subnet and floating IP changes are "
+                        "merged into a single update to the controller. "
+                        "0 sends every update right away.")),
+    cfg.FloatOpt('port_batch_window', default=0,
+                 help=_("Number of seconds during which port attachments "
+                        "are gathered into a single bulk request to the "
+                        "controller, if the controller supports it. 0 "
+                        "sends every port on its own.")),
+    cfg.IntOpt('port_batch_size', default=100,
+               help=_("Maximum number of port attachments in a bulk "
+                      "request.")),
+    cfg.FloatOpt('port_status_batch_window', default=0.01,
+                 help=_("Number of seconds during which port status changes "
+                        "are gathered and written to the database "
+                        "together. 0 writes every change on its own.")),
+    cfg.IntOpt('topo_snapshot_interval', default=0,
+               help=_("Time between topology snapshots built ahead of "
+                      "topology syncs, in seconds. A sync sends the "
+                      "snapshot if the neutron DB hasn't changed since it "
+                      "was built. (0 to disable)")),
+    cfg.IntOpt('consistency_db_pool_size', default=2,
+               help=_("Number of connections to the database kept open by "
+                      "each worker for the topology sync lock and other "
+                      "consistency records.")),
+    cfg.IntOpt('consistency_db_max_overflow', default=8,
+               help=_("Number of connections to the database for the "
+                      "consistency records that may be opened beyond "
+                      "consistency_db_pool_size when all are in use.")),
     cfg.StrOpt('neutron_id', default='neutron-' + net.get_hostname(),
                deprecated_name='quantum_id',
                help=_("User defined identifier for this Neutron deployment")),
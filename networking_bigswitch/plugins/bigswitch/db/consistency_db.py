@@ -14,7 +14,8 @@
 #    under the License.
 import datetime
 import eventlet
-import random
+from eventlet import event
+import os
 import re
 import time
 
@@ -25,16 +26,25 @@ from oslo_log import log as logging
 import sqlalchemy as sa
 
 from neutron_lib.db import model_base
-from neutron_lib import exceptions
-
-from networking_bigswitch.plugins.bigswitch.i18n import _
 
 LOG = logging.getLogger(__name__)
 
-MIN_LOCK_RETRY_SLEEP_TIME_SECS = 5
-MAX_LOCK_RETRY_SLEEP_TIME_SECS = 30
-MAX_LOCK_RETRY_COUNT = 12
+# the TOPO_SYNC lock is a lease of this many seconds, renewed by the holder
+# TOPO_SYNC_LEASE_RENEWALS times per lease
+TOPO_SYNC_LEASE_SECS = 60
+TOPO_SYNC_LEASE_RENEWALS = 3
+# workers waiting for the lock check whether another worker released it
+# this often. waiters in the worker that holds the lock are woken right away
+TOPO_SYNC_LOCK_POLL_SECS = 5
 TOPO_SYNC_EXPIRED_SECS = 1800
+# consistency hash record counting the TOPO_SYNC lock acquisitions, the count
+# is the fencing token sent to the controller with a sync
+TOPO_SYNC_TOKEN_HASH_ID = 'TOPO_SYNC_TOKEN'
+# consistency hash record listing what requested the last TOPO_SYNC, as
+# trigger:count pairs
+TOPO_SYNC_TRIGGERS_HASH_ID = 'TOPO_SYNC_TRIGGERS'
+# consistency hash record holding the time of the last keystone tenant sync
+KEYSTONE_SYNC_HASH_ID = 'KEYSTONE_SYNC'
 
 
 class ConsistencyHash(model_base.BASEV2):
@@ -51,13 +61,71 @@ class ConsistencyHash(model_base.BASEV2):
     hash = sa.Column(sa.String(255), nullable=False)
 
 
+class TopoSyncHash(model_base.BASEV2):
+    """Topology Sync Hash
+
+    Content hash of every top level topology object (network, router,
+    security group, tenant) as it was last pushed to the controller by a
+    topology sync. Used to compute delta syncs.
+    """
+    __tablename__ = 'bsn_topo_sync_hashes'
+    object_type = sa.Column(sa.String(64), primary_key=True)
+    object_id = sa.Column(sa.String(255), primary_key=True)
+    hash = sa.Column(sa.String(64), nullable=False)
+
+
+class KeystoneTenant(model_base.BASEV2):
+    """Keystone Tenant
+
+    Keystone projects as last fetched by any neutron worker. Shared by all
+    workers so that only one of them has to list the projects from keystone.
+    """
+    __tablename__ = 'bsn_keystone_tenants'
+    tenant_id = sa.Column(sa.String(255), primary_key=True)
+    tenant_name = sa.Column(sa.String(255), nullable=False)
+
+
+def get_engine_facade():
+    """Engine of the consistency DB for this process
+
+    The engine and its bounded connection pool are created on first use and
+    kept, so connections stay open between uses. A worker forked after the
+    pool was created gets a new engine the first time it uses it, the
+    connections inherited from the parent are left to the parent.
+    """
+    pid = os.getpid()
+    if HashHandler._FACADE is None or HashHandler._facade_pid != pid:
+        if HashHandler._FACADE is not None:
+            LOG.debug("Consistency DB: creating connection pool for forked "
+                      "worker %s", pid)
+        HashHandler._FACADE = session.EngineFacade(
+            cfg.CONF.database.connection, sqlite_fk=True, _conf=cfg.CONF,
+            max_pool_size=cfg.CONF.RESTPROXY.consistency_db_pool_size,
+            max_overflow=cfg.CONF.RESTPROXY.consistency_db_max_overflow)
+        HashHandler._facade_pid = pid
+    return HashHandler._FACADE
+
+
+def get_pool_stats():
+    """Connection pool usage of the consistency DB engine
+
+    :return: dict of the pool size and of the connections checked in,
+             checked out and opened beyond the pool size. Empty if the
+             engine wasn't created in this process or its pool doesn't keep
+             connections.
+    """
+    if HashHandler._FACADE is None or HashHandler._facade_pid != os.getpid():
+        return {}
+    pool = HashHandler._FACADE.get_engine().pool
+    if not isinstance(pool, sa.pool.QueuePool):
+        return {}
+    return {'size': pool.size(), 'checkedin': pool.checkedin(),
+            'checkedout': pool.checkedout(), 'overflow': pool.overflow()}
+
+
 def setup_db():
     '''Helper to register models for unit tests'''
-    if HashHandler._FACADE is None:
-        HashHandler._FACADE = session.EngineFacade.from_config(
-            cfg.CONF, sqlite_fk=True)
-    ConsistencyHash.metadata.create_all(
-        HashHandler._FACADE.get_engine())
+    ConsistencyHash.metadata.create_all(get_engine_facade().get_engine())
 
 
 def clear_db():
@@ -91,16 +159,33 @@ def get_lock_owner(hash):
     return matches[0]
 
 
-class LockRetryCountExceededException(exceptions.NeutronException):
-    message = _("TOPO_SYNC: LockTS %(lock_ts)s, datetime %(lock_dt_string)s "
-                "exceeded MAX_LOCK_RETRY_COUNT %(max_lock)s.")
-    status = None
+def format_topo_sync_triggers(triggers):
+    return ','.join('%s:%d' % (trigger, count)
+                    for trigger, count in sorted(triggers.items()))
+
+
+def parse_topo_sync_triggers(hash):
+    """Triggers of a TOPO_SYNC as recorded by put_topo_sync_triggers
+
+    :return: dict {trigger: number of requests merged into the sync}
+    """
+    triggers = {}
+    for pair in hash.split(','):
+        trigger, sep, count = pair.rpartition(':')
+        if sep and count.isdigit():
+            triggers[trigger] = int(count)
+    return triggers
 
-    def __init__(self, **kwargs):
-        self.lock_ts = kwargs.get('lock_ts')
-        self.lock_dt_string = kwargs.get('lock_dt_string')
-        self.max_lock = kwargs.get('max_lock')
-        super(LockRetryCountExceededException, self).__init__(**kwargs)
+
+def get_lock_lease(hash):
+    """Expiry time of a TOPO_SYNC lock
+
+    :return: expiry as float, or None if the lock was taken without a lease
+    """
+    matches = re.findall(r"LEASE\[(\d+\.\d+)\]$", hash)
+    if not matches:
+        return None
+    return float(matches[0])
 
 
 class HashHandler(object):
@@ -113,38 +198,28 @@ class HashHandler(object):
     neutron connection so rollbacks from consistency hash operations don't
     affect the parent sessions.
     """
+    # see get_engine_facade
     _FACADE = None
+    _facade_pid = None
+    # sent when a lock held by this worker is released
+    _lock_released = None
 
     def __init__(self, hash_id='1', timestamp_ms=None):
-        if HashHandler._FACADE is None:
-            HashHandler._FACADE = session.EngineFacade.from_config(
-                cfg.CONF, sqlite_fk=True)
-
         self.hash_id = hash_id
-        self.session = HashHandler._FACADE.get_session(autocommit=True,
+        self.session = get_engine_facade().get_session(autocommit=True,
                                                        expire_on_commit=False)
         self.lock_ts = str(timestamp_ms) if timestamp_ms else str(time.time())
         self.lock_marker = 'TOPO_SYNC[%s]' % self.lock_ts
-        self.lock_retry_count = 0
+        # fencing token of the lock while held, see get_fencing_token
+        self.fencing_token = None
+        self._heartbeat = None
+        # sent by unlock() to stop the heartbeat
+        self._heartbeat_stop = None
         # before grabbing the lock, store the previous timestamp
         # in case there is an exception while collecting data or updating BCF,
         # revert to previous timestamp
         self.prev_lock_ts = '0'
 
-    def _increment_lock_retry(self):
-        """Increments lock retry count.
-
-        Raises exception when it goes over the retry limit.
-
-        :return:
-        """
-        self.lock_retry_count += 1
-        if self.lock_retry_count >= MAX_LOCK_RETRY_COUNT:
-            raise LockRetryCountExceededException(
-                lock_ts=self.lock_ts,
-                lock_dt_string=convert_ts_to_datetime(self.lock_ts),
-                max_lock=MAX_LOCK_RETRY_COUNT)
-
     def _get_current_record(self):
         with self.session.begin(subtransactions=True):
             res = (self.session.query(ConsistencyHash).
@@ -166,12 +241,16 @@ class HashHandler(object):
             return False
 
     def _optimistic_update_hash_record(self, old_record, new_hash):
+        return self._optimistic_update_hash(old_record.hash_id,
+                                            old_record.hash, new_hash)
+
+    def _optimistic_update_hash(self, hash_id, old_hash, new_hash):
         # Optimistic update strategy. Returns True if successful, else False.
         query = sa.update(ConsistencyHash.__table__).values(hash=new_hash)
-        query = query.where(ConsistencyHash.hash_id == old_record.hash_id)
-        query = query.where(ConsistencyHash.hash == old_record.hash)
+        query = query.where(ConsistencyHash.hash_id == hash_id)
+        query = query.where(ConsistencyHash.hash == old_hash)
         try:
-            with self._FACADE.get_engine().begin() as conn:
+            with get_engine_facade().get_engine().begin() as conn:
                 result = conn.execute(query)
         except db_exc.DBDeadlock:
             # mysql can encounter internal deadlocks servicing a query with
@@ -233,16 +312,22 @@ class HashHandler(object):
     def lock(self, check_ts=True):
         """Lock based on the below condition:
 
+        The lock is a lease: while locked, the hash record holds
+        TOPO_SYNC[lock_ts]LEASE[expiry]. The holder renews the lease in the
+        background until unlock(), so the lock of a worker that crashed is
+        taken over once its lease expires.
+
         while -
             if no hash present
               insert lock and move on
 
             if hash present
-              - check if TOPO_SYNC is present i.e. TopoSync ongoing or expired
-                 - (y) check if the Previous TopoSync has expired
-                    - (y) evict it, put self ts and move on
+              - check if TOPO_SYNC is present i.e. TopoSync ongoing
                   - if locked by self, return
-                  - else if check_ts is false, sleep_and_retry
+                  - (y) check if the lease of the TopoSync has expired
+                    - (y) evict it, put self ts and move on
+                  - else if check_ts is false, wait for the lock to be
+                    released or its lease to expire and retry
 
               - if no TOPO_SYNC
                 - grab lock, check if TS has expired
@@ -254,9 +339,6 @@ class HashHandler(object):
                             True if all conditions met and lock acquired
                             False if locking not required
         """
-        retry_sleep_time = random.randint(MIN_LOCK_RETRY_SLEEP_TIME_SECS,
-                                          MAX_LOCK_RETRY_SLEEP_TIME_SECS)
-        new_hash = self.lock_marker
         while True:
             res = self._get_current_record()
             # set prev_lock_ts based on record
@@ -269,85 +351,65 @@ class HashHandler(object):
             # try lock acquisition based on hash record
             if not res:
                 # no hash present, try optimistically locking it
+                self.lock_marker = self._lease_marker()
                 if not self._insert_hash_with_lock():
-                    # someone else beat us to it, sleep and retry
+                    # someone else beat us to it, retry
                     log_lock_acquisition_failure('0', self.lock_ts)
-                    eventlet.sleep(retry_sleep_time)
                     continue
                 # got the lock, execute update since nothing existed earlier
-                LOG.debug(
-                    "TOPO_SYNC: LockTS %(lockts)s, datetime %(dt_string)s has "
-                    "grabbed the lock.",
-                    {'lockts': self.lock_ts,
-                     'dt_string': convert_ts_to_datetime(self.lock_ts)})
-                return True
+                return self._lock_acquired()
 
             if 'TOPO_SYNC' in res.hash:
-                # TOPO_SYNC already in progress. Check if timestamp is over
-                # the limit
                 prev_ts = get_lock_owner(res.hash)
-                if self._is_timestamp_expired(
-                        expire_secs=TOPO_SYNC_EXPIRED_SECS, prev_ts=prev_ts):
+                if prev_ts == self.lock_ts:
+                    LOG.debug("TOPO_SYNC: LockTS %(lockts)s, datetime "
+                              "%(dt_string)s has grabbed the lock.",
+                              {'lockts': self.lock_ts,
+                               'dt_string': convert_ts_to_datetime(
+                                   self.lock_ts)})
+                    return True
+
+                if self._is_lease_expired(res.hash, prev_ts):
                     # optimistically update timestamp
-                    if not self._optimistic_update_hash_record(res, new_hash):
-                        # someone else update it before us, return
+                    if not self._update_lock_marker(res):
+                        # someone else updated it before us, retry
                         log_lock_acquisition_failure(prev_ts, self.lock_ts)
-                        eventlet.sleep(retry_sleep_time)
                         continue
-                    # grabbed the lock
                     LOG.debug(
                         "TOPO_SYNC: LockTS %(lock_ts)s, datetime "
                         "%(lock_dt_string)s has forcefully grabbed the lock. "
-                        "PreviousTS %(prev_ts)s, datetime %(prev_dt_string)s "
-                        "was over %(expired_secs)s old.",
+                        "The lease of PreviousTS %(prev_ts)s, datetime "
+                        "%(prev_dt_string)s has expired.",
                         {'lock_ts': self.lock_ts,
                          'lock_dt_string': convert_ts_to_datetime(
                              self.lock_ts),
                          'prev_ts': prev_ts,
                          'prev_dt_string': convert_ts_to_datetime(prev_ts)})
-                    return True
-                else:
-                    if prev_ts == self.lock_ts:
-                        LOG.debug("TOPO_SYNC: LockTS %(lockts)s, datetime "
-                                  "%(dt_string)s has grabbed the lock.",
-                                  {'lockts': self.lock_ts,
-                                   'dt_string': convert_ts_to_datetime(
-                                       self.lock_ts)})
-                        return True
-
-                    if check_ts:
-                        LOG.debug(
-                            "TOPO_SYNC: LockTS %(lock_ts)s, datetime "
-                            "%(lock_dt_string)s giving up since previous lock "
-                            "not expired.",
-                            {'lock_ts': self.lock_ts, 'lock_dt_string':
-                                convert_ts_to_datetime(self.lock_ts)})
-                        return False
+                    return self._lock_acquired()
+
+                if check_ts:
                     LOG.debug(
                         "TOPO_SYNC: LockTS %(lock_ts)s, datetime "
-                        "%(lock_dt_string)s waiting for in progress topo_sync "
-                        "to complete.",
+                        "%(lock_dt_string)s giving up since previous lock "
+                        "not expired.",
                         {'lock_ts': self.lock_ts, 'lock_dt_string':
                             convert_ts_to_datetime(self.lock_ts)})
-                    # this is the only place where we retry while waiting for
-                    # timeout. don't wait indefinitely
-                    self._increment_lock_retry()
-                    eventlet.sleep(retry_sleep_time)
-                    continue
+                    return False
+                LOG.debug(
+                    "TOPO_SYNC: LockTS %(lock_ts)s, datetime "
+                    "%(lock_dt_string)s waiting for in progress topo_sync "
+                    "to complete.",
+                    {'lock_ts': self.lock_ts, 'lock_dt_string':
+                        convert_ts_to_datetime(self.lock_ts)})
+                self._wait_for_unlock(get_lock_lease(res.hash))
+                continue
             else:
                 # nobody has the lock, grab it!
-                if not self._optimistic_update_hash_record(res, new_hash):
-                    # someone else updated it before us, sleep and retry
+                if not self._update_lock_marker(res):
+                    # someone else updated it before us, retry
                     log_lock_acquisition_failure(res.hash, self.lock_ts)
-                    eventlet.sleep(retry_sleep_time)
                     continue
 
-                # finally grabbed the lock
-                LOG.debug(
-                    "TOPO_SYNC: LockTS %(lockts)s, datetime %(dt_string)s has "
-                    "grabbed the lock.",
-                    {'lockts': self.lock_ts,
-                     'dt_string': convert_ts_to_datetime(self.lock_ts)})
                 if check_ts and not self._is_timestamp_expired(
                         expire_secs=TOPO_SYNC_EXPIRED_SECS, prev_ts=res.hash):
                     # replace with old hash, since we already grabbed the lock
@@ -355,16 +417,183 @@ class HashHandler(object):
                         "TOPO_SYNC: Giving up lock since check_ts is True and "
                         "previous timestamp not expired.")
                     self.put_hash(res.hash)
+                    self._notify_unlock()
                     return False
                 # lock grabbed and not returned. return True
-                return True
+                return self._lock_acquired()
+
+    def _lease_marker(self):
+        return 'TOPO_SYNC[%s]LEASE[%.6f]' % (
+            self.lock_ts, time.time() + TOPO_SYNC_LEASE_SECS)
+
+    def _update_lock_marker(self, res):
+        marker = self._lease_marker()
+        if not self._optimistic_update_hash_record(res, marker):
+            return False
+        self.lock_marker = marker
+        return True
+
+    def _is_lease_expired(self, lock_hash, owner_ts):
+        lease = get_lock_lease(lock_hash)
+        if lease is None:
+            # taken by a worker that doesn't renew its lock
+            return self._is_timestamp_expired(
+                expire_secs=TOPO_SYNC_EXPIRED_SECS, prev_ts=owner_ts)
+        return time.time() >= lease
+
+    def _lock_acquired(self):
+        LOG.debug("TOPO_SYNC: LockTS %(lockts)s, datetime %(dt_string)s has "
+                  "grabbed the lock.",
+                  {'lockts': self.lock_ts,
+                   'dt_string': convert_ts_to_datetime(self.lock_ts)})
+        try:
+            self.fencing_token = self._next_fencing_token()
+        except Exception:
+            LOG.exception("TOPO_SYNC: Failed to get a fencing token.")
+            self.fencing_token = None
+        if self._heartbeat is None:
+            self._heartbeat_stop = event.Event()
+            self._heartbeat = eventlet.spawn(self._renew_lease,
+                                             self._heartbeat_stop)
+        return True
+
+    def _renew_lease(self, stop):
+        """Extend the lease of the lock until unlock() sends stop"""
+        while True:
+            with eventlet.Timeout(TOPO_SYNC_LEASE_SECS /
+                                  float(TOPO_SYNC_LEASE_RENEWALS), False):
+                stop.wait()
+            if stop.ready():
+                return
+            marker = self._lease_marker()
+            try:
+                renewed = self._optimistic_update_hash(
+                    self.hash_id, self.lock_marker, marker)
+            except Exception:
+                LOG.exception("TOPO_SYNC: Failed to renew the lease of "
+                              "LockTS %s.", self.lock_ts)
+                continue
+            if not renewed:
+                LOG.warning("TOPO_SYNC: LockTS %s lost the lock, its lease "
+                            "was taken over.", self.lock_ts)
+                return
+            self.lock_marker = marker
+
+    def _wait_for_unlock(self, lease):
+        timeout = TOPO_SYNC_LOCK_POLL_SECS
+        if lease is not None:
+            timeout = max(0, min(timeout, lease - time.time()))
+        if HashHandler._lock_released is None:
+            HashHandler._lock_released = event.Event()
+        released = HashHandler._lock_released
+        with eventlet.Timeout(timeout, False):
+            released.wait()
+
+    @staticmethod
+    def _notify_unlock():
+        released = HashHandler._lock_released
+        HashHandler._lock_released = None
+        if released is not None:
+            released.send()
+
+    def _next_fencing_token(self):
+        """Count a lock acquisition
+
+        :return: the new count. A holder whose lease was taken over has a
+                 lower token than the new holder.
+        """
+        table = ConsistencyHash.__table__
+        engine = get_engine_facade().get_engine()
+        while True:
+            with engine.begin() as conn:
+                res = conn.execute(table.select().where(
+                    table.c.hash_id == TOPO_SYNC_TOKEN_HASH_ID)).first()
+            if not res:
+                try:
+                    with engine.begin() as conn:
+                        conn.execute(table.insert().values(
+                            hash_id=TOPO_SYNC_TOKEN_HASH_ID, hash='1'))
+                    return 1
+                except db_exc.DBDuplicateEntry:
+                    continue
+            token = int(res.hash) + 1
+            if self._optimistic_update_hash(TOPO_SYNC_TOKEN_HASH_ID,
+                                            res.hash, str(token)):
+                return token
+
+    def put_topo_sync_triggers(self, triggers):
+        """Record what requested the TOPO_SYNC being run
+
+        :param triggers: dict {trigger: number of requests merged into it}
+        """
+        table = ConsistencyHash.__table__
+        value = format_topo_sync_triggers(triggers)
+        # only the TOPO_SYNC lock holder writes the record
+        with get_engine_facade().get_engine().begin() as conn:
+            res = conn.execute(table.update().values(hash=value).where(
+                table.c.hash_id == TOPO_SYNC_TRIGGERS_HASH_ID))
+            if not res.rowcount:
+                conn.execute(table.insert().values(
+                    hash_id=TOPO_SYNC_TRIGGERS_HASH_ID, hash=value))
+
+    def get_topo_sync_triggers(self):
+        """Get what requested the last TOPO_SYNC
+
+        :return: dict {trigger: number of requests merged into it}
+        """
+        with self.session.begin(subtransactions=True):
+            res = self.session.query(ConsistencyHash).filter_by(
+                hash_id=TOPO_SYNC_TRIGGERS_HASH_ID).first()
+            return parse_topo_sync_triggers(res.hash) if res else {}
+
+    def get_topo_hashes(self):
+        """Get the hashes of the topology objects last synced to BCF
+
+        :return: dict {(object_type, object_id): hash}
+        """
+        with self.session.begin(subtransactions=True):
+            res = self.session.query(TopoSyncHash).all()
+            return {(r.object_type, r.object_id): r.hash for r in res}
+
+    def update_topo_hashes(self, updated, removed=None, replace=False):
+        """Record the topology objects pushed to BCF
+
+        :param updated: dict {(object_type, object_id): hash} of objects
+                        added or changed by the sync
+        :param removed: iterable of (object_type, object_id) keys removed by
+                        the sync
+        :param replace: if True, drop all existing hashes first, as is the
+                        case after a full topology sync
+        """
+        table = TopoSyncHash.__table__
+        with get_engine_facade().get_engine().begin() as conn:
+            if replace:
+                conn.execute(table.delete())
+            else:
+                stale = {}
+                for object_type, object_id in set(removed or []) | set(
+                        updated):
+                    stale.setdefault(object_type, []).append(object_id)
+                for object_type, object_ids in stale.items():
+                    conn.execute(table.delete().where(
+                        sa.and_(table.c.object_type == object_type,
+                                table.c.object_id.in_(object_ids))))
+            if updated:
+                conn.execute(table.insert(), [
+                    {'object_type': object_type, 'object_id': object_id,
+                     'hash': obj_hash}
+                    for (object_type, object_id), obj_hash
+                    in updated.items()])
+        LOG.debug("TOPO_SYNC: recorded %(updated)d updated and %(removed)d "
+                  "removed topology object hashes.",
+                  {'updated': len(updated), 'removed': len(removed or [])})
 
     def put_hash(self, new_hash):
         query = sa.update(ConsistencyHash.__table__).values(hash=new_hash)
         query = query.where(ConsistencyHash.hash_id == self.hash_id)
 
         try:
-            with self._FACADE.get_engine().begin() as conn:
+            with get_engine_facade().get_engine().begin() as conn:
                 conn.execute(query)
         except db_exc.DBDeadlock:
             LOG.debug("TOPO_SYNC: Failed to update timestamp to previous "
@@ -389,6 +618,12 @@ class HashHandler(object):
         :param set_prev_ts:
         :return:
         """
+        if self._heartbeat is not None:
+            # let a renewal in progress finish, so lock_marker matches the
+            # record and the session isn't left in the middle of an UPDATE
+            self._heartbeat_stop.send()
+            self._heartbeat.wait()
+            self._heartbeat = None
         unlock_ts = self.lock_ts
         if set_prev_ts:
             unlock_ts = self.prev_lock_ts
@@ -408,3 +643,110 @@ class HashHandler(object):
                             res.hash)
                 return
             res.hash = res.hash.replace(self.lock_marker, unlock_ts)
+        # hand the lock to the waiters of this worker right away
+        self._notify_unlock()
+
+
+class TenantCacheHandler(object):
+    """Tenant Cache Handler
+
+    Keystone tenant cache shared by all neutron workers. The time of the
+    last full refresh from keystone is kept in the KEYSTONE_SYNC consistency
+    hash record. Workers race to update it optimistically, only the winner
+    lists the projects from keystone and the others read them from the DB.
+
+    Uses the engine of the HashHandler, independent of the neutron session.
+    """
+
+    def __init__(self):
+        self.engine = get_engine_facade().get_engine()
+
+    def get_tenants(self):
+        """Get the shared tenant cache
+
+        :return: dict {tenant_id: tenant_name}
+        """
+        table = KeystoneTenant.__table__
+        with self.engine.begin() as conn:
+            return {row.tenant_id: row.tenant_name
+                    for row in conn.execute(table.select())}
+
+    def claim_refresh(self, refresh_after):
+        """Elect this worker to refresh the cache from keystone
+
+        :param refresh_after: seconds after the last refresh by any worker
+                              when a new one is due
+        :return: True if this worker should refresh the cache, False if
+                 it is not due or another worker claimed it first
+        """
+        now = time.time()
+        table = ConsistencyHash.__table__
+        with self.engine.begin() as conn:
+            res = conn.execute(table.select().where(
+                table.c.hash_id == KEYSTONE_SYNC_HASH_ID)).first()
+        if not res:
+            try:
+                with self.engine.begin() as conn:
+                    conn.execute(table.insert().values(
+                        hash_id=KEYSTONE_SYNC_HASH_ID, hash=str(now)))
+                return True
+            except db_exc.DBDuplicateEntry:
+                return False
+
+        try:
+            last_refresh = float(res.hash)
+        except ValueError:
+            last_refresh = 0
+        if now - last_refresh < refresh_after:
+            return False
+
+        query = sa.update(table).values(hash=str(now))
+        query = query.where(table.c.hash_id == KEYSTONE_SYNC_HASH_ID)
+        query = query.where(table.c.hash == res.hash)
+        try:
+            with self.engine.begin() as conn:
+                result = conn.execute(query)
+        except db_exc.DBDeadlock:
+            return False
+        return result.rowcount != 0
+
+    def replace_tenants(self, tenants):
+        """Replace the shared cache with a full project list
+
+        Only rows that changed are written.
+
+        :param tenants: dict {tenant_id: tenant_name}
+        """
+        table = KeystoneTenant.__table__
+        with self.engine.begin() as conn:
+            cached = {row.tenant_id: row.tenant_name
+                      for row in conn.execute(table.select())}
+            stale = set(cached) - set(tenants)
+            updated = {tenant_id: tenant_name
+                       for tenant_id, tenant_name in tenants.items()
+                       if cached.get(tenant_id) != tenant_name}
+            stale.update(tenant_id for tenant_id in updated
+                         if tenant_id in cached)
+            if stale:
+                conn.execute(table.delete().where(
+                    table.c.tenant_id.in_(stale)))
+            if updated:
+                conn.execute(table.insert(), [
+                    {'tenant_id': tenant_id, 'tenant_name': tenant_name}
+                    for tenant_id, tenant_name in updated.items()])
+        LOG.debug("Tenant cache: stored %(updated)d updated tenants, removed "
+                  "%(removed)d.",
+                  {'updated': len(updated),
+                   'removed': len(set(cached) - set(tenants))})
+
+    def update_tenant(self, tenant_id, tenant_name):
+        table = KeystoneTenant.__table__
+        with self.engine.begin() as conn:
+            conn.execute(table.delete().where(table.c.tenant_id == tenant_id))
+            conn.execute(table.insert().values(tenant_id=tenant_id,
+                                               tenant_name=tenant_name))
+
+    def remove_tenant(self, tenant_id):
+        table = KeystoneTenant.__table__
+        with self.engine.begin() as conn:
+            conn.execute(table.delete().where(table.c.tenant_id == tenant_id))
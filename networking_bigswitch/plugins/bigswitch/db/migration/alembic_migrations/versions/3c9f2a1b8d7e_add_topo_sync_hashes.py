@@ -0,0 +1,44 @@
+# Copyright 2018, Big Switch Networks
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""add topology sync object hashes
+
+Revision ID: 3c9f2a1b8d7e
+Revises: 938c3e0e2029
+Create Date: 2018-11-20 10:12:31.402117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c9f2a1b8d7e'
+down_revision = '938c3e0e2029'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'bsn_topo_sync_hashes',
+        sa.Column('object_type', sa.String(length=64), nullable=False),
+        sa.Column('object_id', sa.String(length=255), nullable=False),
+        sa.Column('hash', sa.String(length=64), nullable=False),
+        sa.PrimaryKeyConstraint('object_type', 'object_id'))
+
+
+def downgrade():
+    pass
@@ -0,0 +1,43 @@
+# Copyright 2018, Big Switch Networks
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""add shared keystone tenant cache
+
+Revision ID: 5e8a7d2c4b19
+Revises: 3c9f2a1b8d7e
+Create Date: 2018-11-27 15:40:08.216734
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e8a7d2c4b19'
+down_revision = '3c9f2a1b8d7e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'bsn_keystone_tenants',
+        sa.Column('tenant_id', sa.String(length=255), nullable=False),
+        sa.Column('tenant_name', sa.String(length=255), nullable=False),
+        sa.PrimaryKeyConstraint('tenant_id'))
+
+
+def downgrade():
+    pass
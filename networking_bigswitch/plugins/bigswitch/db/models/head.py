@@ -14,6 +14,7 @@
 #    under the License.
 #
 
+from networking_bigswitch.plugins.bigswitch.db import consistency_db  # noqa
 from networking_bigswitch.plugins.bigswitch.db import network_template_db  # noqa
 from networking_bigswitch.plugins.bigswitch.db import reachability_test_db  # noqa
 from networking_bigswitch.plugins.bigswitch.db import tenant_policy_db  # noqa
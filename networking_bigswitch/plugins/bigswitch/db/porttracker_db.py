@@ -18,6 +18,9 @@ from oslo_log import log as logging
 
 LOG = logging.getLogger(__name__)
 
+# keep IN clauses below the bound parameter limits of the DB backends
+HOSTID_QUERY_CHUNK_SIZE = 500
+
 
 def get_port_hostid(context, port_id):
     # REVISIT(kevinbenton): this is a workaround to avoid portbindings_db
@@ -31,6 +34,22 @@ def get_port_hostid(context, port_id):
     return res.host
 
 
+def get_port_hostids(context, port_ids):
+    """Bulk variant of get_port_hostid, returns a {port_id: host} dict."""
+    from neutron.db.models import portbinding
+    hostids = {}
+    port_ids = list(port_ids)
+    with context.session.begin(subtransactions=True):
+        for i in range(0, len(port_ids), HOSTID_QUERY_CHUNK_SIZE):
+            chunk = port_ids[i:i + HOSTID_QUERY_CHUNK_SIZE]
+            query = context.session.query(portbinding.PortBindingPort)
+            query = query.filter(portbinding.PortBindingPort.port_id.in_(
+                chunk))
+            for res in query:
+                hostids[res.port_id] = res.host
+    return hostids
+
+
 def put_port_hostid(context, port_id, host):
     # REVISIT(kevinbenton): this is a workaround to avoid portbindings_db
     # relational table generation until one of the functions is called.
@@ -0,0 +1,183 @@
+# Copyright 2018 Big Switch Networks, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+import collections
+
+import eventlet
+import eventlet.semaphore
+from oslo_log import log as logging
+
+LOG = logging.getLogger(__name__)
+
+
+class DispatchTask(object):
+
+    __slots__ = ('func', 'args', 'coalesce')
+
+    def __init__(self, func, args, coalesce):
+        self.func = func
+        self.args = args
+        self.coalesce = coalesce
+
+
+class DispatchQueue(object):
+    """DispatchQueue
+
+    Runs controller calls in the background of the API request that caused
+    them. Calls are keyed by the object they act on: calls for the same key
+    run one after the other in the order they were dispatched, calls for
+    different keys run concurrently on a bounded pool of greenthreads.
+
+    A call dispatched with a coalesce value replaces a queued call of the
+    same key with the same coalesce value that hasn't started yet, e.g. only
+    the latest of several port updates is sent. Only the calls queued after
+    the last call without a coalesce value are considered, so coalesced
+    calls are never moved across it.
+
+    Once max_pending calls are queued, dispatch() blocks until one of them
+    completes.
+    """
+
+    def __init__(self, pool_size, max_pending):
+        self._pool = eventlet.GreenPool(pool_size)
+        self._max_pending = max_pending
+        self._slots = eventlet.semaphore.Semaphore(max_pending)
+        self._queues = {}
+
+    def dispatch(self, key, func, args=(), coalesce=None):
+        task = DispatchTask(func, args, coalesce)
+        queue = self._queues.get(key)
+        if coalesce is not None and queue:
+            for index in range(len(queue) - 1, -1, -1):
+                queued = queue[index]
+                if queued.coalesce is None:
+                    break
+                if queued.coalesce == coalesce:
+                    LOG.debug("DispatchQueue: coalescing %(coalesce)s for "
+                              "%(key)s", {'coalesce': coalesce, 'key': key})
+                    queue[index] = task
+                    return
+
+        # backpressure, wait for a slot if too many calls are queued
+        self._slots.acquire()
+        queue = self._queues.get(key)
+        if queue is not None:
+            queue.append(task)
+            return
+        self._queues[key] = collections.deque([task])
+        self._pool.spawn_n(self._run, key)
+
+    def _run(self, key):
+        queue = self._queues[key]
+        while queue:
+            task = queue.popleft()
+            try:
+                task.func(*task.args)
+            except Exception:
+                LOG.exception("DispatchQueue: call for %s failed", key)
+            finally:
+                self._slots.release()
+        del self._queues[key]
+
+    def pending(self):
+        """Number of calls that are queued or running"""
+        return self._max_pending - self._slots.balance
+
+    def waitall(self):
+        self._pool.waitall()
+
+
+class Debouncer(object):
+    """Debouncer
+
+    Merges calls for the same key that are made within window seconds of the
+    first one into a single call, made once the window has passed. Only the
+    arguments of the latest call are used, so func should read the current
+    state of the object rather than rely on a snapshot.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self._pending = {}
+
+    def schedule(self, key, func, *args):
+        if key in self._pending:
+            LOG.debug("Debouncer: merging call for %s", key)
+        else:
+            eventlet.spawn_after(self.window, self._fire, key)
+        self._pending[key] = (func, args)
+
+    def _fire(self, key):
+        func, args = self._pending.pop(key)
+        try:
+            func(*args)
+        except Exception:
+            LOG.exception("Debouncer: call for %s failed", key)
+
+
+class MicroBatcher(object):
+    """MicroBatcher
+
+    Gathers the items submitted within window seconds of the first one, or
+    until max_size items are gathered, and hands them to func in a single
+    call. func returns one result per item, in order. The callback given
+    with each item is called with its result, or with the exception raised
+    by func.
+
+    Batches are processed one at a time in the order they were gathered,
+    so items submitted in order are never reordered.
+    """
+
+    def __init__(self, func, window, max_size):
+        self.func = func
+        self.window = window
+        self.max_size = max_size
+        self._batch = []
+        self._timer = None
+        self._lock = eventlet.semaphore.Semaphore()
+
+    def submit(self, item, callback):
+        self._batch.append((item, callback))
+        if len(self._batch) >= self.max_size:
+            eventlet.spawn_n(self._flush, self._take())
+        elif self._timer is None:
+            self._timer = eventlet.spawn_after(self.window, self._expire)
+
+    def _take(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._batch = self._batch, []
+        return batch
+
+    def _expire(self):
+        self._timer = None
+        self._flush(self._take())
+
+    def _flush(self, batch):
+        if not batch:
+            return
+        # the lock hands out turns in the order batches were taken
+        with self._lock:
+            LOG.debug("MicroBatcher: processing batch of %d", len(batch))
+            try:
+                results = self.func([item for item, callback in batch])
+            except Exception as e:
+                LOG.exception("MicroBatcher: batch of %d failed", len(batch))
+                results = [e] * len(batch)
+        for (item, callback), result in zip(batch, results):
+            try:
+                callback(result)
+            except Exception:
+                LOG.exception("MicroBatcher: callback failed")
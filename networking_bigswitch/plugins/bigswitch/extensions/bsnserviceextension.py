@@ -184,7 +184,10 @@ RESOURCE_ATTRIBUTE_MAP = {
                                'is_visible': True},
         'status': {'allow_post': False, 'allow_put': False,
                    'validate': {'type:string': None},
-                   'is_visible': True}
+                   'is_visible': True},
+        'triggers': {'allow_post': False, 'allow_put': False,
+                     'validate': {'type:string': None},
+                     'is_visible': True}
     },
 }
 
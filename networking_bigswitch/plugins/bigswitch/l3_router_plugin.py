@@ -20,7 +20,6 @@ This plugin handles the L3 router calls for Big Switch Floodlight deployments.
 It is intended to be used in conjunction with the Big Switch ML2 driver or the
 Big Switch core plugin.
 """
-import copy
 
 from oslo_log import helpers as log_helper
 from oslo_log import log as logging
@@ -202,8 +201,8 @@ class L3RestProxy(cplugin.NeutronRestProxyV2Base,
                 if ext_net_id and (not ext_tenant_id):
                     ext_net = self.get_network(context, ext_net_id)
                     if ext_net:
-                        mapped_router['external_gateway_info']['tenant_id'] = (
-                            ext_net.get('tenant_id'))
+                        mapped_router['external_gateway_info'] = dict(
+                            ext_gw_info, tenant_id=ext_net.get('tenant_id'))
             # update router that was created in before_create callback
             self.servers.rest_update_router(
                 mapped_router['tenant_id'], mapped_router, mapped_router['id'])
@@ -428,7 +427,7 @@ class L3RestProxy(cplugin.NeutronRestProxyV2Base,
             # create floatingip on the network controller
             try:
                 if 'floatingip' in self.servers.get_capabilities():
-                    backend_fip = copy.deepcopy(new_fl_ip)
+                    backend_fip = dict(new_fl_ip)
                     fport = self.get_port(context.elevated(),
                                           backend_fip['floating_port_id'])
                     backend_fip['floating_mac_address']\
@@ -489,9 +488,30 @@ class L3RestProxy(cplugin.NeutronRestProxyV2Base,
     @add_debug_log
     @log_helper.log_method_call
     def disassociate_floatingips(self, context, port_id, do_notify=True):
+        if 'floatingip' not in self.servers.get_capabilities():
+            router_ids = super(L3RestProxy, self).disassociate_floatingips(
+                context, port_id, do_notify=do_notify)
+            self._send_floatingip_update(context)
+            return router_ids
+
+        admin_context = context.elevated()
+        fip_ids = [fip['id'] for fip in self.get_floatingips(
+            admin_context, filters={'port_id': [port_id]}, fields=['id'])]
         router_ids = super(L3RestProxy, self).disassociate_floatingips(
             context, port_id, do_notify=do_notify)
-        self._send_floatingip_update(context)
+        if not fip_ids:
+            return router_ids
+
+        # only update the floating ips that were disassociated instead of
+        # sending the whole external network
+        fips = self.get_floatingips(admin_context, filters={'id': fip_ids})
+        fports = self._get_floatingip_ports(admin_context, fips)
+        for fip in fips:
+            fport = fports.get(fip.get('floating_port_id'))
+            if fport:
+                fip['floating_mac_address'] = fport.get('mac_address')
+            self.servers.rest_update_floatingip(fip['tenant_id'], fip,
+                                                fip['id'])
         return router_ids
 
     def _update_ext_gateway_info(self, context, updated_router):
@@ -508,21 +528,18 @@ class L3RestProxy(cplugin.NeutronRestProxyV2Base,
         # look up the network on this side to save an expensive query on
         # the backend controller.
         if router and router.get('external_gateway_info'):
-            router['external_gateway_info']['network'] = self.get_network(
-                context.elevated(),
-                router['external_gateway_info']['network_id'])
+            ext_gw_info = router['external_gateway_info']
+            router['external_gateway_info'] = dict(
+                ext_gw_info, network=self.get_network(
+                    context.elevated(), ext_gw_info['network_id']))
         return router
 
     def _send_floatingip_update(self, context):
         try:
             ext_net_id = self.get_external_network_id(context)
             if ext_net_id:
-                # Use the elevated state of the context for the ext_net query
-                admin_context = context.elevated()
-                ext_net = super(L3RestProxy,
-                                self).get_network(admin_context, ext_net_id)
                 # update external network on network controller
-                self._send_update_network(ext_net, admin_context)
+                self._schedule_network_update(ext_net_id, context)
         except exceptions.TooManyExternalNetworks:
             # get_external_network can raise errors when multiple external
             # networks are detected, which isn't supported by the Plugin
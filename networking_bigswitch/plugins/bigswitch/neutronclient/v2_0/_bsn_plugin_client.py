@@ -539,4 +539,5 @@ class ForceSyncTopologiesList(extension.ClientExtensionList,
     """Show the status of last scheduled Topology Sync to BCF."""
 
     shell_command = 'bcf-sync-status'
-    list_columns = ['id', 'timestamp_ms', 'timestamp_datetime', 'status']
+    list_columns = ['id', 'timestamp_ms', 'timestamp_datetime', 'status',
+                    'triggers']
@@ -40,17 +40,19 @@ subset) with some additional parameters (gateway on network-create and macaddr
 on port-attach) on an additional PUT to do a bulk dump of all persistent data.
 """
 
-import copy
 import functools
 import httplib
 import re
 
 import eventlet
+from eventlet import event
+from oslo_concurrency import lockutils
 from oslo_config import cfg
 from oslo_log import log as logging
 import oslo_messaging
 from oslo_utils import importutils
-from sqlalchemy.orm import exc as sqlexc
+from oslo_utils import timeutils
+import sqlalchemy as sa
 
 from neutron.agent import rpc as agent_rpc
 from neutron.agent import securitygroups_rpc as sg_rpc
@@ -69,6 +71,7 @@ from neutron.db import l3_db
 from neutron.db.models import securitygroup as sg_db
 from neutron.db import models_v2
 from neutron.db import securitygroups_rpc_base as sg_db_rpc
+from neutron.db import standard_attr
 
 from neutron_lib.agent import topics
 from neutron_lib.api.definitions import allowedaddresspairs as addr_pair
@@ -83,15 +86,17 @@ from neutron_lib import exceptions as lib_exceptions
 from neutron_lib.plugins import constants as plugin_constants
 from neutron_lib.plugins import directory
 from neutron_lib import rpc as n_rpc
-from neutron_lib.utils import runtime
 
 from networking_bigswitch.plugins.bigswitch import config as pl_config
 from networking_bigswitch.plugins.bigswitch import constants as bsn_constants
+from networking_bigswitch.plugins.bigswitch import dispatcher
 from networking_bigswitch.plugins.bigswitch.db import porttracker_db
+from networking_bigswitch.plugins.bigswitch.db import tenant_policy_db
 from networking_bigswitch.plugins.bigswitch import extensions
 from networking_bigswitch.plugins.bigswitch.i18n import _
 from networking_bigswitch.plugins.bigswitch.i18n import _LW
 from networking_bigswitch.plugins.bigswitch import servermanager
+from networking_bigswitch.plugins.bigswitch import topology
 from networking_bigswitch.plugins.bigswitch.utils import Util
 from networking_bigswitch.plugins.bigswitch import version
 
@@ -99,6 +104,12 @@ LOG = logging.getLogger(__name__)
 
 SYNTAX_ERROR_MESSAGE = _('Syntax error in server config file, aborting plugin')
 METADATA_SERVER_IP = '169.254.169.254'
+# status changes and deletes of a port are serialized by this lock
+PORT_BARRIER_LOCK = 'bsn-port-barrier-%s'
+# maximum number of port status changes written together
+PORT_STATUS_BATCH_SIZE = 500
+# sections of the topology collected concurrently
+TOPO_SECTION_POOL_SIZE = 3
 
 
 class AgentNotifierApi(securitygroups_rpc.SecurityGroupAgentRpcApiMixin):
@@ -160,6 +171,9 @@ class NeutronRestProxyV2Base(db_base_plugin_v2.NeutronDbPluginV2,
 
     supported_extension_aliases = ["binding"]
     servers = None
+    # shared by the core/ML2 and L3 plugins of a worker
+    _network_update_debouncer = None
+    _port_status_batcher = None
 
     def __init__(self):
         super(NeutronRestProxyV2Base, self).__init__()
@@ -234,26 +248,109 @@ class NeutronRestProxyV2Base(db_base_plugin_v2.NeutronDbPluginV2,
             get_routers=self.l3_bsn_plugin,
             get_sgs=True)
 
+    def _get_topology_revision(self):
+        """Revision of the state a topology sync is built from
+
+        Neutron bumps the revision number of a resource whenever it or an
+        object related to it changes, and standard attribute ids only grow,
+        so any create, update or delete of a resource changes the revision.
+        Tenant policies have no standard attributes and are few, they are
+        read in full. Tenant names come from the keystone cache.
+        """
+        admin_context = qcontext.get_admin_context()
+        attrs = standard_attr.StandardAttribute
+        with db_api.CONTEXT_READER.using(admin_context):
+            resources = admin_context.session.query(
+                sa.func.count(attrs.id), sa.func.max(attrs.id),
+                sa.func.sum(attrs.revision_number)).one()
+            policies = [
+                sorted(list(row) for row in admin_context.session.execute(
+                    model.__table__.select()))
+                for model in (tenant_policy_db.TenantPolicy,
+                              tenant_policy_db.TenantPolicyNextHop)]
+        return servermanager.hash_topology_object(
+            [list(resources), policies, self.servers.keystone_tenants,
+             self.servers.is_unicode_enabled()])
+
     def _get_all_data(self, get_ports=True, get_floating_ips=True,
-                      get_routers=True, get_sgs=True):
+                      get_routers=True, get_sgs=True, tenant_id=None):
+        """Collect the topology to sync to the controller
+
+        The network, router and security group sections are collected
+        concurrently, each in its own greenthread with its own DB session,
+        and share the resources loaded by the TopologyCollector.
+
+        :param tenant_id: collect only the resources of this tenant
+        """
         # sync tenant cache with keystone
         if not self.servers._update_tenant_cache(reconcile=False):
             return None
 
-        admin_context = qcontext.get_admin_context()
-        networks = []
+        tenant_filters = {'tenant_id': [tenant_id]} if tenant_id else None
         # this method is used by the ML2 driver so it can't directly invoke
         # the self.get_(ports|networks) methods
         plugin = directory.get_plugin()
-        all_networks = plugin.get_networks(admin_context) or []
-        for net in all_networks:
+        # every resource type is fetched once and joined in memory, instead
+        # of querying subnets/ports/floating ips per network and router
+        collector = topology.TopologyCollector(plugin, self.l3_plugin,
+                                               tenant_id=tenant_id)
+        pool = eventlet.GreenPool(TOPO_SECTION_POOL_SIZE)
+        section = self.servers.topo_sync_section
+        sections = [('networks', pool.spawn(
+            section(self._get_networks_section), collector, get_ports,
+            get_floating_ips))]
+        if get_routers and self.l3_plugin:
+            sections.append(('routers', pool.spawn(
+                section(self._get_routers_section), collector,
+                tenant_filters)))
+        if (get_sgs and self.l3_plugin and
+                cfg.CONF.RESTPROXY.sync_security_groups):
+            sections.append(('security-groups', pool.spawn(
+                section(self._get_security_groups_section), plugin,
+                tenant_filters)))
+        data = dict((section, thread.wait()) for section, thread in sections)
+
+        all_tenants_map = self.servers.keystone_tenants
+        if tenant_id:
+            all_tenants_map = dict(
+                (tenant, name) for tenant, name in all_tenants_map.items()
+                if tenant == tenant_id)
+
+        if self.servers.is_unicode_enabled():
+            # display-name is only supported as list for topology in NSAPI
+            tenants = []
+            for tenant, tenant_name in all_tenants_map.items():
+                tenants.append({
+                    'name': tenant,
+                    'id': tenant,
+                    'display-name': tenant_name
+                })
+        else:
+            # dict for tenant works in topology sync only if display-name is
+            # not enabled
+            tenants = {}
+            for tenant in all_tenants_map:
+                if not self._validate_names(None,
+                                            name=all_tenants_map[tenant]):
+                    continue
+                tenants[tenant] = all_tenants_map[tenant]
+
+        data['tenants'] = tenants
+        return data
+
+    def _get_networks_section(self, collector, get_ports=True,
+                              get_floating_ips=True):
+        networks = []
+        for net in collector.get_networks():
             try:
                 if self._skip_bcf_network_event(net):
                     LOG.info('Skipping segment create for Network: %(n)s',
                              {'n': net.get('name')})
                     continue
 
-                mapped_network = self._get_mapped_network_with_subnets(net)
+                # copy, ports and floating ips are added to it
+                mapped_network = dict(self._get_collected_mapped_network(
+                    collector, net))
                 if not self._validate_names(mapped_network):
                     continue
                 # validate names for subnet as well
@@ -266,15 +363,14 @@ class NeutronRestProxyV2Base(db_base_plugin_v2.NeutronDbPluginV2,
                     mapped_network['subnets'] = new_subnets
 
                 flips_n_ports = mapped_network
-                if get_floating_ips:
-                    flips_n_ports = self._get_network_with_floatingips(
-                        mapped_network)
+                if get_floating_ips and self.l3_plugin:
+                    flips_n_ports['floatingips'] = self._map_floatingips(
+                        collector.get_floatingips_for_network(net['id']),
+                        collector.get_port)
 
                 if get_ports:
                     ports = []
-                    net_filter = {'network_id': [net.get('id')]}
-                    net_ports = plugin.get_ports(admin_context,
-                                                 filters=net_filter) or []
+                    net_ports = collector.get_ports_for_network(net['id'])
                     for port in net_ports:
                         if not self._is_port_supported(port):
                             continue
@@ -308,134 +404,128 @@ class NeutronRestProxyV2Base(db_base_plugin_v2.NeutronDbPluginV2,
                 # if tenant name is not known to keystone, skip the network
                 continue
 
-        data = {'networks': networks}
-
-        if get_routers and self.l3_plugin:
-            routers = []
-            all_routers = self.l3_plugin.get_routers(admin_context) or []
-            all_policies = (self.bsn_service_plugin
-                            .get_tenantpolicies(admin_context)
-                            if self.bsn_service_plugin else [])
-            tenant_policies = {}
-            for policy in all_policies:
-                if policy['tenant_id'] not in tenant_policies:
-                    tenant_policies[policy['tenant_id']] = []
-                policy['ipproto'] = policy['protocol']
-                tenant_policies[policy['tenant_id']].append(policy)
-            for router in all_routers:
-                try:
-                    # Add tenant_id of the external gateway network
-                    if router.get(l3_apidef.EXTERNAL_GW_INFO):
-                        ext_net_id = router[l3_apidef.EXTERNAL_GW_INFO].get(
-                            'network_id')
-                        ext_net = self.get_network(admin_context, ext_net_id)
-                        ext_tenant_id = ext_net.get('tenant_id')
-                        if ext_tenant_id:
-                            router[l3_apidef.EXTERNAL_GW_INFO]['tenant_id'] = (
-                                ext_tenant_id)
-
-                    interfaces = []
-                    mapped_router = self._map_display_name_or_tenant(router)
-                    mapped_router = self._map_state_and_status(mapped_router)
-                    if not self._validate_names(mapped_router):
-                        continue
-
-                    router_filter = {
-                        'device_owner': [const.DEVICE_OWNER_ROUTER_INTF],
-                        'device_id': [router.get('id')]
-                    }
-                    router_ports = self.get_ports(admin_context,
-                                                  filters=router_filter) or []
-                    for port in router_ports:
-                        subnet_id = port['fixed_ips'][0]['subnet_id']
-                        intf_details = self._get_router_intf_details(
-                            admin_context, port, subnet_id)
-
-                        interfaces.append(intf_details)
+        return networks
 
-                    mapped_router['interfaces'] = interfaces
-
-                    routers.append(mapped_router)
-                except servermanager.TenantIDNotFound:
-                    # if tenant name is not known to keystone, skip the network
+    def _get_routers_section(self, collector, tenant_filters=None):
+        admin_context = qcontext.get_admin_context()
+        routers = []
+        all_routers = self.l3_plugin.get_routers(
+            admin_context, filters=tenant_filters) or []
+        all_policies = (self.bsn_service_plugin
+                        .get_tenantpolicies(admin_context,
+                                            filters=tenant_filters)
+                        if self.bsn_service_plugin else [])
+        tenant_policies = {}
+        for policy in all_policies:
+            if policy['tenant_id'] not in tenant_policies:
+                tenant_policies[policy['tenant_id']] = []
+            policy['ipproto'] = policy['protocol']
+            tenant_policies[policy['tenant_id']].append(policy)
+        for router in all_routers:
+            try:
+                # Add tenant_id of the external gateway network
+                if router.get(l3_apidef.EXTERNAL_GW_INFO):
+                    ext_net_id = router[l3_apidef.EXTERNAL_GW_INFO].get(
+                        'network_id')
+                    ext_net = collector.get_network(ext_net_id) or {}
+                    ext_tenant_id = ext_net.get('tenant_id')
+                    if ext_tenant_id:
+                        router[l3_apidef.EXTERNAL_GW_INFO]['tenant_id'] = (
+                            ext_tenant_id)
+
+                interfaces = []
+                mapped_router = self._map_display_name_or_tenant(router)
+                mapped_router = self._map_state_and_status(mapped_router)
+                if not self._validate_names(mapped_router):
                     continue
 
-            # append router_tenant_rules to each router
-            for router in routers:
-                if router['tenant_id'] in tenant_policies:
-                    router['policies'] = tenant_policies[router['tenant_id']]
-
-            data.update({'routers': routers})
+                router_ports = collector.get_router_interface_ports(
+                    router.get('id'))
+                for port in router_ports:
+                    subnet_id = port['fixed_ips'][0]['subnet_id']
+                    subnet = collector.get_subnet(subnet_id)
+                    if not subnet:
+                        # subnet deleted since the ports were fetched
+                        continue
+                    network = collector.get_network(subnet['network_id'])
+                    if not network:
+                        # network deleted since the subnets were fetched
+                        continue
+                    mapped_network = self._get_collected_mapped_network(
+                        collector, network)
+                    intf_details = self._make_router_intf_details(
+                        port, subnet, mapped_network,
+                        self._get_collected_mapped_subnet(collector, subnet))
 
-            # L3 plugin also includes tenant policies
-            # data.update({'policies': tenant_policies})
+                    interfaces.append(intf_details)
 
-        if (get_sgs and self.l3_plugin and
-                cfg.CONF.RESTPROXY.sync_security_groups):
-            sgs = plugin.get_security_groups(admin_context) or []
-            new_sgs = []
-            for sg in sgs:
-                try:
-                    mapped_sg = self._map_display_name_or_tenant(sg)
-                    if not self._validate_names(mapped_sg):
-                        continue
-                    if 'description' in mapped_sg:
-                        mapped_sg['description'] = ''
-                    if self.servers.is_unicode_enabled():
-                        mapped_sg['name'] = None
-                    else:
-                        mapped_sg['name'] = Util.format_resource_name(
-                            mapped_sg['name'])
-                    new_sgs.append(mapped_sg)
-                except servermanager.TenantIDNotFound:
-                    # if tenant name is not known to keystone, skip the sg
-                    continue
+                mapped_router['interfaces'] = interfaces
 
-            data.update({'security-groups': new_sgs})
+                routers.append(mapped_router)
+            except servermanager.TenantIDNotFound:
+                # if tenant name is not known to keystone, skip the network
+                continue
 
-        all_tenants_map = self.servers.keystone_tenants
+        # append router_tenant_rules to each router
+        for router in routers:
+            if router['tenant_id'] in tenant_policies:
+                router['policies'] = tenant_policies[router['tenant_id']]
+        return routers
 
-        if self.servers.is_unicode_enabled():
-            # display-name is only supported as list for topology in NSAPI
-            tenants = []
-            for tenant_id, tenant_name in all_tenants_map.items():
-                tenants.append({
-                    'name': tenant_id,
-                    'id': tenant_id,
-                    'display-name': tenant_name
-                })
-        else:
-            # dict for tenant works in topology sync only if display-name is
-            # not enabled
-            tenants = {}
-            for tenant in all_tenants_map:
-                if not self._validate_names(None,
-                                            name=all_tenants_map[tenant]):
+    def _get_security_groups_section(self, plugin, tenant_filters=None):
+        admin_context = qcontext.get_admin_context()
+        sgs = plugin.get_security_groups(admin_context,
+                                         filters=tenant_filters) or []
+        new_sgs = []
+        for sg in sgs:
+            try:
+                mapped_sg = self._map_display_name_or_tenant(sg)
+                if not self._validate_names(mapped_sg):
                     continue
-                tenants[tenant] = all_tenants_map[tenant]
+                if 'description' in mapped_sg:
+                    mapped_sg['description'] = ''
+                if self.servers.is_unicode_enabled():
+                    mapped_sg['name'] = None
+                else:
+                    mapped_sg['name'] = Util.format_resource_name(
+                        mapped_sg['name'])
+                new_sgs.append(mapped_sg)
+            except servermanager.TenantIDNotFound:
+                # if tenant name is not known to keystone, skip the sg
+                continue
 
-        data['tenants'] = tenants
-        return data
+        return new_sgs
 
-    def _send_all_data_auto(self, timeout=None, triggered_by_tenant=None):
+    def _send_all_data_auto(self, timeout=None, triggered_by_tenant=None,
+                            trigger=servermanager.TOPO_SYNC_TRIGGER_OTHER):
         return self._send_all_data(
             send_floating_ips=self.l3_bsn_plugin,
             send_routers=self.l3_bsn_plugin,
             timeout=timeout,
-            triggered_by_tenant=triggered_by_tenant)
+            triggered_by_tenant=triggered_by_tenant,
+            trigger=trigger)
 
     def _send_all_data(self, send_ports=True, send_floating_ips=True,
                        send_routers=True, send_sgs=True, timeout=None,
-                       triggered_by_tenant=None):
+                       triggered_by_tenant=None,
+                       trigger=servermanager.TOPO_SYNC_TRIGGER_OTHER):
         """Pushes all data to network ctrl (networks/ports, ports/attachments).
 
         This gives the controller an option to re-sync it's persistent store
         with neutron's current view of that data.
 
-        All args are ignored. The `_get_all_data` method dynamically pulls the
-        relevant information i.e. if its L2 only or L2+L3.
+        If triggered_by_tenant is given, only the data of that tenant is
+        pushed if the controller supports it, see force_tenant_sync. trigger
+        tells what requested the sync. The other args are ignored, the
+        `_get_all_data` method dynamically pulls the relevant information
+        i.e. if its L2 only or L2+L3.
         """
-        sync_executed, topo_resp = self.servers.force_topo_sync()
+        if triggered_by_tenant:
+            sync_executed, topo_resp = self.servers.force_tenant_sync(
+                triggered_by_tenant, trigger=trigger)
+        else:
+            sync_executed, topo_resp = self.servers.force_topo_sync(
+                trigger=trigger)
         return topo_resp
 
     def _assign_resource_to_service_tenant(self, resource):
@@ -456,29 +546,53 @@ class NeutronRestProxyV2Base(db_base_plugin_v2.NeutronDbPluginV2,
         if self.l3_plugin:
             fl_ips = self.l3_plugin.get_floatingips(context,
                                                     filters=net_filter) or []
-            floating_ips = []
-            for flip in fl_ips:
-                try:
-                    # BVS-7525: the 'tenant_id' in a floating-ip represents the
-                    # tenant to which it is allocated.
-                    # Validate that the tenant exists
-                    # name/display-name of floating ip is not actually
-                    # used on bcf
-                    mapped_flip = self._map_display_name_or_tenant(flip)
-                    if mapped_flip.get('floating_port_id'):
-                        fport = self.get_port(context,
-                                              mapped_flip['floating_port_id'])
-                        mapped_flip['floating_mac_address'] = \
-                            fport.get('mac_address')
-                    floating_ips.append(mapped_flip)
-                except servermanager.TenantIDNotFound:
-                    # if tenant name is not known to keystone, skip it
-                    continue
-
+            fports = self._get_floatingip_ports(context, fl_ips)
+            floating_ips = self._map_floatingips(fl_ips, fports.get)
             network['floatingips'] = floating_ips
 
         return network
 
+    def _get_floatingip_ports(self, context, floatingips):
+        """Look up the floating ports of floatingips in a single query
+
+        :return: dict of port id to port
+        """
+        port_ids = [flip['floating_port_id'] for flip in floatingips
+                    if flip.get('floating_port_id')]
+        if not port_ids:
+            return {}
+        fports = self.get_ports(context, filters={'id': port_ids}) or []
+        return dict((fport['id'], fport) for fport in fports)
+
+    def _map_floatingips(self, floatingips, get_port):
+        """Map floating ips for the controller
+
+        :param floatingips: floating ip dicts of a single network
+        :param get_port: callable returning the port dict for a port id
+        :return: list of mapped floating ips, those of unknown tenants are
+                 skipped
+        """
+        mapped_flips = []
+        for flip in floatingips:
+            try:
+                # BVS-7525: the 'tenant_id' in a floating-ip represents the
+                # tenant to which it is allocated.
+                # Validate that the tenant exists
+                # name/display-name of floating ip is not actually
+                # used on bcf
+                mapped_flip = self._map_display_name_or_tenant(flip)
+                if mapped_flip.get('floating_port_id'):
+                    fport = get_port(mapped_flip['floating_port_id'])
+                    if fport:
+                        mapped_flip['floating_mac_address'] = \
+                            fport.get('mac_address')
+                mapped_flips.append(mapped_flip)
+            except servermanager.TenantIDNotFound:
+                # if tenant name is not known to keystone, skip it
+                continue
+
+        return mapped_flips
+
     def _get_all_subnets_json_for_network(self, net_id, context=None):
         if context is None:
             context = qcontext.get_admin_context()
@@ -490,24 +604,23 @@ class NeutronRestProxyV2Base(db_base_plugin_v2.NeutronDbPluginV2,
         if subnets:
             for subnet in subnets:
                 subnet_dict = self._make_subnet_dict(subnet, context=context)
-                mapped_subnet = self._map_display_name_or_tenant(subnet_dict)
-                mapped_subnet = self._map_state_and_status(mapped_subnet)
-                subnets_details.append(mapped_subnet)
+                subnets_details.append(self._map_subnet(subnet_dict))
 
         return subnets_details
 
+    def _map_subnet(self, subnet):
+        mapped_subnet = self._map_display_name_or_tenant(subnet)
+        return self._map_state_and_status(mapped_subnet)
+
     def _tenant_check_for_security_group(self, sg):
         """Router VRRP creates a hidden network for router heart-beats.
 
         This network is not associated with any tenant
         """
         sg['tenant_id'] = sg['tenant_id'] or servermanager.SERVICE_TENANT
+        self.servers._ensure_tenant_cache(sg['tenant_id'])
         tenant_name = self.servers.keystone_tenants.get(sg['tenant_id'])
 
-        if not tenant_name:
-            self.servers._update_tenant_cache(reconcile=True)
-            tenant_name = self.servers.keystone_tenants.get(sg['tenant_id'])
-
         if not self.servers.is_unicode_enabled():
             sg['tenant_name'] = tenant_name
         return tenant_name
@@ -558,9 +671,49 @@ class NeutronRestProxyV2Base(db_base_plugin_v2.NeutronDbPluginV2,
         if context is None:
             context = qcontext.get_admin_context()
         network = self._map_display_name_or_tenant(network)
-        network = self._map_state_and_status(network)
         subnets = self._get_all_subnets_json_for_network(network['id'],
                                                          context)
+        is_external = self._network_is_external(context, network['id'])
+        return self._map_network_with_subnets(network, subnets, is_external)
+
+    def _get_collected_mapped_network(self, collector, network):
+        """Map a network using the indexes of a TopologyCollector
+
+        Same result as _get_mapped_network_with_subnets, without issuing
+        per-network subnet and external network queries. Each network is
+        mapped once per collector, e.g. a shared network attached to many
+        routers, so the result is shared and must be copied before it is
+        modified.
+        """
+        return collector.memoize(
+            'mapped-networks', network['id'],
+            lambda: self._map_collected_network(collector, network))
+
+    def _map_collected_network(self, collector, network):
+        network = self._map_display_name_or_tenant(network)
+        # copies, _map_network_with_subnets removes their names
+        subnets = [dict(self._get_collected_mapped_subnet(collector, subnet))
+                   for subnet in
+                   collector.get_subnets_for_network(network['id'])]
+        is_external = collector.is_external(network['id'])
+        return self._map_network_with_subnets(network, subnets, is_external)
+
+    def _get_collected_mapped_subnet(self, collector, subnet):
+        """Map a subnet once per TopologyCollector, see _map_subnet
+
+        The result is shared and must be copied before it is modified.
+        """
+        return collector.memoize('mapped-subnets', subnet['id'],
+                                 lambda: self._map_subnet(subnet))
+
+    def _map_network_with_subnets(self, network, subnets, is_external):
+        """Build the controller representation of a network
+
+        :param network: network already mapped by _map_display_name_or_tenant
+        :param subnets: list of mapped subnets of the network
+        :param is_external: whether the network is an external network
+        """
+        network = self._map_state_and_status(network)
         network['subnets'] = subnets
         for subnet in (subnets or []):
             if subnet['gateway_ip']:
@@ -569,8 +722,7 @@ class NeutronRestProxyV2Base(db_base_plugin_v2.NeutronDbPluginV2,
                 break
         else:
             network['gateway'] = ''
-        network[extnet_apidef.EXTERNAL] = self._network_is_external(
-            context, network['id'])
+        network[extnet_apidef.EXTERNAL] = is_external
         # include ML2 segmentation types
         network['segmentation_types'] = getattr(self, "segmentation_types", "")
         # OSP-45: remove name to avoid NSAPI error in convertToAscii
@@ -633,8 +785,13 @@ class NeutronRestProxyV2Base(db_base_plugin_v2.NeutronDbPluginV2,
         # display-name is also mapped here
         mapped_network = self._get_mapped_network_with_subnets(network,
                                                                context)
-        net_fl_ips = self._get_network_with_floatingips(mapped_network,
-                                                        context)
+        if 'floatingip' in self.servers.get_capabilities():
+            # the controller manages floating ips individually, don't
+            # resend all floating ips of the network with every update
+            net_fl_ips = mapped_network
+        else:
+            net_fl_ips = self._get_network_with_floatingips(mapped_network,
+                                                            context)
         if not tenant_id:
             tenant_id = servermanager.SERVICE_TENANT
             net_fl_ips['tenant_id'] = servermanager.SERVICE_TENANT
@@ -643,6 +800,35 @@ class NeutronRestProxyV2Base(db_base_plugin_v2.NeutronDbPluginV2,
                     net_fl_ips['name'])
         self.servers.rest_update_network(tenant_id, net_id, net_fl_ips)
 
+    def _send_update_network_by_id(self, net_id, context=None):
+        admin_context = (context.elevated() if context
+                         else qcontext.get_admin_context())
+        try:
+            network = directory.get_plugin().get_network(admin_context,
+                                                         net_id)
+        except lib_exceptions.NetworkNotFound:
+            LOG.debug("Network %s was deleted, skipping update.", net_id)
+            return
+        self._send_update_network(network, admin_context)
+
+    def _schedule_network_update(self, net_id, context=None):
+        """Send a network to the controller after its subnets or FIPs changed
+
+        If network_update_debounce is set, updates of the same network are
+        merged and sent after the debounce window, read from the DB at that
+        time. Otherwise the network is sent right away, read with the given
+        context so it includes changes of an ongoing transaction.
+        """
+        window = cfg.CONF.RESTPROXY.network_update_debounce
+        if window <= 0:
+            self._send_update_network_by_id(net_id, context)
+            return
+        if NeutronRestProxyV2Base._network_update_debouncer is None:
+            NeutronRestProxyV2Base._network_update_debouncer = (
+                dispatcher.Debouncer(window))
+        NeutronRestProxyV2Base._network_update_debouncer.schedule(
+            net_id, self._send_update_network_by_id, net_id)
+
     def _send_delete_network(self, network, context=None):
         net_id = network['id']
         tenant_id = network['tenant_id'] or servermanager.SERVICE_TENANT
@@ -654,20 +840,20 @@ class NeutronRestProxyV2Base(db_base_plugin_v2.NeutronDbPluginV2,
         None-unicode mode uses tenant_name
         Unicode mode uses tenant_id and display-name
 
+        The mappers in this class return shallow copies: resource itself is
+        not modified, but nested values are shared with it and have to be
+        copied before they are modified.
+
         :param resource: object to be mapped
         :return: mapped object copy
         """
-        resource = copy.deepcopy(resource)
+        resource = dict(resource)
         self._assign_resource_to_service_tenant(resource)
 
+        self.servers._ensure_tenant_cache(resource['tenant_id'])
         tenant_name = self.servers.keystone_tenants.get(resource['tenant_id'])
         if not tenant_name:
-            self.servers._update_tenant_cache()
-            tenant_name = self.servers.keystone_tenants.get(
-                resource['tenant_id'])
-            if not tenant_name:
-                raise servermanager.TenantIDNotFound(
-                    tenant=resource['tenant_id'])
+            raise servermanager.TenantIDNotFound(tenant=resource['tenant_id'])
 
         if self.servers.is_unicode_enabled():
             if resource.get('name'):
@@ -680,12 +866,12 @@ class NeutronRestProxyV2Base(db_base_plugin_v2.NeutronDbPluginV2,
         return resource
 
     def _map_state_and_status(self, resource):
-        resource = copy.copy(resource)
-        resource['state'] = ('UP' if resource.pop('admin_state_up',
-                                                  True) else 'DOWN')
-        resource.pop('status', None)
+        mapped = {key: value for key, value in resource.items()
+                  if key not in ('admin_state_up', 'status')}
+        mapped['state'] = ('UP' if resource.get('admin_state_up', True)
+                           else 'DOWN')
 
-        return resource
+        return mapped
 
     def _is_port_supported(self, port):
         """Check if the vnic-type is supported
@@ -798,40 +984,42 @@ class NeutronRestProxyV2Base(db_base_plugin_v2.NeutronDbPluginV2,
         """Update the HOST_ID of a given port based on it's type.
 
         Perform basic sanity checks and update the HOST_ID of the port
-        :return: port, if port is of relevance to BCF
+        :return: port, if port is of relevance to BCF. A copy if the HOST_ID
+                 was updated
                  False, otherwise
         """
-        prepped_port = copy.copy(port)
-        if (portbindings.HOST_ID not in prepped_port or
-                prepped_port[portbindings.HOST_ID] == ''):
+        if (portbindings.HOST_ID not in port or
+                port[portbindings.HOST_ID] == ''):
             LOG.debug("Ignoring port notification to controller because of "
                       "missing host ID.")
             return False
 
         # Update HOST_ID (to be used by BCF).
         # - For SR-IOV it is a function of HostID & physnet info
-        if self._is_port_sriov(prepped_port):
-            vif_type = prepped_port.get(portbindings.VIF_TYPE)
+        if self._is_port_sriov(port):
+            vif_type = port.get(portbindings.VIF_TYPE)
             if not vif_type or vif_type == portbindings.VIF_TYPE_UNBOUND:
                 # Port not bound yet, nothing to do
                 return False
 
-            hostid = self._get_sriov_port_hostid(prepped_port, network)
+            hostid = self._get_sriov_port_hostid(port, network)
             if not hostid:
                 return False
-            prepped_port[portbindings.HOST_ID] = hostid
+            port = dict(port)
+            port[portbindings.HOST_ID] = hostid
 
         # update HOST_ID to '<host-id>_<bridge-name>' for ports with
         # VIF_TYPE OVS and VHOSTUSER i.e. DHCP and DPDK ports
         # if bridge_name not available, sets it to just 'host-id'
-        vif_type = prepped_port.get(portbindings.VIF_TYPE)
+        vif_type = port.get(portbindings.VIF_TYPE)
         if (vif_type and
                 (vif_type == portbindings.VIF_TYPE_OVS or
                  vif_type == portbindings.VIF_TYPE_VHOST_USER)):
-            prepped_port[portbindings.HOST_ID] = (
-                self._get_ovs_dpdk_port_hostid(prepped_port, network))
+            port = dict(port)
+            port[portbindings.HOST_ID] = (
+                self._get_ovs_dpdk_port_hostid(port, network))
 
-        return prepped_port
+        return port
 
     def _warn_on_state_status(self, resource):
         if resource.get('admin_state_up', True) is False:
@@ -852,11 +1040,15 @@ class NeutronRestProxyV2Base(db_base_plugin_v2.NeutronDbPluginV2,
         net_id = subnet['network_id']
         network = self.get_network(context, net_id)
         mapped_network = self._get_mapped_network_with_subnets(network)
-        mapped_subnet = self._map_display_name_or_tenant(subnet)
-        mapped_subnet = self._map_state_and_status(mapped_subnet)
+        return self._make_router_intf_details(port, subnet, mapped_network)
+
+    def _make_router_intf_details(self, port, subnet, mapped_network,
+                                  mapped_subnet=None):
+        if mapped_subnet is None:
+            mapped_subnet = self._map_subnet(subnet)
 
         data = {
-            'id': subnet_id,
+            'id': subnet['id'],
             "network": mapped_network,
             "subnet": mapped_subnet
         }
@@ -867,7 +1059,7 @@ class NeutronRestProxyV2Base(db_base_plugin_v2.NeutronDbPluginV2,
 
         return data
 
-    def _extend_port_dict_binding(self, context, port):
+    def _extend_port_dict_binding(self, context, port, hostids=None):
         cfg_vif_type = cfg.CONF.NOVA.vif_type.lower()
         if cfg_vif_type not in (portbindings.VIF_TYPE_OVS,
                                 pl_config.VIF_TYPE_IVS):
@@ -878,6 +1070,8 @@ class NeutronRestProxyV2Base(db_base_plugin_v2.NeutronDbPluginV2,
         # In ML2, the host_id is already populated
         if portbindings.HOST_ID in port:
             hostid = port[portbindings.HOST_ID]
+        elif 'id' in port and hostids is not None:
+            hostid = hostids.get(port['id'], False)
         elif 'id' in port:
             hostid = porttracker_db.get_port_hostid(context, port['id'])
         else:
@@ -910,17 +1104,22 @@ class NeutronRestProxyV2Base(db_base_plugin_v2.NeutronDbPluginV2,
         return net['tenant_id']
 
     def _add_service_tenant_to_port(self, port):
-        port['tenant_id'] = port['tenant_id'] or servermanager.SERVICE_TENANT
+        """Assign the port and its network to the service tenant if unset
 
-        if 'network' in port:
-            port['network']['tenant_id'] = (
-                port['network']['tenant_id'] or servermanager.SERVICE_TENANT)
+        :return: port copy, the network is only copied if it is changed
+        """
+        port = dict(port, tenant_id=(port['tenant_id'] or
+                                     servermanager.SERVICE_TENANT))
+
+        if 'network' in port and not port['network']['tenant_id']:
+            port['network'] = dict(port['network'],
+                                   tenant_id=servermanager.SERVICE_TENANT)
+        return port
 
     def async_port_create(self, tenant_id, net_id, port, update_status=True):
         try:
             tenant_id = tenant_id or servermanager.SERVICE_TENANT
-            rest_port = copy.deepcopy(port)
-            self._add_service_tenant_to_port(rest_port)
+            rest_port = self._add_service_tenant_to_port(port)
             self.servers.rest_create_port(tenant_id, net_id, rest_port)
         except servermanager.RemoteRestError as e:
             # 404 should never be received on a port create unless
@@ -934,7 +1133,9 @@ class NeutronRestProxyV2Base(db_base_plugin_v2.NeutronDbPluginV2,
                           "triggering full synchronization.")
                 # args depend on if we are operating in ML2 driver
                 # or as the full plugin
-                self._send_all_data_auto(triggered_by_tenant=tenant_id)
+                self._send_all_data_auto(
+                    triggered_by_tenant=tenant_id,
+                    trigger=servermanager.TOPO_SYNC_TRIGGER_NXNETWORK)
                 # If the full sync worked, the port will be created
                 # on the controller so it can be safely marked as active
             else:
@@ -964,16 +1165,79 @@ class NeutronRestProxyV2Base(db_base_plugin_v2.NeutronDbPluginV2,
             tenant_id = tenant_id or servermanager.SERVICE_TENANT
             self.servers.rest_delete_port(tenant_id, net_id, port['id'])
 
-    # NOTE(kevinbenton): workaround for eventlet/mysql deadlock
-    @runtime.synchronized('bsn-port-barrier')
     def _set_port_status(self, port_id, status):
+        """Set the status of a port
+
+        If port_status_batch_window is set, status changes of concurrent
+        requests are written together, see _set_port_statuses.
+
+        :raises: PortNotFound
+        """
+        # NOTE(kevinbenton): workaround for eventlet/mysql deadlock
+        with lockutils.lock(PORT_BARRIER_LOCK % port_id):
+            window = cfg.CONF.RESTPROXY.port_status_batch_window
+            if window <= 0:
+                error = self._set_port_statuses([(port_id, status)])[0]
+            else:
+                if NeutronRestProxyV2Base._port_status_batcher is None:
+                    NeutronRestProxyV2Base._port_status_batcher = (
+                        dispatcher.MicroBatcher(self._set_port_statuses,
+                                                window,
+                                                PORT_STATUS_BATCH_SIZE))
+                done = event.Event()
+                NeutronRestProxyV2Base._port_status_batcher.submit(
+                    (port_id, status), done.send)
+                error = done.wait()
+        if error is not None:
+            raise error
+
+    @db_api.retry_db_errors
+    def _set_port_statuses(self, updates):
+        """Write a batch of port status changes
+
+        Ports are updated with one UPDATE per status value, the last status
+        given for a port wins. Only ports whose status changes are written
+        and get a new revision, agents report unchanged statuses all the
+        time.
+
+        :param updates: list of (port_id, status)
+        :return: list with None for each updated port, or PortNotFound
+        """
+        statuses = dict(updates)
         session = db_api.get_writer_session()
-        try:
-            port = session.query(models_v2.Port).filter_by(id=port_id).one()
-            port['status'] = status
-            session.flush()
-        except sqlexc.NoResultFound:
-            raise lib_exceptions.PortNotFound(port_id=port_id)
+        with session.begin():
+            query = session.query(models_v2.Port.id,
+                                  models_v2.Port.standard_attr_id,
+                                  models_v2.Port.status).filter(
+                models_v2.Port.id.in_(list(statuses)))
+            found = set()
+            port_ids = {}
+            changed_attrs = []
+            for port in query:
+                found.add(port.id)
+                status = statuses[port.id]
+                if port.status != status:
+                    port_ids.setdefault(status, []).append(port.id)
+                    changed_attrs.append(port.standard_attr_id)
+            for status, ids in port_ids.items():
+                # sorted so concurrent batches lock rows in the same order
+                query = session.query(models_v2.Port).filter(
+                    models_v2.Port.id.in_(sorted(ids)),
+                    models_v2.Port.status != status)
+                query.update({'status': status}, synchronize_session=False)
+            if changed_attrs:
+                # bulk updates bypass the revision bump and timestamp of ORM
+                # updates, which the topology revision and If-Match revision
+                # checks rely on
+                attrs = standard_attr.StandardAttribute
+                session.query(attrs).filter(
+                    attrs.id.in_(sorted(changed_attrs))).update(
+                    {'revision_number': attrs.revision_number + 1,
+                     'updated_at': timeutils.utcnow().replace(microsecond=0)},
+                    synchronize_session=False)
+        return [None if port_id in found
+                else lib_exceptions.PortNotFound(port_id=port_id)
+                for port_id, status in updates]
 
 
 def add_debug_log(f):
@@ -1022,6 +1286,7 @@ class NeutronRestProxyV2(NeutronRestProxyV2Base,
                                                'get_floating_ips': True,
                                                'get_routers': True,
                                                'get_sgs': True}
+        self.servers.get_topo_revision_function = self._get_topology_revision
 
         self.network_scheduler = importutils.import_object(
             cfg.CONF.network_scheduler_driver
@@ -1031,7 +1296,8 @@ class NeutronRestProxyV2(NeutronRestProxyV2Base,
         self._setup_rpc()
 
         if cfg.CONF.RESTPROXY.sync_data:
-            self._send_all_data_auto()
+            self._send_all_data_auto(
+                trigger=servermanager.TOPO_SYNC_TRIGGER_SYNC_DATA)
 
         self.add_periodic_dhcp_agent_status_check()
         LOG.debug("NeutronRestProxyV2: initialization done")
@@ -1226,8 +1492,13 @@ class NeutronRestProxyV2(NeutronRestProxyV2Base,
         with db_api.CONTEXT_READER.using(context):
             ports = super(NeutronRestProxyV2, self).get_ports(context, filters,
                                                               fields)
+            # look up the tracked host ids of all ports in one query
+            hostids = porttracker_db.get_port_hostids(
+                context, [port['id'] for port in ports
+                          if portbindings.HOST_ID not in port and
+                          'id' in port])
             for port in ports:
-                self._extend_port_dict_binding(context, port)
+                self._extend_port_dict_binding(context, port, hostids)
         return [self._fields(port, fields) for port in ports]
 
     @add_debug_log
@@ -1310,8 +1581,6 @@ class NeutronRestProxyV2(NeutronRestProxyV2Base,
         # return new_port
         return new_port
 
-    # NOTE(kevinbenton): workaround for eventlet/mysql deadlock
-    @runtime.synchronized('bsn-port-barrier')
     @add_debug_log
     def delete_port(self, context, port_id, l3_port_check=True):
         """Delete a port.
@@ -1324,10 +1593,20 @@ class NeutronRestProxyV2(NeutronRestProxyV2Base,
         :raises: exceptions.NetworkNotFound
         :raises: RemoteRestError
         """
+        # NOTE(kevinbenton): workaround for eventlet/mysql deadlock
+        with lockutils.lock(PORT_BARRIER_LOCK % port_id):
+            router_ids = self._delete_port(context, port_id, l3_port_check)
+
+        if self.l3_plugin:
+            # now that we've left db transaction, we are safe to notify
+            self.l3_plugin.notify_routers_updated(context, router_ids)
+
+    def _delete_port(self, context, port_id, l3_port_check):
         # if needed, check to see if this is a port owned by
         # and l3-router.  If so, we should prevent deletion.
         if l3_port_check and self.l3_plugin:
             self.l3_plugin.prevent_l3_port_deletion(context, port_id)
+        router_ids = None
         with db_api.CONTEXT_WRITER.using(context):
             if self.l3_plugin:
                 router_ids = self.l3_plugin.disassociate_floatingips(
@@ -1338,10 +1617,7 @@ class NeutronRestProxyV2(NeutronRestProxyV2Base,
             self.ipam.delete_port(context, port_id)
             tenid = tenid or servermanager.SERVICE_TENANT
             self.servers.rest_delete_port(tenid, port['network_id'], port_id)
-
-        if self.l3_plugin:
-            # now that we've left db transaction, we are safe to notify
-            self.l3_plugin.notify_routers_updated(context, router_ids)
+        return router_ids
 
     @add_debug_log
     def create_subnet(self, context, subnet):
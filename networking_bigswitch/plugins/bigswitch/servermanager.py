@@ -27,11 +27,17 @@ The following functionality is handled by this module:
 
 """
 import base64
+import collections
+import hashlib
 import httplib
+import json
 import re
+import select
 import socket
 import ssl
+import tempfile
 import time
+import zlib
 
 from neutron_lib import exceptions
 
@@ -39,10 +45,14 @@ from oslo_log import log as logging
 
 import eventlet
 import eventlet.corolocal
+from eventlet import event
+import eventlet.semaphore
+from keystoneauth1 import exceptions as ks_exceptions
 from keystoneauth1.identity import v3
 from keystoneauth1 import session
 from keystoneclient.v3 import client as ksclient
 from networking_bigswitch.plugins.bigswitch.db import consistency_db as cdb
+from networking_bigswitch.plugins.bigswitch import dispatcher
 from networking_bigswitch.plugins.bigswitch.i18n import _
 from networking_bigswitch.plugins.bigswitch.i18n import _LE
 from networking_bigswitch.plugins.bigswitch.i18n import _LI
@@ -51,7 +61,9 @@ from networking_bigswitch.plugins.bigswitch.utils import Util
 import os
 from oslo_config import cfg
 from oslo_serialization import jsonutils
+from oslo_utils import encodeutils
 from oslo_utils import excutils
+from six.moves.urllib import parse as urlparse
 from sqlalchemy.types import Enum
 
 LOG = logging.getLogger(__name__)
@@ -68,11 +80,14 @@ NETWORKS_PATH = "/tenants/%s/networks/%s"
 FLOATINGIPS_PATH = "/tenants/%s/floatingips/%s"
 PORTS_PATH = "/tenants/%s/networks/%s/ports/%s"
 ATTACHMENT_PATH = "/tenants/%s/networks/%s/ports/%s/attachment"
+PORT_ATTACHMENTS_PATH = "/port-attachments"
 ROUTERS_PATH = "/tenants/%s/routers/%s"
 ROUTER_INTF_PATH = "/tenants/%s/routers/%s/interfaces/%s"
 SECURITY_GROUP_PATH = "/securitygroups/%s"
 TENANT_PATH = "/tenants/%s"
 TOPOLOGY_PATH = "/topology"
+TOPOLOGY_DELTA_PATH = "/topology/delta"
+TENANT_TOPOLOGY_PATH = "/tenants/%s/topology"
 HEALTH_PATH = "/health"
 SWITCHES_PATH = "/switches/%s"
 TESTPATH_PATH = ('/testpath/controller-view'
@@ -82,11 +97,16 @@ TESTPATH_PATH = ('/testpath/controller-view'
 TENANTPOLICY_RESOURCE_PATH = "/tenants/%s/policies"
 TENANTPOLICIES_PATH = "/tenants/%s/policies/%s"
 SUCCESS_CODES = range(200, 207)
+# cluster members that are not the leader redirect writes to it
+REDIRECT_CODES = (httplib.MOVED_PERMANENTLY, httplib.FOUND, httplib.SEE_OTHER)
 FAILURE_CODES = [0, 301, 302, 303, 400, 401, 403, 404, 500, 501, 502, 503,
                  504, 505]
 BASE_URI = '/networkService/v2.0'
 ORCHESTRATION_SERVICE_ID = 'Neutron v2.0'
 HASH_MATCH_HEADER = 'X-BSN-BVS-HASH-MATCH'
+# fencing token of the TOPO_SYNC lock, lets the controller reject syncs of a
+# worker whose lock was taken over
+TOPO_SYNC_TOKEN_HEADER = 'X-BSN-TOPO-SYNC-TOKEN'
 SERVICE_TENANT = 'VRRP_Service'
 KS_AUTH_GROUP_NAME = 'keystone_authtoken'
 KS_AUTH_DOMAIN_DEFAULT = 'default'
@@ -96,10 +116,48 @@ HTTP_SERVICE_UNAVAILABLE_RETRY_COUNT = 3
 HTTP_SERVICE_UNAVAILABLE_RETRY_INTERVAL = 3
 
 KEYSTONE_SYNC_RATE_LIMIT = 30  # Limit KeyStone sync to once in 30 secs
+# Tenant ids not found in keystone are not looked up again for 60 secs
+UNKNOWN_TENANT_TTL = 60
 # TOPO_SYNC Responses
 TOPO_RESPONSE_OK = (httplib.OK, httplib.OK, True, True)
 TOPO_RESPONSE_FAIL = (0, None, None, None)
 
+# What requested a topology sync, reported by get_forcesynctopologies
+TOPO_SYNC_TRIGGER_STARTUP = 'startup'
+TOPO_SYNC_TRIGGER_REST_FAILURE = 'rest-failure'
+TOPO_SYNC_TRIGGER_KEYSTONE = 'keystone'
+TOPO_SYNC_TRIGGER_NXNETWORK = 'missing-network'
+TOPO_SYNC_TRIGGER_SYNC_DATA = 'sync-data'
+TOPO_SYNC_TRIGGER_USER = 'user'
+TOPO_SYNC_TRIGGER_OTHER = 'other'
+
+# Top level sections of the topology payload that are synced per object
+TOPO_SYNC_SECTIONS = ('networks', 'routers', 'security-groups', 'tenants')
+TOPO_DELTA_CAPABILITY = 'topology-delta'
+TENANT_TOPOLOGY_CAPABILITY = 'tenant-topology'
+
+# Streamed request bodies are sent in chunks of this many bytes, and spooled
+# to a temporary file once they grow beyond BODY_SPOOL_MAX_MEMORY
+BODY_CHUNK_SIZE = 64 * 1024
+BODY_SPOOL_MAX_MEMORY = 4 * 1024 * 1024
+
+# Request and response bodies are gzip compressed if the controller
+# advertises this capability
+GZIP_CAPABILITY = 'gzip'
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+# Port attachments are sent in bulk if the controller advertises this
+# capability, see port_batch_window
+PORT_BULK_CAPABILITY = 'port-attachment-bulk'
+
+# Capabilities of a server that can't be reached are kept this many seconds
+CAPABILITIES_TTL = 900
+
+# Circuit breaker reset timeouts double up to this many seconds
+CIRCUIT_BREAKER_MAX_RESET_TIMEOUT = 300
+# Weight of the latest sample in the moving averages of server health
+SERVER_HEALTH_EWMA_WEIGHT = 0.2
+
 # RE pattern for checking BCF supported names
 BCF_IDENTIFIER_UUID_RE = re.compile(r"[0-9a-zA-Z][-.0-9a-zA-Z_]*")
 
@@ -197,6 +255,187 @@ class DictDiffer(object):
                    if self.past_dict[o] == self.current_dict[o])
 
 
+def index_topology(data):
+    """Index the top level objects of a topology payload
+
+    :param data: topology payload as returned by the topology function
+    :return: dict {(section, object_id): object}. Tenants sent as a
+             {tenant_id: tenant_name} dict are indexed by tenant_id with the
+             tenant name as object.
+    """
+    objects = {}
+    for section in TOPO_SYNC_SECTIONS:
+        section_data = data.get(section)
+        if not section_data:
+            continue
+        if isinstance(section_data, dict):
+            for obj_id, obj in section_data.items():
+                objects[(section, obj_id)] = obj
+        else:
+            for obj in section_data:
+                objects[(section, obj['id'])] = obj
+    return objects
+
+
+def hash_topology_object(obj):
+    return hashlib.sha1(jsonutils.dump_as_bytes(obj,
+                                                sort_keys=True)).hexdigest()
+
+
+def get_topology_hash(object_hashes):
+    """Single hash summarizing a set of topology object hashes"""
+    topo_hash = hashlib.sha1()
+    for (section, obj_id), obj_hash in sorted(object_hashes.items()):
+        line = '%s:%s:%s\n' % (section, obj_id, obj_hash)
+        topo_hash.update(line.encode('utf-8'))
+    return topo_hash.hexdigest()
+
+
+class TopologyDelta(object):
+    """Difference between a topology payload and the last synced topology
+
+    Objects are compared by content hash. Objects that are new or whose hash
+    changed are sent in full, objects that are gone are sent by id.
+    """
+    def __init__(self, data, synced_hashes):
+        self.data = data
+        self.objects = index_topology(data)
+        self.hashes = {key: hash_topology_object(obj)
+                       for key, obj in self.objects.items()}
+        self.synced_hashes = synced_hashes
+        diff = DictDiffer(self.hashes, synced_hashes)
+        self.updated = diff.added() | diff.changed()
+        self.removed = diff.removed()
+
+    def get_updated_hashes(self):
+        return {key: self.hashes[key] for key in self.updated}
+
+    def get_payload(self):
+        updated = {}
+        for section, obj_id in self.updated:
+            obj = self.objects[(section, obj_id)]
+            if isinstance(self.data.get(section), dict):
+                updated.setdefault(section, {})[obj_id] = obj
+            else:
+                updated.setdefault(section, []).append(obj)
+        removed = {}
+        for section, obj_id in self.removed:
+            removed.setdefault(section, []).append(obj_id)
+        # previous-hash lets the controller verify that it still holds the
+        # state this delta is based on
+        return {'previous-hash': get_topology_hash(self.synced_hashes),
+                'hash': get_topology_hash(self.hashes),
+                'updated': updated,
+                'removed': removed}
+
+
+class BodySpool(object):
+    """BodySpool
+
+    Request body kept in a spooled temporary file, so large bodies are
+    never held in memory as a single string. Requests stream it with chunked
+    transfer encoding, and it can be sent any number of times, e.g. when a
+    request is retried on several servers.
+    """
+
+    def __init__(self, chunk_size=BODY_CHUNK_SIZE,
+                 max_memory=BODY_SPOOL_MAX_MEMORY):
+        self.chunk_size = chunk_size
+        self.max_memory = max_memory
+        self.size = 0
+        self._spool = tempfile.SpooledTemporaryFile(max_size=max_memory)
+        self._gzipped = None
+
+    def write(self, data):
+        self._spool.write(data)
+        self.size += len(data)
+
+    def read_chunk(self, offset):
+        self._spool.seek(offset)
+        return self._spool.read(self.chunk_size)
+
+    def chunked_reader(self):
+        return ChunkedBodyReader(self)
+
+    def gzipped(self):
+        """Gzip compressed copy of this body, compressed only once"""
+        if self._gzipped is None:
+            gzipped = BodySpool(self.chunk_size, self.max_memory)
+            compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION,
+                                          zlib.DEFLATED, GZIP_WBITS)
+            offset = 0
+            chunk = self.read_chunk(offset)
+            while chunk:
+                gzipped.write(compressor.compress(chunk))
+                offset += len(chunk)
+                chunk = self.read_chunk(offset)
+            gzipped.write(compressor.flush())
+            self._gzipped = gzipped
+        return self._gzipped
+
+    def close(self):
+        self._spool.close()
+        if self._gzipped:
+            self._gzipped.close()
+
+    def __repr__(self):
+        return '<%s: %d bytes>' % (self.__class__.__name__, self.size)
+
+
+class JSONBodySpool(BodySpool):
+    """JSONBodySpool
+
+    JSON encoding of a large request body, e.g. the topology. The body is
+    encoded incrementally into the spool, and only once even if the request
+    is retried on several servers.
+    """
+
+    def __init__(self, data, chunk_size=BODY_CHUNK_SIZE,
+                 max_memory=BODY_SPOOL_MAX_MEMORY):
+        super(JSONBodySpool, self).__init__(chunk_size, max_memory)
+        encoder = json.JSONEncoder(default=jsonutils.to_primitive)
+        buf = []
+        buf_len = 0
+        for part in encoder.iterencode(data):
+            buf.append(part)
+            buf_len += len(part)
+            if buf_len >= chunk_size:
+                self.write(''.join(buf).encode('utf-8'))
+                buf = []
+                buf_len = 0
+        self.write(''.join(buf).encode('utf-8'))
+
+
+def gzip_compress(data):
+    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED,
+                                  GZIP_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+class ChunkedBodyReader(object):
+    """File-like reader framing a BodySpool for chunked encoding
+
+    httplib sends file-like bodies block by block, which lets the body be
+    streamed without knowing its length up front.
+    """
+
+    def __init__(self, spool):
+        self.spool = spool
+        self.offset = 0
+        self.done = False
+
+    def read(self, size=-1):
+        if self.done:
+            return b''
+        chunk = self.spool.read_chunk(self.offset)
+        self.offset += len(chunk)
+        if not chunk:
+            # zero length chunk terminates the body
+            self.done = True
+            return b'0\r\n\r\n'
+        return ('%x\r\n' % len(chunk)).encode('ascii') + chunk + b'\r\n'
+
+
 class ObjTypeEnum(Enum):
     """Enum
 
@@ -249,6 +488,250 @@ def get_keystoneauth_cfg(conf, name):
         raise e
 
 
+class ConnectionPool(object):
+    """Bounded pool of idle keep-alive connections to a single controller.
+
+    A connection is checked out for the duration of one request and is only
+    handed back once its response has been fully read, so a connection is
+    never shared between greenthreads. At most max_size idle connections are
+    kept; connections idle for longer than idle_timeout, or whose socket was
+    closed by the controller, are discarded instead of being reused.
+    """
+
+    def __init__(self, factory, max_size, idle_timeout):
+        self.factory = factory
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        # (connection, last_used) tuples, most recently used on the right
+        self._idle = collections.deque()
+        self._lock = eventlet.semaphore.Semaphore()
+
+    def get(self, timeout):
+        """Check out a connection
+
+        :return: (connection, reused) where reused is True if the connection
+                 was taken from the pool rather than newly created
+        """
+        with self._lock:
+            self._evict_expired()
+            while self._idle:
+                conn, last_used = self._idle.pop()
+                if self._is_healthy(conn):
+                    return conn, True
+                conn.close()
+        return self.factory(timeout), False
+
+    def put(self, conn):
+        """Return a connection whose response has been completely read"""
+        with self._lock:
+            self._evict_expired()
+            if len(self._idle) < self.max_size:
+                self._idle.append((conn, time.time()))
+                return
+        conn.close()
+
+    def clear(self):
+        with self._lock:
+            while self._idle:
+                conn, last_used = self._idle.pop()
+                conn.close()
+
+    def _evict_expired(self):
+        expire_before = time.time() - self.idle_timeout
+        while self._idle and self._idle[0][1] < expire_before:
+            conn, last_used = self._idle.popleft()
+            conn.close()
+
+    def _is_healthy(self, conn):
+        sock = getattr(conn, 'sock', None)
+        if sock is None:
+            return False
+        try:
+            readable, _w, _x = select.select([sock], [], [], 0)
+        except (select.error, socket.error, TypeError, ValueError):
+            return False
+        # nothing should be readable on an idle keep-alive connection. if it
+        # is, the controller closed it or sent data we can't make sense of
+        return not readable
+
+    def __len__(self):
+        return len(self._idle)
+
+
+class HTTPTransport(object):
+    """HTTPTransport
+
+    Hands out the connections a ServerProxy sends its requests on. A request
+    holds its connection until the response has been read. Idle connections
+    are kept in the proxy's connection pool if the controller supports
+    keep-alive, otherwise every request opens a new connection.
+    """
+
+    def __init__(self, proxy):
+        self.proxy = proxy
+
+    def keep_alive(self):
+        return 'keep-alive' in self.proxy.capabilities
+
+    def acquire(self, timeout, reconnect):
+        """Get a connection for a request
+
+        :return: (connection, reused) where reused is True if the connection
+                 was taken from the pool rather than newly created
+        """
+        if reconnect:
+            return self.proxy._new_connection(timeout), False
+        return self.proxy.connection_pool.get(timeout)
+
+    def release(self, conn, reuse):
+        """Hand back a connection once the request is done with it"""
+        if reuse:
+            self.proxy.connection_pool.put(conn)
+        else:
+            conn.close()
+
+
+class BoundedTransport(HTTPTransport):
+    """BoundedTransport
+
+    Caps the number of concurrent requests to the controller at
+    connection_pool_size and always asks for keep-alive. Requests beyond
+    that wait for one of the connections to be released instead of opening
+    a new one, so bursts of requests are spread over a few warm connections.
+    """
+
+    def __init__(self, proxy):
+        super(BoundedTransport, self).__init__(proxy)
+        self._slots = eventlet.semaphore.Semaphore(
+            cfg.CONF.RESTPROXY.connection_pool_size)
+
+    def keep_alive(self):
+        return True
+
+    def acquire(self, timeout, reconnect):
+        # waiting for a connection counts against the request timeout
+        if not self._slots.acquire(timeout=timeout):
+            LOG.warning(_LW("ServerProxy: no connection to server %(server)s "
+                            "freed up within %(timeout)s seconds."),
+                        {'server': self.proxy.server, 'timeout': timeout})
+            return None, False
+        try:
+            conn, reused = super(BoundedTransport, self).acquire(
+                timeout, reconnect)
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                self._slots.release()
+        if conn is None:
+            self._slots.release()
+        return conn, reused
+
+    def release(self, conn, reuse):
+        try:
+            super(BoundedTransport, self).release(conn, reuse)
+        finally:
+            self._slots.release()
+
+
+# transports selectable with the http_transport option
+TRANSPORTS = {
+    'httplib': HTTPTransport,
+    'bounded': BoundedTransport,
+}
+
+
+class CircuitBreaker(object):
+    """Circuit breaker of a single controller
+
+    closed: requests are sent. After failure_threshold consecutive failures
+        the circuit opens.
+    open: requests skip the controller until reset_timeout seconds have
+        passed, then the circuit is half-open.
+    half-open: a single trial request is sent, the other requests fail fast
+        until it completes. If it succeeds the circuit closes, otherwise it
+        opens again for twice the previous reset timeout, up to
+        CIRCUIT_BREAKER_MAX_RESET_TIMEOUT.
+
+    A failure is a request that got no response or a 503. The moving
+    average of the response latency is kept to order the controllers.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold, reset_timeout,
+                 max_reset_timeout=CIRCUIT_BREAKER_MAX_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.open_until = 0
+        self.latency = None
+        self._current_reset_timeout = reset_timeout
+        # greenthread sending the trial request while half-open
+        self._trial = None
+
+    def allow_request(self):
+        """Check if a request may be sent, without changing the state"""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            return time.time() >= self.open_until and self._trial is None
+        return self._trial is None
+
+    def before_request(self):
+        """Admit a request, the first one while half-open is the trial
+
+        :return: True if the request may be sent, False if it must fail fast
+                 because the trial request is in progress
+        """
+        if self.state == self.OPEN and time.time() >= self.open_until:
+            self.state = self.HALF_OPEN
+        if self.state != self.HALF_OPEN:
+            return True
+        if self._trial is not None:
+            return False
+        self._trial = eventlet.getcurrent()
+        return True
+
+    def _end_request(self):
+        # requests sent before the circuit went half-open may complete
+        # during the trial, only the trial request itself ends it
+        if self._trial is eventlet.getcurrent():
+            self._trial = None
+
+    def record_success(self, latency):
+        self._end_request()
+        self.state = self.CLOSED
+        self.failures = 0
+        self._current_reset_timeout = self.reset_timeout
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += SERVER_HEALTH_EWMA_WEIGHT * (latency -
+                                                         self.latency)
+
+    def record_failure(self):
+        self._end_request()
+        self.failures += 1
+        if self.state == self.HALF_OPEN:
+            self._current_reset_timeout = min(self._current_reset_timeout * 2,
+                                              self.max_reset_timeout)
+            self._open()
+        elif (self.state == self.CLOSED and self.failure_threshold and
+              self.failures >= self.failure_threshold):
+            self._open()
+
+    def _open(self):
+        self.state = self.OPEN
+        self.open_until = time.time() + self._current_reset_timeout
+
+    def __repr__(self):
+        return ('CircuitBreaker(state=%s, failures=%d, latency=%s)' %
+                (self.state, self.failures, self.latency))
+
+
 class ServerProxy(object):
     """REST server proxy to a network controller."""
 
@@ -264,12 +747,25 @@ class ServerProxy(object):
         self.auth = None
         self.auth_token = None
         self.neutron_id = neutron_id
+        # outcome of the last request through the pool, and its moving
+        # average
         self.failed = False
+        self.success_rate = 1.0
+        # Location of the last redirect received from this server
+        self.redirect_location = None
+        self.breaker = CircuitBreaker(
+            cfg.CONF.RESTPROXY.circuit_breaker_threshold,
+            cfg.CONF.RESTPROXY.circuit_breaker_reset_timeout)
         self.capabilities = []
+        self.capabilities_expire = 0
         # enable server to reference parent pool
         self.mypool = mypool
-        # cache connection here to avoid a SSL handshake for every connection
-        self.currentconn = None
+        # cache connections here to avoid a SSL handshake for every request
+        self.connection_pool = ConnectionPool(
+            self._new_connection,
+            cfg.CONF.RESTPROXY.connection_pool_size,
+            cfg.CONF.RESTPROXY.connection_idle_timeout)
+        self.transport = TRANSPORTS[cfg.CONF.RESTPROXY.http_transport](self)
 
         if auth:
             if ':' in auth:
@@ -278,113 +774,211 @@ class ServerProxy(object):
                 self.auth_token = 'session_cookie="' + auth + '"'
 
         self.combined_cert = combined_cert
+        self.ssl_context_cache = (SSLContextCache(combined_cert) if ssl
+                                  else None)
 
     def get_capabilities(self):
+        """Query the capabilities of the server
+
+        The last capabilities received are kept for CAPABILITIES_TTL
+        seconds while the server can't be reached.
+        """
         try:
             body = self.rest_call('GET', CAPABILITIES_PATH)[2]
             if body:
                 self.capabilities = jsonutils.loads(body)
+                self.capabilities_expire = time.time() + CAPABILITIES_TTL
         except Exception:
             LOG.exception("Couldn't retrieve capabilities on server "
                           "%(server)s. ", {'server': self.server})
+        if self.capabilities and time.time() >= self.capabilities_expire:
+            LOG.warning("Capabilities of server %s expired.", self.server)
+            self.capabilities = []
         LOG.info("The following capabilities were received "
                  "for %(server)s: %(cap)s",
                  {'server': self.server, 'cap': self.capabilities})
         return self.capabilities
 
+    def record_result(self, success):
+        self.failed = not success
+        self.success_rate += SERVER_HEALTH_EWMA_WEIGHT * (
+            (1.0 if success else 0.0) - self.success_rate)
+
+    def health_sort_key(self):
+        """Order servers by health
+
+        Open circuits go last, then servers whose last request failed. The
+        rest is ordered by success rate and latency.
+        """
+        latency = self.breaker.latency
+        return (self.breaker.state != CircuitBreaker.CLOSED, self.failed,
+                -self.success_rate, latency if latency is not None else 0)
+
+    def _compression_supported(self):
+        return (cfg.CONF.RESTPROXY.request_compression and
+                GZIP_CAPABILITY in self.capabilities)
+
+    def _new_connection(self, timeout):
+        if self.ssl:
+            conn = HTTPSConnectionWithValidation(
+                self.server, self.port, timeout=timeout)
+            if conn is None:
+                LOG.error('ServerProxy: Could not establish HTTPS '
+                          'connection')
+                return None
+            conn.combined_cert = self.combined_cert
+            conn.ssl_context_cache = self.ssl_context_cache
+        else:
+            conn = httplib.HTTPConnection(
+                self.server, self.port, timeout=timeout)
+            if conn is None:
+                LOG.error('ServerProxy: Could not establish HTTP '
+                          'connection')
+                return None
+        return conn
+
     def rest_call(self, action, resource, data='', headers=None,
                   timeout=False, reconnect=False):
+        if not self.breaker.before_request():
+            LOG.debug("ServerProxy: circuit of server %s is half-open with "
+                      "a trial request in progress, failing fast.",
+                      self.server)
+            return 0, None, None, None
+        start = time.time()
+        try:
+            ret = self._rest_call(action, resource, data, headers,
+                                  timeout=timeout, reconnect=reconnect)
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                self.breaker.record_failure()
+        if ret[0] in (0, httplib.SERVICE_UNAVAILABLE):
+            self.breaker.record_failure()
+            if self.breaker.state == CircuitBreaker.OPEN:
+                LOG.warning(_LW("ServerProxy: circuit of server %(server)s "
+                                "is open after %(failures)d failures."),
+                            {'server': self.server,
+                             'failures': self.breaker.failures})
+        else:
+            self.breaker.record_success(time.time() - start)
+        return ret
+
+    def _rest_call(self, action, resource, data='', headers=None,
+                   timeout=False, reconnect=False):
         uri = self.base_uri + resource
-        body = jsonutils.dumps(data)
-        headers = headers or {}
-        headers['Content-type'] = 'application/json'
-        headers['Accept'] = 'application/json'
-        headers['NeutronProxy-Agent'] = self.name
-        headers['Instance-ID'] = self.neutron_id
-        headers['Orchestration-Service-ID'] = ORCHESTRATION_SERVICE_ID
-
-        # TODO(kevinbenton): Re-enable keep-alive in a thread-safe fashion.
-        # When multiple workers are enabled the saved connection gets mangled
-        # by multiple threads so we always reconnect.
-        if 'keep-alive' in self.capabilities and False:
-            headers['Connection'] = 'keep-alive'
+        # built from a copy for every attempt, the caller's headers are
+        # reused for retries on servers that may not all support compression
+        # or keep-alive
+        request_headers = dict(headers or {})
+        compress = self._compression_supported()
+        threshold = cfg.CONF.RESTPROXY.request_compression_threshold
+        if isinstance(data, BodySpool):
+            # large bodies are streamed from the spool, a new reader is
+            # needed for every attempt
+            spool = data
+            if compress and spool.size >= threshold:
+                spool = spool.gzipped()
+                request_headers['Content-Encoding'] = 'gzip'
+            body = spool.chunked_reader()
+            request_headers['Transfer-Encoding'] = 'chunked'
+        else:
+            body = jsonutils.dumps(data)
+            if compress and len(body) >= threshold:
+                body = gzip_compress(encodeutils.safe_encode(body))
+                request_headers['Content-Encoding'] = 'gzip'
+        if compress:
+            request_headers['Accept-Encoding'] = 'gzip'
+        request_headers['Content-type'] = 'application/json'
+        request_headers['Accept'] = 'application/json'
+        request_headers['NeutronProxy-Agent'] = self.name
+        request_headers['Instance-ID'] = self.neutron_id
+        request_headers['Orchestration-Service-ID'] = (
+            ORCHESTRATION_SERVICE_ID)
+
+        # unspecified timeout is False because a timeout can be specified as
+        # None to indicate no timeout.
+        if timeout is False:
+            timeout = self.timeout
+
+        if timeout != self.timeout:
+            # pooled connections all use the default timeout, so a custom
+            # timeout needs a new connection
+            reconnect = True
+
+        # Connections are checked out of the pool for the duration of a
+        # request, so keep-alive is safe with multiple greenthreads.
+        if self.transport.keep_alive() and not reconnect:
+            request_headers['Connection'] = 'keep-alive'
         else:
             reconnect = True
 
         if self.auth_token:
-            headers['Cookie'] = self.auth_token
+            request_headers['Cookie'] = self.auth_token
         elif self.auth:
-            headers['Authorization'] = self.auth
+            request_headers['Authorization'] = self.auth
 
         LOG.debug("ServerProxy: server=%(server)s, port=%(port)d, "
                   "ssl=%(ssl)r",
                   {'server': self.server, 'port': self.port, 'ssl': self.ssl})
         LOG.debug("ServerProxy: resource=%(resource)s, data=%(data)r, "
                   "headers=%(headers)r, action=%(action)s",
-                  {'resource': resource, 'data': data, 'headers': headers,
-                   'action': action})
-
-        # unspecified timeout is False because a timeout can be specified as
-        # None to indicate no timeout.
-        if timeout is False:
-            timeout = self.timeout
+                  {'resource': resource, 'data': data,
+                   'headers': request_headers, 'action': action})
 
-        if timeout != self.timeout:
-            # need a new connection if timeout has changed
-            reconnect = True
-
-        if not self.currentconn or reconnect:
-            if self.currentconn:
-                self.currentconn.close()
-            if self.ssl:
-                currentconn = HTTPSConnectionWithValidation(
-                    self.server, self.port, timeout=timeout)
-                if currentconn is None:
-                    LOG.error('ServerProxy: Could not establish HTTPS '
-                              'connection')
-                    return 0, None, None, None
-                currentconn.combined_cert = self.combined_cert
-            else:
-                currentconn = httplib.HTTPConnection(
-                    self.server, self.port, timeout=timeout)
-                if currentconn is None:
-                    LOG.error('ServerProxy: Could not establish HTTP '
-                              'connection')
-                    return 0, None, None, None
+        currentconn, reused = self.transport.acquire(timeout, reconnect)
+        if currentconn is None:
+            return 0, None, None, None
 
+        reuse = False
         try:
-            bcf_request_time = time.time()
-            currentconn.request(action, uri, body, headers)
-            response = currentconn.getresponse()
-            respstr = response.read()
-            respdata = respstr
-            bcf_response_time = time.time()
-            LOG.debug("Time waited to get response from BCF %.2fsecs",
-                      (bcf_response_time - bcf_request_time))
-            if response.status in self.success_codes:
-                try:
-                    respdata = jsonutils.loads(respstr)
-                except ValueError:
-                    # response was not JSON, ignore the exception
-                    pass
-
-            ret = (response.status, response.reason, respstr, respdata)
+            try:
+                bcf_request_time = time.time()
+                currentconn.request(action, uri, body, request_headers)
+                response = currentconn.getresponse()
+                respstr = response.read()
+                if response.status in REDIRECT_CODES:
+                    self.redirect_location = response.getheader('Location')
+                if (compress and respstr and
+                        response.getheader('Content-Encoding') == 'gzip'):
+                    respstr = zlib.decompress(respstr, GZIP_WBITS)
+                respdata = respstr
+                bcf_response_time = time.time()
+                LOG.debug("Time waited to get response from BCF %.2fsecs",
+                          (bcf_response_time - bcf_request_time))
+                if response.status in self.success_codes:
+                    try:
+                        respdata = jsonutils.loads(respstr)
+                    except ValueError:
+                        # response was not JSON, ignore the exception
+                        pass
+
+                ret = (response.status, response.reason, respstr, respdata)
+                # the response has been read completely, so the connection
+                # can be handed to the next request unless either side wants
+                # it closed
+                reuse = not reconnect and not getattr(response, 'will_close',
+                                                      True)
+            finally:
+                # the connection is handed back whatever the error, before
+                # any retry, or a bounded transport loses one of its slots
+                self.transport.release(currentconn, reuse)
         except httplib.HTTPException:
             # If we were using a cached connection, try again with a new one.
             with excutils.save_and_reraise_exception() as ctxt:
-                currentconn.close()
-                if reconnect:
-                    # if reconnect is true, this was on a fresh connection so
-                    # reraise since this server seems to be broken
-                    ctxt.reraise = True
-                else:
-                    # if reconnect is false, it was a cached connection so
-                    # try one more time before re-raising
-                    ctxt.reraise = False
-            return self.rest_call(action, resource, data, headers,
-                                  timeout=timeout, reconnect=True)
-        except (socket.timeout, socket.error) as e:
-            currentconn.close()
+                # a fresh connection failing means this server seems to be
+                # broken so reraise. a cached connection may simply have
+                # been closed by the controller, so try one more time.
+                ctxt.reraise = not reused
+            return self._rest_call(action, resource, data, headers,
+                                   timeout=timeout, reconnect=True)
+        except socket.timeout as e:
+            LOG.error('ServerProxy: %(action)s failure, %(e)r',
+                      {'action': action, 'e': e})
+            ret = 0, None, None, None
+        except socket.error as e:
+            if reused:
+                # stale cached connection, e.g. reset by the controller
+                return self._rest_call(action, resource, data, headers,
+                                       timeout=timeout, reconnect=True)
             LOG.error('ServerProxy: %(action)s failure, %(e)r',
                       {'action': action, 'e': e})
             ret = 0, None, None, None
@@ -396,6 +990,25 @@ class ServerProxy(object):
         return ret
 
 
+class TopoSyncRequest(object):
+    """TopoSyncRequest
+
+    Topology sync requested while another one is running in the worker.
+    All requests made before it starts are merged into it: it checks the
+    previous timestamp only if all of them asked to, and records all of
+    their triggers.
+    """
+
+    def __init__(self):
+        self.check_ts = True
+        self.triggers = collections.Counter()
+        self.done = event.Event()
+
+    def add(self, check_ts, trigger):
+        self.check_ts = self.check_ts and check_ts
+        self.triggers[trigger] += 1
+
+
 class ServerPool(object):
 
     _instance = None
@@ -451,12 +1064,26 @@ class ServerPool(object):
         self.name = name
         # Cache for Openstack projects
         # The cache is maintained in a separate thread and sync'ed with
-        # Keystone periodically.
+        # Keystone periodically. It is shared with the other workers
+        # through the DB, see _update_tenant_cache.
         self.keystone_tenants = {}
+        self._keystone_client = None
+        self._last_keystone_sync_time = None
+        # single flight and negative caching of tenant cache misses
+        self._tenant_cache_lock = eventlet.semaphore.Semaphore()
+        self._tenant_cache_generation = 0
+        self._unknown_tenants = {}
         self._update_tenant_cache(reconcile=False)
         self.timeout = cfg.CONF.RESTPROXY.server_timeout
         self.always_reconnect = not cfg.CONF.RESTPROXY.cache_connections
         self.capabilities = []
+        # port attachments submitted by concurrent requests are sent to the
+        # controller in a single bulk request
+        self.port_batcher = None
+        if cfg.CONF.RESTPROXY.port_batch_window > 0:
+            self.port_batcher = dispatcher.MicroBatcher(
+                self.rest_create_ports, cfg.CONF.RESTPROXY.port_batch_window,
+                cfg.CONF.RESTPROXY.port_batch_size)
         default_port = 8000
         if timeout is not False:
             self.timeout = timeout
@@ -465,6 +1092,11 @@ class ServerPool(object):
         # Needs to be set by module that uses the servermanager.
         self.get_topo_function = None
         self.get_topo_function_args = {}
+        # returns the revision of the DB state the topology is built from
+        self.get_topo_revision_function = None
+        # (revision, data) of the last topology collected while the
+        # revision did not change
+        self._topo_snapshot = None
 
         if not servers:
             raise cfg.Error(_('Servers not defined. Aborting server manager.'))
@@ -477,6 +1109,14 @@ class ServerPool(object):
             raise cfg.Error(_('Servers must be defined as <ip>:<port>. '
                               'Configuration was %s') % servers)
         self.servers = []
+        # cluster leader, writes are sent to it first
+        self.leader = None
+        # topology sync running in this worker, and the one that requests
+        # made in the meantime are merged into
+        self._topo_sync_running = False
+        self._topo_sync_pending = None
+        # greenthreads collecting or sending the running topology sync
+        self._topo_sync_threads = set()
         for s in servers:
             server, port = s.rsplit(':', 1)
             if server.startswith("[") and server.endswith("]"):
@@ -498,6 +1138,14 @@ class ServerPool(object):
         eventlet.spawn(self._consistency_watchdog,
                        cfg.CONF.RESTPROXY.consistency_interval)
 
+        # health probes of each server, feed the circuit breakers
+        eventlet.spawn(self._health_watchdog,
+                       cfg.CONF.RESTPROXY.health_probe_interval)
+
+        # prebuilt topology, so that topo_sync only has to send it
+        eventlet.spawn(self._topo_snapshot_builder,
+                       cfg.CONF.RESTPROXY.topo_snapshot_interval)
+
         # Start keystone sync thread after 5 consistency sync
         # to give enough time for topology to sync over when
         # neutron-server starts.
@@ -510,7 +1158,8 @@ class ServerPool(object):
         """Get capabilities
 
         If cache has the value, use it
-        If Not, do REST calls to BCF controllers to check it
+        If Not, do REST calls to BCF controllers to check it, and return as
+        soon as one of them answered
 
         :return: supported capability list
         """
@@ -519,46 +1168,65 @@ class ServerPool(object):
         if self.capabilities:
             return self.capabilities
         else:
-            return self.get_capabilities_force_update()
+            return self.get_capabilities_force_update(wait_all=False)
 
-    def get_capabilities_force_update(self):
+    def get_capabilities_force_update(self, wait_all=True):
         """Do REST calls to update capabilities
 
+        All servers are queried concurrently, the capabilities are updated
+        as their answers arrive.
+
         Logs a unicode change message when:
         1. the first time that plugin gets capabilities from BCF
         2. plugin notices the unicode mode is changed
 
+        :param wait_all: wait for all servers. Otherwise return as soon as
+                         capabilities are known, the answers of the other
+                         servers are merged in the background.
         :return: combined capability list from all servers
         """
-        # Servers should be the same version
-        # If one server is down, use online server's capabilities
-        capability_list = [set(server.get_capabilities())
-                           for server in self.servers]
+        pool = eventlet.GreenPool(len(self.servers))
+        known = event.Event()
+
+        def refresh(server):
+            server.get_capabilities()
+            if self._merge_capabilities() and not known.ready():
+                known.send()
+
+        def refreshed():
+            pool.waitall()
+            if not known.ready():
+                known.send()
+
+        for server in self.servers:
+            pool.spawn(refresh, server)
+        if wait_all:
+            refreshed()
+        else:
+            eventlet.spawn(refreshed)
+            known.wait()
 
-        new_capabilities = set.union(*capability_list)
+        # the separate consistency DB engine is recreated by workers forked
+        # after it was created, see cdb.get_engine_facade
+        LOG.debug("Consistency DB connection pool: %s", cdb.get_pool_stats())
 
-        self.log_unicode_status_change(new_capabilities)
-        self.capabilities = new_capabilities
-
-        # With multiple workers enabled, the fork may occur after the
-        # connections to the DB have been established. We need to clear the
-        # connections after the first attempt to call the backend to ensure
-        # that the established connections will all be local to the thread and
-        # not shared. Placing it here in the capabilities call is the easiest
-        # way to ensure that its done after everything is initialized and the
-        # first call to the backend is made.
-        # This is necessary in our plugin and not others because we have a
-        # completely separate DB connection for the consistency records. The
-        # main connection is made thread-safe in the neutron service init.
-        # https://github.com/openstack/neutron/blob/
-        # ec716b9e68b8b66a88218913ae4c9aa3a26b025a/neutron/wsgi.py#L104
-        if cdb.HashHandler._FACADE:
-            cdb.HashHandler._FACADE.get_engine().pool.dispose()
-
-        if not new_capabilities:
+        if not self.capabilities:
             LOG.error('Failed to get capabilities on any controller. ')
         return self.capabilities
 
+    def _merge_capabilities(self):
+        """Combine the cached capabilities of the servers
+
+        Servers should be the same version. If one server is down, the
+        capabilities of the online servers are used.
+        """
+        new_capabilities = set()
+        for server in self.servers:
+            new_capabilities.update(server.capabilities)
+        self.log_unicode_status_change(new_capabilities)
+        self.capabilities = new_capabilities
+        return new_capabilities
+
     def log_unicode_status_change(self, new_capabilities):
         """Log unicode status, if capabilities is initialized or if changed
 
@@ -598,12 +1266,13 @@ class ServerPool(object):
         True: enabled
         False: disabled
         """
-        if not self.get_capabilities():
+        # an in-memory lookup once the capabilities are known
+        capabilities = self.get_capabilities()
+        if not capabilities:
             msg = 'Capabilities unknown! Please check BCF controller status.'
             raise RemoteRestError(reason=msg)
 
-        if self.cfg_unicode_enabled and 'display-name' in \
-                self.get_capabilities():
+        if self.cfg_unicode_enabled and 'display-name' in capabilities:
             return True
         else:
             return False
@@ -719,11 +1388,56 @@ class ServerPool(object):
         """
         return resp[0] in SUCCESS_CODES
 
+    def _get_servers_by_health(self):
+        """Servers to try for a request, healthiest first
+
+        Servers with an open circuit are skipped. If all circuits are open,
+        the server closest to a retry is returned rather than none.
+        """
+        servers = sorted(self.servers, key=lambda x: x.health_sort_key())
+        available = [s for s in servers if s.breaker.allow_request()]
+        if not available:
+            available = [min(servers, key=lambda x: x.breaker.open_until)]
+            LOG.warning(_LW("ServerProxy: circuits of all servers are open, "
+                            "trying %s."), available[0].server)
+        return available
+
+    def _find_server(self, location):
+        """Find the server a redirect Location header points to"""
+        if not location:
+            return None
+        try:
+            parsed = urlparse.urlparse(location)
+            host, port = parsed.hostname, parsed.port
+        except ValueError:
+            return None
+        if not host:
+            return None
+        for server in self.servers:
+            if (server.server.lower() == host and
+                    (port is None or port == server.port)):
+                return server
+        return None
+
+    def _set_leader(self, server, reason):
+        if server is not self.leader:
+            LOG.info(_LI("ServerProxy: %(server)r is the cluster leader, "
+                         "learned from %(reason)s."),
+                     {'server': (server.server, server.port),
+                      'reason': reason})
+            self.leader = server
+
     def rest_call(self, action, resource, data, headers, ignore_codes,
                   timeout=False):
-        good_first = sorted(self.servers, key=lambda x: x.failed)
+        servers = self._get_servers_by_health()
+        is_write = action != 'GET'
+        if is_write and self.leader in servers:
+            # writes go straight to the leader, reads to any healthy server
+            servers.remove(self.leader)
+            servers.insert(0, self.leader)
         first_response = None
-        for active_server in good_first:
+        while servers:
+            active_server = servers.pop(0)
             LOG.debug("ServerProxy: %(action)s to servers: "
                       "%(server)r, %(resource)s",
                       {'action': action,
@@ -736,16 +1450,31 @@ class ServerPool(object):
                                               reconnect=self.always_reconnect)
                 if ret[0] != httplib.SERVICE_UNAVAILABLE:
                     break
+                if not active_server.breaker.allow_request():
+                    # circuit opened, move on to the next server
+                    break
                 eventlet.sleep(HTTP_SERVICE_UNAVAILABLE_RETRY_INTERVAL)
 
             # Store the first response as the error to be bubbled up to the
             # user since it was a good server. Subsequent servers will most
             # likely be cluster slaves and won't have a useful error for the
             # user (e.g. 302 redirect to master)
-            if not first_response:
+            if not first_response or first_response[0] in REDIRECT_CODES:
                 first_response = ret
+            if ret[0] in REDIRECT_CODES:
+                leader = self._find_server(active_server.redirect_location)
+                if leader is not None and leader is not active_server:
+                    # a healthy member that isn't the leader, retry on the
+                    # leader right away
+                    self._set_leader(leader, 'a redirect')
+                    if leader in servers:
+                        servers.remove(leader)
+                        servers.insert(0, leader)
+                    continue
             if not self.server_failure(ret, ignore_codes):
-                active_server.failed = False
+                active_server.record_result(True)
+                if is_write and ret[0] in SUCCESS_CODES:
+                    self._set_leader(active_server, 'a successful write')
                 LOG.debug("ServerProxy: %(action)s succeed for servers: "
                           "%(server)r Response: %(response)s",
                           {'action': action,
@@ -765,7 +1494,10 @@ class ServerPool(object):
                             "ret=%(ret)s, data=%(data)r",
                             {'status': ret[0], 'reason': ret[1],
                              'ret': ret[2], 'data': ret[3]})
-                active_server.failed = True
+                active_server.record_result(False)
+                if active_server is self.leader:
+                    # rediscover the leader with the next successful write
+                    self.leader = None
 
         # All servers failed, reset server list and try again next time
         LOG.error('ServerProxy: %(action)s failure for all servers: '
@@ -794,12 +1526,13 @@ class ServerPool(object):
             # Request wasn't success, nor can be ignored,
             # do a full synchronization if auto_sync_on_failure is True
             if (cfg.CONF.RESTPROXY.auto_sync_on_failure and
-                    resource != TOPOLOGY_PATH):
+                    resource not in (TOPOLOGY_PATH, TOPOLOGY_DELTA_PATH)):
                 LOG.error(_LE("NeutronRestProxyV2: Inconsistency with backend "
                               "controller, triggering full synchronization. "
                               "%(action)s %(resource)s."),
                           {'action': action, 'resource': resource})
-                sync_executed, topo_resp = self.force_topo_sync(check_ts=True)
+                sync_executed, topo_resp = self.force_topo_sync(
+                    check_ts=True, trigger=TOPO_SYNC_TRIGGER_REST_FAILURE)
                 if sync_executed:
                     return topo_resp
             # either topo_sync not executed or topo_sync itself failed
@@ -836,7 +1569,7 @@ class ServerPool(object):
                 tenant_name=obj['tenant_name'])
 
     def rest_create_tenant(self, tenant_id):
-        self._update_tenant_cache()
+        self._update_tenant(tenant_id)
         self._rest_create_tenant(tenant_id)
 
     def _rest_create_tenant(self, tenant_id):
@@ -858,6 +1591,8 @@ class ServerPool(object):
         self.rest_action('POST', resource, data, errstr)
 
     def rest_delete_tenant(self, tenant_id):
+        self.keystone_tenants.pop(tenant_id, None)
+        cdb.TenantCacheHandler().remove_tenant(tenant_id)
         resource = TENANT_PATH % tenant_id
         errstr = _("Unable to delete tenant: %s")
         self.rest_action('DELETE', resource, errstr=errstr)
@@ -956,9 +1691,51 @@ class ServerPool(object):
             return
         data["attachment"] = {"id": device_id,
                               "mac": port["mac_address"]}
+        if (self.port_batcher is not None and
+                PORT_BULK_CAPABILITY in self.get_capabilities()):
+            # wait for the batch so errors are raised like a single PUT
+            done = event.Event()
+            self.port_batcher.submit((tenant_id, net_id, data), done.send)
+            error = done.wait()
+            if error is not None:
+                raise error
+            return
         errstr = _("Unable to create remote port: %s")
         self.rest_action('PUT', resource, data, errstr)
 
+    def rest_create_ports(self, items):
+        """Create several port attachments in one request
+
+        :param items: list of (tenant_id, net_id, data) where data is the
+                      body of a single port attachment PUT
+        :return: list with None for each created port, or the
+                 RemoteRestError the controller reported for it
+        """
+        resource = PORT_ATTACHMENTS_PATH
+        data = {'ports': [dict(body, tenant_id=tenant_id, network_id=net_id)
+                          for tenant_id, net_id, body in items]}
+        errstr = _("Unable to create remote ports: %s")
+        resp = self.rest_action('POST', resource, data, errstr)
+        results = []
+        # the controller reports a status per port, in request order. Ports
+        # without one were created, also when a full sync took over.
+        statuses = []
+        if isinstance(resp[3], dict):
+            statuses = resp[3].get('ports') or []
+        for i in range(len(items)):
+            status = statuses[i] if i < len(statuses) else {}
+            code = status.get('status', httplib.OK)
+            if 200 <= code < 300:
+                results.append(None)
+            else:
+                reason = status.get('message', '')
+                LOG.error(_LE("Unable to create remote port %(port)s: "
+                              "%(reason)s"),
+                          {'port': items[i][2]['port']['id'],
+                           'reason': reason})
+                results.append(RemoteRestError(reason=reason, status=code))
+        return results
+
     def rest_delete_port(self, tenant_id, network_id, port_id):
         resource = ATTACHMENT_PATH % (tenant_id, network_id, port_id)
         errstr = _("Unable to delete remote port: %s")
@@ -1044,6 +1821,47 @@ class ServerPool(object):
                 LOG.exception("Encountered an error checking controller "
                               "health.")
 
+    def _health_watchdog(self, polling_interval=30):
+        """Probe the health of each server every polling_interval seconds
+
+        Keeps the latency used to order the servers up to date, and sends
+        the trial request of open circuits so that a recovered server is
+        used again without waiting for an API request to try it.
+        """
+        if not polling_interval:
+            LOG.warning("Health watchdog disabled by polling interval "
+                        "setting of %s.", polling_interval)
+            return
+        while True:
+            eventlet.sleep(polling_interval)
+            self.probe_servers()
+
+    def probe_servers(self):
+        servers = [server for server in self.servers
+                   if server.breaker.allow_request()]
+        self._call_servers(self._probe_server, servers)
+
+    def _probe_server(self, server):
+        try:
+            server.rest_call('GET', HEALTH_PATH)
+        except Exception:
+            LOG.exception("Encountered an error checking health of "
+                          "server %s.", server.server)
+
+    def _call_servers(self, func, servers=None):
+        """Call func(server) for the servers concurrently
+
+        A slow or unreachable server doesn't delay the others. func should
+        handle its own errors.
+
+        :return: list of the results, in the order of servers
+        """
+        servers = self.servers if servers is None else servers
+        if not servers:
+            return []
+        pool = eventlet.GreenPool(len(servers))
+        return list(pool.imap(func, servers))
+
     def _capability_watchdog(self, polling_interval=300):
         """Check capabilities based on polling_interval
 
@@ -1057,7 +1875,7 @@ class ServerPool(object):
             finally:
                 eventlet.sleep(polling_interval)
 
-    def force_topo_sync(self, check_ts=True):
+    def force_topo_sync(self, check_ts=True, trigger=TOPO_SYNC_TRIGGER_OTHER):
         """Execute a topology_sync between OSP and BCF.
 
         Topology sync collects all data from Openstack and pushes to BCF in
@@ -1075,8 +1893,19 @@ class ServerPool(object):
             part of the ignore_codes list
             (a) must check previous timestamp
 
+        Syncs that check the previous timestamp are sent as a delta against
+        the last synced topology if the controller supports it. Explicitly
+        requested syncs, and deltas rejected by the controller, push the
+        full topology.
+
+        Requests made while a topology sync is running in this worker are
+        merged into a single follow-up sync, and return its result. Requests
+        made by the running sync itself are skipped, as it already sends the
+        current topology.
+
         :param check_ts: boolean flag to check previous
                          timestamp < TOPO_SYNC_EXPIRED_SECS
+               trigger: what requested the sync, see TOPO_SYNC_TRIGGER_*
                prev_resp: a REST response tuple from the previous failed REST
                           call if available. If we skip topo_sync, return the
                           failure as previously observed.
@@ -1087,8 +1916,81 @@ class ServerPool(object):
                  response - tuple of the typical HTTP response from REST call
                         (response.status, response.reason, respstr, respdata)
         """
-        LOG.info(_LI('TOPO_SYNC requested with check_ts %s'), check_ts)
+        LOG.info(_LI('TOPO_SYNC requested by %(trigger)s with check_ts '
+                     '%(check_ts)s'),
+                 {'trigger': trigger, 'check_ts': check_ts})
+
+        if self.in_topo_sync():
+            LOG.info(_LI("TOPO_SYNC: requested by the running topo_sync. "
+                         "Skipping."))
+            return False, TOPO_RESPONSE_OK
+
+        if self._topo_sync_running:
+            request = self._topo_sync_pending
+            if request is None:
+                request = self._topo_sync_pending = TopoSyncRequest()
+            request.add(check_ts, trigger)
+            LOG.info(_LI("TOPO_SYNC: already in progress, merged into the "
+                         "next topo_sync with %(triggers)s."),
+                     {'triggers': dict(request.triggers)})
+            return request.done.wait()
+
+        request = TopoSyncRequest()
+        request.add(check_ts, trigger)
+        return self._run_topo_sync(request)
+
+    def in_topo_sync(self):
+        """Whether the current greenthread is part of a running topo_sync
+
+        Tenant syncs count as well, they hold the same lock.
+        """
+        return eventlet.getcurrent() in self._topo_sync_threads
+
+    def topo_sync_section(self, func):
+        """Wrap func to run in another greenthread of the running topo_sync
 
+        Collecting the topology may be split over several greenthreads. The
+        calls they make are recognized as part of the sync only if func is
+        wrapped by the greenthread running it.
+        """
+        if not self.in_topo_sync():
+            return func
+
+        def section(*args, **kwargs):
+            current = eventlet.getcurrent()
+            self._topo_sync_threads.add(current)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._topo_sync_threads.discard(current)
+        return section
+
+    def _run_topo_sync(self, request):
+        self._topo_sync_running = True
+        current = eventlet.getcurrent()
+        self._topo_sync_threads.add(current)
+        try:
+            result = self._topo_sync(request.check_ts, request.triggers)
+        except Exception as e:
+            request.done.send_exception(e)
+            raise
+        else:
+            request.done.send(result)
+            return result
+        finally:
+            self._topo_sync_threads.discard(current)
+            pending, self._topo_sync_pending = self._topo_sync_pending, None
+            self._topo_sync_running = pending is not None
+            if pending is not None:
+                eventlet.spawn(self._run_pending_topo_sync, pending)
+
+    def _run_pending_topo_sync(self, request):
+        try:
+            self._run_topo_sync(request)
+        except Exception:
+            LOG.exception("TOPO_SYNC: merged topo_sync failed.")
+
+    def _topo_sync(self, check_ts, triggers):
         if not self.get_topo_function:
             raise cfg.Error(_('Server requires synchronization, '
                               'but no topology function was defined.'))
@@ -1103,20 +2005,36 @@ class ServerPool(object):
 
         # else, perform topo_sync
         try:
+            hash_handler.put_topo_sync_triggers(triggers)
             LOG.debug("TOPO_SYNC: requested at %(request_ts)s started at "
                       "%(start_ts)s",
                       {'request_ts': cdb.convert_ts_to_datetime(curr_ts),
                        'start_ts': cdb.convert_ts_to_datetime(time.time())})
-            data = self.get_topo_function(
-                **self.get_topo_function_args)
+            data = self._get_topo_data()
             if not data:
                 # when keystone sync fails, it fails silently with data = None
                 # that is wrong, we need to raise an exception
                 raise Exception(_("TOPO_SYNC: failed to retrieve data."))
             LOG.debug("TOPO_SYNC: data received from OSP, sending "
                       "request to BCF.")
+            if check_ts and self._topo_sync_delta_supported():
+                resp = self._send_topo_sync_delta(hash_handler, data)
+                if resp:
+                    return True, resp
             errstr = _("Unable to perform forced topology_sync: %s")
-            return True, self.rest_action('POST', TOPOLOGY_PATH, data, errstr)
+            body = JSONBodySpool(data)
+            try:
+                resp = self.rest_action('POST', TOPOLOGY_PATH, body, errstr,
+                                        headers=self._topo_sync_headers(
+                                            hash_handler))
+            finally:
+                body.close()
+            if self._topo_sync_delta_supported():
+                # record the full state as the base for the next delta
+                hash_handler.update_topo_hashes(
+                    TopologyDelta(data, {}).get_updated_hashes(),
+                    replace=True)
+            return True, resp
         except Exception as e:
             # if encountered an exception, set to previous timestamp
             LOG.warning(_LW("TOPO_SYNC: Exception during topology sync. "
@@ -1130,17 +2048,215 @@ class ServerPool(object):
                          "consistency_db unlocked."),
                      str(diff))
 
-    def _ensure_tenant_cache(self, tenant_id):
-        if tenant_id not in self.keystone_tenants:
-            self._update_tenant_cache()
+    def _get_topo_data(self):
+        """Topology to sync
 
-    def _update_tenant_cache(self, reconcile=True, ratelimit=False):
-        if ratelimit is True and self._last_keystone_sync_time is not None:
-            if time.time() - self._last_keystone_sync_time <= \
-                    KEYSTONE_SYNC_RATE_LIMIT:
-                return
+        The snapshot is dropped once taken, so it isn't kept in memory
+        until the builder replaces it.
+
+        :return: the prebuilt snapshot if the DB revision it was built from
+                 is still current, else the freshly collected topology
+        """
+        snapshot, self._topo_snapshot = self._topo_snapshot, None
+        if snapshot and self.get_topo_revision_function:
+            if self.get_topo_revision_function() == snapshot[0]:
+                LOG.info(_LI("TOPO_SYNC: using topology snapshot of "
+                             "revision %s."), snapshot[0])
+                return snapshot[1]
+            LOG.debug("TOPO_SYNC: topology snapshot is outdated.")
+        return self.get_topo_function(**self.get_topo_function_args)
+
+    def _build_topo_snapshot(self):
+        """Collect the topology and keep it as snapshot
+
+        The revision is read before and after collecting. The topology is
+        kept as snapshot only if it didn't change in between, since it may
+        otherwise reflect part of the changes.
+        """
+        revision = self.get_topo_revision_function()
+        data = self.get_topo_function(**self.get_topo_function_args)
+        if data and self.get_topo_revision_function() == revision:
+            self._topo_snapshot = (revision, data)
+
+    def _topo_snapshot_builder(self, polling_interval=0):
+        """Prebuild the topology every polling_interval seconds
+
+        Collecting the topology reads every network, port and router. Doing
+        it ahead of time keeps it out of the TOPO_SYNC lock, which then
+        only has to be held to check the revision and send the snapshot.
+        """
+        if not polling_interval:
+            LOG.debug("Topology snapshot builder disabled by polling "
+                      "interval setting of %s.", polling_interval)
+            return
+        while True:
+            eventlet.sleep(polling_interval)
+            if not (self.get_topo_function and
+                    self.get_topo_revision_function):
+                continue
+            try:
+                snapshot = self._topo_snapshot
+                if (snapshot and snapshot[0] ==
+                        self.get_topo_revision_function()):
+                    continue
+                self._build_topo_snapshot()
+            except Exception:
+                LOG.exception("TOPO_SYNC: failed to build topology "
+                              "snapshot.")
+
+    def force_tenant_sync(self, tenant_id, trigger=TOPO_SYNC_TRIGGER_OTHER):
+        """Sync the topology of a single tenant between OSP and BCF
+
+        Only the networks, ports, routers, policies and security groups of
+        the tenant are collected and sent. Falls back to a full topology
+        sync if the controller doesn't support tenant syncs, the tenant sync
+        fails, or a full sync is running in this worker anyway.
 
+        :param tenant_id: tenant whose topology is synced
+               trigger: what requested the sync, see TOPO_SYNC_TRIGGER_*
+        :return: same as force_topo_sync
+        """
+        if (not self._topo_sync_running and self.get_topo_function and
+                TENANT_TOPOLOGY_CAPABILITY in self.get_capabilities()):
+            try:
+                resp = self._tenant_sync(tenant_id)
+                if resp:
+                    return True, resp
+            except Exception:
+                LOG.exception("TOPO_SYNC: tenant %s sync failed.", tenant_id)
+            LOG.warning(_LW("TOPO_SYNC: tenant %s sync failed, performing "
+                            "full sync."), tenant_id)
+        return self.force_topo_sync(trigger=trigger)
+
+    def _tenant_sync(self, tenant_id):
+        """Send the topology of a tenant
+
+        The TOPO_SYNC lock is held while collecting and sending it, so it
+        doesn't interleave with the topology syncs of other workers, and it
+        carries the fencing token of the lock. A tenant sync isn't a full
+        sync, the timestamp of the last topology sync is kept.
+
+        :return: response of the tenant sync, or None if it failed
+        """
+        hash_handler = cdb.HashHandler()
+        if not hash_handler.lock(check_ts=False):
+            return None
+        # syncs requested while collecting would wait for this lock
+        current = eventlet.getcurrent()
+        self._topo_sync_threads.add(current)
         try:
+            data = self.get_topo_function(tenant_id=tenant_id,
+                                          **self.get_topo_function_args)
+            if not data or not data['tenants']:
+                # unknown to keystone, sending it would remove the tenant
+                return None
+            LOG.info(_LI("TOPO_SYNC: sending topology of tenant %(tenant)s "
+                         "with %(networks)d networks."),
+                     {'tenant': tenant_id,
+                      'networks': len(data['networks'])})
+            resp = self.rest_call('POST', TENANT_TOPOLOGY_PATH % tenant_id,
+                                  data,
+                                  self._topo_sync_headers(hash_handler), [])
+        finally:
+            self._topo_sync_threads.discard(current)
+            hash_handler.unlock(set_prev_ts=True)
+        if not self.action_success(resp):
+            return None
+        return resp
+
+    def _topo_sync_delta_supported(self):
+        # use the cached capabilities, this must not trigger REST calls
+        return (cfg.CONF.RESTPROXY.topo_sync_delta and
+                TOPO_DELTA_CAPABILITY in self.capabilities)
+
+    def _topo_sync_headers(self, hash_handler):
+        if hash_handler.fencing_token is None:
+            return {}
+        return {TOPO_SYNC_TOKEN_HEADER: str(hash_handler.fencing_token)}
+
+    def _send_topo_sync_delta(self, hash_handler, data):
+        """Send only what changed since the last topology sync
+
+        :return: response of the delta sync, or None if a full sync is
+                 required
+        """
+        synced_hashes = hash_handler.get_topo_hashes()
+        if not synced_hashes:
+            LOG.info(_LI("TOPO_SYNC: no previously synced topology recorded, "
+                         "performing full sync."))
+            return None
+
+        delta = TopologyDelta(data, synced_hashes)
+        LOG.info(_LI("TOPO_SYNC: sending delta with %(updated)d updated and "
+                     "%(removed)d removed objects out of %(total)d."),
+                 {'updated': len(delta.updated),
+                  'removed': len(delta.removed),
+                  'total': len(delta.hashes)})
+        resp = self.rest_call('POST', TOPOLOGY_DELTA_PATH, delta.get_payload(),
+                              self._topo_sync_headers(hash_handler), [])
+        if resp[0] == httplib.CONFLICT:
+            LOG.warning(_LW("TOPO_SYNC: controller state does not match the "
+                            "last synced topology, performing full sync."))
+            return None
+        if not self.action_success(resp):
+            LOG.warning(_LW("TOPO_SYNC: delta sync failed with status "
+                            "%(status)s, performing full sync."),
+                        {'status': resp[0]})
+            return None
+
+        hash_handler.update_topo_hashes(delta.get_updated_hashes(),
+                                        removed=delta.removed)
+        return resp
+
+    def _ensure_tenant_cache(self, tenant_id, reconcile=True):
+        """Sync the tenant cache if tenant_id is not in it
+
+        Concurrent misses share a single sync. Tenant ids that are still
+        unknown after a sync are remembered for UNKNOWN_TENANT_TTL seconds
+        and don't trigger another one, so resources of a deleted tenant
+        cost one keystone sync rather than one per resource.
+        """
+        if tenant_id in self.keystone_tenants:
+            return
+        if self.in_topo_sync():
+            # the running topo_sync sends the tenants it collected, it must
+            # not create or delete them on BCF while doing so
+            reconcile = False
+        unknown_since = self._unknown_tenants.get(tenant_id)
+        if unknown_since is not None:
+            if time.time() - unknown_since < UNKNOWN_TENANT_TTL:
+                return
+            del self._unknown_tenants[tenant_id]
+
+        diff = None
+        generation = self._tenant_cache_generation
+        with self._tenant_cache_lock:
+            # skip the sync if another thread did one while we waited
+            if generation == self._tenant_cache_generation:
+                try:
+                    diff = self._refresh_tenant_cache(tenant_id=tenant_id)
+                except Exception:
+                    LOG.exception("Encountered an error syncing with "
+                                  "keystone.")
+                finally:
+                    self._last_keystone_sync_time = time.time()
+                self._tenant_cache_generation += 1
+        # reconciling creates tenants on BCF, which may look up tenants or
+        # start a topo_sync, so it is done without holding the lock
+        if reconcile and diff is not None:
+            try:
+                self._reconcile_tenants(diff)
+            except Exception:
+                LOG.exception("Encountered an error reconciling tenants "
+                              "with BCF.")
+        if tenant_id not in self.keystone_tenants:
+            LOG.debug("Tenant %s not found in keystone.", tenant_id)
+            self._unknown_tenants[tenant_id] = time.time()
+
+    def _get_keystone_client(self):
+        # the session re-authenticates by itself once its token expires, so
+        # one client is kept for the lifetime of the pool
+        if self._keystone_client is None:
             auth = v3.Password(auth_url=self.auth_url,
                                username=self.auth_user,
                                password=self.auth_password,
@@ -1148,33 +2264,45 @@ class ServerPool(object):
                                user_domain_name=self.user_domain_name,
                                project_domain_name=self.project_domain_name)
             sess = session.Session(auth=auth)
-            keystone_client = ksclient.Client(session=sess)
-            tenants = keystone_client.projects.list()
+            self._keystone_client = ksclient.Client(session=sess)
+        return self._keystone_client
 
-            if self.is_unicode_enabled():
-                new_cached_tenants = {tn.id: tn.name
-                                      for tn in tenants}
-            else:
-                new_cached_tenants = {tn.id: Util.format_resource_name(tn.name)
-                                      for tn in tenants}
-            # Add SERVICE_TENANT to handle hidden network for VRRP
-            new_cached_tenants[SERVICE_TENANT] = SERVICE_TENANT
-
-            LOG.debug("New TENANTS: %s \nPrevious Tenants %s",
-                      new_cached_tenants, self.keystone_tenants)
-            diff = DictDiffer(new_cached_tenants, self.keystone_tenants)
-            self.keystone_tenants = new_cached_tenants
-            if reconcile:
-                for tenant_id in diff.added():
-                    LOG.debug("TENANT create: id %s name %s",
-                              tenant_id, self.keystone_tenants[tenant_id])
-                    self._rest_create_tenant(tenant_id)
-                for tenant_id in diff.removed():
-                    LOG.debug("TENANT delete: id %s", tenant_id)
-                    self.rest_delete_tenant(tenant_id)
-                if diff.changed():
-                    LOG.debug("Tenant cache outdated. Forcing topo_sync.")
-                    self.force_topo_sync(check_ts=False)
+    def _format_tenants(self, tenants):
+        if self.is_unicode_enabled():
+            formatted = dict(tenants)
+        else:
+            formatted = {tenant_id: Util.format_resource_name(tenant_name)
+                         for tenant_id, tenant_name in tenants.items()}
+        # Add SERVICE_TENANT to handle hidden network for VRRP
+        formatted[SERVICE_TENANT] = SERVICE_TENANT
+        return formatted
+
+    def _update_tenant_cache(self, reconcile=True, ratelimit=False,
+                             refresh_after=KEYSTONE_SYNC_RATE_LIMIT):
+        """Sync the tenant cache with keystone
+
+        The cache is shared by all neutron workers through the DB. Only the
+        worker elected to refresh it lists the projects from keystone, and
+        only if no worker did so in the last refresh_after seconds. All other
+        workers load the shared cache instead.
+
+        :param reconcile: create and delete tenants on BCF according to the
+                          changes found by the keystone refresh
+        :param ratelimit: skip the sync if this worker synced within
+                          KEYSTONE_SYNC_RATE_LIMIT seconds
+        :param refresh_after: minimum age of the shared cache in seconds
+                              before it is refreshed from keystone
+        :return: True on success, False otherwise
+        """
+        if ratelimit is True and self._last_keystone_sync_time is not None:
+            if time.time() - self._last_keystone_sync_time <= \
+                    KEYSTONE_SYNC_RATE_LIMIT:
+                return
+
+        try:
+            diff = self._refresh_tenant_cache(refresh_after)
+            if reconcile and diff is not None:
+                self._reconcile_tenants(diff)
             return True
         except Exception:
             LOG.exception("Encountered an error syncing with keystone.")
@@ -1182,10 +2310,158 @@ class ServerPool(object):
         finally:
             self._last_keystone_sync_time = time.time()
 
+    def _refresh_tenant_cache(self, refresh_after=KEYSTONE_SYNC_RATE_LIMIT,
+                              tenant_id=None):
+        """Refresh keystone_tenants from keystone or the shared cache
+
+        :param tenant_id: tenant that is looked up in keystone by itself if
+                          the shared cache is loaded and doesn't have it
+        :return: DictDiffer of the changes fetched from keystone, None if the
+                 cache shared by the other workers was loaded instead
+        """
+        tenant_store = cdb.TenantCacheHandler()
+        cached_tenants = tenant_store.get_tenants()
+        if cached_tenants and not tenant_store.claim_refresh(refresh_after):
+            # refreshed recently or by another worker, the changes were
+            # already reconciled by the worker that fetched them
+            LOG.debug("Loading tenant cache shared by other workers.")
+            self.keystone_tenants = self._format_tenants(cached_tenants)
+            if tenant_id and tenant_id not in self.keystone_tenants:
+                # the shared cache may predate the tenant
+                try:
+                    self._fetch_tenant(tenant_id)
+                except ks_exceptions.NotFound:
+                    pass
+            return None
+
+        try:
+            tenants = {tn.id: tn.name for tn
+                       in self._get_keystone_client().projects.list()}
+        except Exception:
+            # rebuild the client in case its credentials changed
+            self._keystone_client = None
+            raise
+        tenant_store.replace_tenants(tenants)
+
+        new_cached_tenants = self._format_tenants(tenants)
+        previous_tenants = (self._format_tenants(cached_tenants)
+                            if cached_tenants else self.keystone_tenants)
+        LOG.debug("New TENANTS: %s \nPrevious Tenants %s",
+                  new_cached_tenants, previous_tenants)
+        self.keystone_tenants = new_cached_tenants
+        return DictDiffer(new_cached_tenants, previous_tenants)
+
+    def _reconcile_tenants(self, diff):
+        """Create and delete tenants on BCF according to a cache refresh"""
+        for tenant_id in diff.added():
+            LOG.debug("TENANT create: id %s name %s",
+                      tenant_id, self.keystone_tenants[tenant_id])
+            self._rest_create_tenant(tenant_id)
+        for tenant_id in diff.removed():
+            LOG.debug("TENANT delete: id %s", tenant_id)
+            self.rest_delete_tenant(tenant_id)
+        if diff.changed():
+            LOG.debug("Tenant cache outdated. Forcing topo_sync.")
+            self.force_topo_sync(check_ts=False,
+                                 trigger=TOPO_SYNC_TRIGGER_KEYSTONE)
+
+    def _update_tenant(self, tenant_id):
+        """Fetch a single project from keystone into the tenant cache
+
+        Used for keystone project notifications, instead of listing all
+        projects. A renamed project is resynced, as the resources of the
+        tenant carry its name.
+        """
+        if tenant_id == SERVICE_TENANT:
+            # not a keystone project, see _format_tenants
+            return
+        try:
+            previous_name = self._fetch_tenant(tenant_id)
+        except Exception:
+            LOG.exception("Encountered an error fetching tenant %s from "
+                          "keystone, syncing all tenants.", tenant_id)
+            self._update_tenant_cache(reconcile=False)
+            return
+        if (previous_name is not None and
+                previous_name != self.keystone_tenants[tenant_id]):
+            LOG.debug("Tenant %s renamed. Forcing topo_sync.", tenant_id)
+            self.force_topo_sync(check_ts=False,
+                                 trigger=TOPO_SYNC_TRIGGER_KEYSTONE)
+
+    def _fetch_tenant(self, tenant_id):
+        """Fetch a single project from keystone into the tenant cache
+
+        :return: name the project had in the cache, None if it wasn't cached
+        :raises: keystoneauth1 NotFound if keystone doesn't know the project
+        """
+        try:
+            project = self._get_keystone_client().projects.get(tenant_id)
+        except ks_exceptions.NotFound:
+            raise
+        except Exception:
+            # rebuild the client in case its credentials changed
+            self._keystone_client = None
+            raise
+        cdb.TenantCacheHandler().update_tenant(project.id, project.name)
+        previous_name = self.keystone_tenants.get(project.id)
+        formatted = self._format_tenants({project.id: project.name})
+        self.keystone_tenants[project.id] = formatted[project.id]
+        self._unknown_tenants.pop(project.id, None)
+        return previous_name
+
     def _keystone_sync(self, polling_interval=300):
         while True:
             eventlet.sleep(polling_interval)
-            self._update_tenant_cache()
+            self._update_tenant_cache(refresh_after=polling_interval)
+
+
+class SSLContextCache(object):
+    """SSL context shared by all connections to a controller
+
+    Building an SSLContext parses the combined certificate file, so it is
+    done once per controller and only redone when the file changes on disk.
+    TLS sessions are not resumed; every new connection does a full handshake.
+    """
+
+    def __init__(self, combined_cert):
+        # If combined_cert is None, connections will continue without any
+        # certificate validation.
+        self.combined_cert = combined_cert
+        self.context = None
+        self.cert_mtime = None
+        self._lock = eventlet.semaphore.Semaphore()
+
+    def _get_cert_mtime(self):
+        if not self.combined_cert:
+            return None
+        try:
+            return os.stat(self.combined_cert).st_mtime
+        except OSError:
+            return None
+
+    def _create_context(self):
+        context = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
+        # certificates are pinned per controller address, hostnames are
+        # not validated
+        context.check_hostname = False
+        if self.combined_cert:
+            context.verify_mode = ssl.CERT_REQUIRED
+            context.load_verify_locations(cafile=self.combined_cert)
+        else:
+            context.verify_mode = ssl.CERT_NONE
+        return context
+
+    def get_context(self):
+        mtime = self._get_cert_mtime()
+        with self._lock:
+            if self.context is None or mtime != self.cert_mtime:
+                LOG.debug("Loading SSL context from %s", self.combined_cert)
+                self.context = self._create_context()
+                self.cert_mtime = mtime
+            return self.context
+
+    def wrap_socket(self, sock):
+        return self.get_context().wrap_socket(sock)
 
 
 class HTTPSConnectionWithValidation(httplib.HTTPSConnection):
@@ -1193,6 +2469,9 @@ class HTTPSConnectionWithValidation(httplib.HTTPSConnection):
     # If combined_cert is None, the connection will continue without
     # any certificate validation.
     combined_cert = None
+    # If set, the cached SSL context of the controller is used instead of
+    # building a new one for each connection.
+    ssl_context_cache = None
 
     def connect(self):
         sock = socket.create_connection((self.host, self.port),
@@ -1201,7 +2480,9 @@ class HTTPSConnectionWithValidation(httplib.HTTPSConnection):
             self.sock = sock
             self._tunnel()
 
-        if self.combined_cert:
+        if self.ssl_context_cache:
+            self.sock = self.ssl_context_cache.wrap_socket(sock)
+        elif self.combined_cert:
             self.sock = ssl.wrap_socket(sock, self.key_file, self.cert_file,
                                         cert_reqs=ssl.CERT_REQUIRED,
                                         ca_certs=self.combined_cert,
@@ -0,0 +1,212 @@
+# Copyright 2018 Big Switch Networks, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+import collections
+
+import eventlet.semaphore
+
+from neutron_lib.api.definitions import external_net as extnet_apidef
+from neutron_lib import constants as const
+from neutron_lib import context as qcontext
+
+
+class TopologyCollector(object):
+    """TopologyCollector
+
+    Bulk loader for the resources that make up a topology sync. Each resource
+    type is fetched with a single query the first time it is needed and then
+    indexed in memory, so building the topology costs a constant number of
+    DB round trips instead of several per network, port and router.
+
+    If tenant_id is given, only the networks of that tenant and their
+    subnets, ports and floating ips are loaded. Resources of other tenants
+    that they refer to, like the external network of a router gateway, are
+    fetched by id when looked up.
+
+    The collector can be shared by greenthreads collecting different
+    sections of the topology. Each query is made with its own admin
+    context, and each resource type is loaded once even if several
+    greenthreads need it at the same time.
+    """
+
+    def __init__(self, core_plugin, l3_plugin=None, tenant_id=None):
+        self.core_plugin = core_plugin
+        self.l3_plugin = l3_plugin
+        self.tenant_id = tenant_id
+        self._networks = None
+        self._networks_by_id = None
+        self._subnets_by_id = None
+        self._subnets_by_network = None
+        self._ports_by_id = None
+        self._ports_by_network = None
+        self._router_ports = None
+        self._floatingips_by_network = None
+        # networks whose subnets and routers whose interfaces are all
+        # loaded, when collecting a single tenant
+        self._subnets_loaded = set()
+        self._router_ports_loaded = set()
+        self._loading = collections.defaultdict(eventlet.semaphore.Semaphore)
+        self._memo = collections.defaultdict(dict)
+
+    def memoize(self, kind, key, build):
+        """Result of build() for key, built once per collector and key
+
+        Lets callers derive objects from the collected resources once per
+        topology sync, e.g. the controller representation of a network that
+        is needed by the network section and by every router attached to it.
+        Builds of the same kind are serialized, so greenthreads asking for a
+        key that is being built wait for it instead of building it again.
+        build() must not memoize objects of the same kind.
+        """
+        memo = self._memo[kind]
+        if key not in memo:
+            with self._loading[('memo', kind)]:
+                if key not in memo:
+                    memo[key] = build()
+        return memo[key]
+
+    @staticmethod
+    def _get_context():
+        # a context per query, so that greenthreads don't share DB sessions
+        return qcontext.get_admin_context()
+
+    def _network_filters(self, key):
+        """Filters restricting a query to the networks being collected"""
+        if not self.tenant_id:
+            return None
+        return {key: [net['id'] for net in self.get_networks()]}
+
+    def get_networks(self):
+        if self._networks is None:
+            with self._loading['networks']:
+                if self._networks is None:
+                    filters = ({'tenant_id': [self.tenant_id]}
+                               if self.tenant_id else None)
+                    networks = (self.core_plugin.get_networks(
+                        self._get_context(), filters=filters) or [])
+                    self._networks_by_id = dict((net['id'], net)
+                                                for net in networks)
+                    self._networks = networks
+        return self._networks
+
+    def get_network(self, net_id):
+        self.get_networks()
+        if self.tenant_id and net_id and net_id not in self._networks_by_id:
+            networks = self.core_plugin.get_networks(
+                self._get_context(), filters={'id': [net_id]}) or []
+            self._networks_by_id[net_id] = networks[0] if networks else None
+        return self._networks_by_id.get(net_id)
+
+    def is_external(self, net_id):
+        network = self.get_network(net_id)
+        return bool(network and network.get(extnet_apidef.EXTERNAL))
+
+    def _index_subnets(self, subnets):
+        for subnet in subnets or []:
+            if subnet['id'] in self._subnets_by_id:
+                continue
+            self._subnets_by_id[subnet['id']] = subnet
+            self._subnets_by_network[subnet['network_id']].append(subnet)
+
+    def _load_subnets(self):
+        if self._subnets_by_id is not None:
+            return
+        with self._loading['subnets']:
+            if self._subnets_by_id is not None:
+                return
+            subnets = self.core_plugin.get_subnets(
+                self._get_context(),
+                filters=self._network_filters('network_id'))
+            if self.tenant_id:
+                self._subnets_loaded.update(net['id']
+                                            for net in self.get_networks())
+            self._subnets_by_network = collections.defaultdict(list)
+            self._subnets_by_id = {}
+            self._index_subnets(subnets)
+
+    def get_subnet(self, subnet_id):
+        self._load_subnets()
+        if self.tenant_id and subnet_id not in self._subnets_by_id:
+            self._index_subnets(self.core_plugin.get_subnets(
+                self._get_context(), filters={'id': [subnet_id]}))
+        return self._subnets_by_id.get(subnet_id)
+
+    def get_subnets_for_network(self, net_id):
+        self._load_subnets()
+        if self.tenant_id and net_id not in self._subnets_loaded:
+            # subnets of a network of another tenant, fetched once
+            self._subnets_loaded.add(net_id)
+            self._index_subnets(self.core_plugin.get_subnets(
+                self._get_context(), filters={'network_id': [net_id]}))
+        return self._subnets_by_network.get(net_id, [])
+
+    def _index_ports(self, ports):
+        for port in ports or []:
+            if port['id'] in self._ports_by_id:
+                continue
+            self._ports_by_id[port['id']] = port
+            self._ports_by_network[port['network_id']].append(port)
+            if port.get('device_owner') == const.DEVICE_OWNER_ROUTER_INTF:
+                self._router_ports[port.get('device_id')].append(port)
+
+    def _load_ports(self):
+        if self._ports_by_id is not None:
+            return
+        with self._loading['ports']:
+            if self._ports_by_id is not None:
+                return
+            ports = self.core_plugin.get_ports(
+                self._get_context(),
+                filters=self._network_filters('network_id'))
+            self._ports_by_network = collections.defaultdict(list)
+            self._router_ports = collections.defaultdict(list)
+            self._ports_by_id = {}
+            self._index_ports(ports)
+
+    def get_port(self, port_id):
+        self._load_ports()
+        if self.tenant_id and port_id and port_id not in self._ports_by_id:
+            self._index_ports(self.core_plugin.get_ports(
+                self._get_context(), filters={'id': [port_id]}))
+        return self._ports_by_id.get(port_id)
+
+    def get_ports_for_network(self, net_id):
+        self._load_ports()
+        return self._ports_by_network.get(net_id, [])
+
+    def get_router_interface_ports(self, router_id):
+        self._load_ports()
+        if self.tenant_id and router_id not in self._router_ports_loaded:
+            # including interfaces on networks of other tenants
+            self._router_ports_loaded.add(router_id)
+            self._index_ports(self.core_plugin.get_ports(
+                self._get_context(),
+                filters={'device_id': [router_id],
+                         'device_owner': [const.DEVICE_OWNER_ROUTER_INTF]}))
+        return self._router_ports.get(router_id, [])
+
+    def get_floatingips_for_network(self, net_id):
+        if self._floatingips_by_network is None:
+            with self._loading['floatingips']:
+                if self._floatingips_by_network is None:
+                    fl_ips = (self.l3_plugin.get_floatingips(
+                        self._get_context(),
+                        filters=self._network_filters('floating_network_id'))
+                        if self.l3_plugin else [])
+                    floatingips_by_network = collections.defaultdict(list)
+                    for flip in fl_ips or []:
+                        floatingips_by_network[
+                            flip['floating_network_id']].append(flip)
+                    self._floatingips_by_network = floatingips_by_network
+        return self._floatingips_by_network.get(net_id, [])
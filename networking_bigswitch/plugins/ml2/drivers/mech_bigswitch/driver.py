@@ -12,7 +12,6 @@
 #    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
 #    License for the specific language governing permissions and limitations
 #    under the License.
-import copy
 import datetime
 import httplib
 import os
@@ -30,12 +29,12 @@ from neutron_lib.callbacks import events
 from neutron_lib.callbacks import registry
 from neutron_lib.callbacks import resources
 from neutron_lib import constants as const
-from neutron_lib import context as ctx
 from neutron_lib.plugins import directory
 from neutron_lib.plugins.ml2 import api
 from neutron_lib import rpc as lib_rpc
 
 from networking_bigswitch.plugins.bigswitch import config as pl_config
+from networking_bigswitch.plugins.bigswitch import dispatcher
 from networking_bigswitch.plugins.bigswitch.i18n import _
 from networking_bigswitch.plugins.bigswitch.i18n import _LE
 from networking_bigswitch.plugins.bigswitch.i18n import _LI
@@ -115,6 +114,12 @@ class BigSwitchMechanismDriver(plugin.NeutronRestProxyV2Base,
         # register plugin config opts
         pl_config.register_config()
         self.evpool = eventlet.GreenPool(cfg.CONF.RESTPROXY.thread_pool_size)
+        # queue for sending postcommit updates in the background
+        self.dispatcher = None
+        if cfg.CONF.RESTPROXY.async_dispatch:
+            self.dispatcher = dispatcher.DispatchQueue(
+                cfg.CONF.RESTPROXY.thread_pool_size,
+                cfg.CONF.RESTPROXY.async_dispatch_queue_size)
 
         # init network ctrl connections
         self.servers = servermanager.ServerPool()
@@ -123,10 +128,13 @@ class BigSwitchMechanismDriver(plugin.NeutronRestProxyV2Base,
                                                'get_floating_ips': True,
                                                'get_routers': True,
                                                'get_sgs': True}
+        self.servers.get_topo_revision_function = self._get_topology_revision
         # perform one forced topo_sync after 60secs. delayed to let plugin
         # initialization complete
-        eventlet.spawn_after(60, self.servers.force_topo_sync,
-                             **{'check_ts': True})
+        eventlet.spawn_after(
+            60, self.servers.force_topo_sync,
+            **{'check_ts': True,
+               'trigger': servermanager.TOPO_SYNC_TRIGGER_STARTUP})
 
         self.segmentation_types = ', '.join(cfg.CONF.ml2.type_drivers)
         # if os-net-config is present, attempt to read physnet bridge_mappings
@@ -140,6 +148,29 @@ class BigSwitchMechanismDriver(plugin.NeutronRestProxyV2Base,
 
         LOG.debug("Initialization done")
 
+    def _dispatch(self, key, func, *args, **kwargs):
+        """Send an update to the controller
+
+        The update is sent in the background if async_dispatch is enabled,
+        otherwise func is called right away.
+
+        :param key: (resource, id) of the object the update is for. Port
+                    updates use the key of their network, so they are
+                    never sent before its create or after its delete
+        :param args: arguments of func, they must not be modified afterwards
+        :param coalesce: queued updates with the same key and coalesce value
+                         are superseded by this one
+        """
+        if self.dispatcher is None:
+            return func(*args)
+        self.dispatcher.dispatch(key, func, args,
+                                 coalesce=kwargs.get('coalesce'))
+
+    def _dispatch_context(self, context):
+        # request contexts must not be used once the request is finished,
+        # background updates read the DB with an admin context instead
+        return context if self.dispatcher is None else None
+
     def setup_rpc_callbacks(self):
         # Security group operations are split between callback and RPC
         # notifications mechanism.
@@ -191,14 +222,19 @@ class BigSwitchMechanismDriver(plugin.NeutronRestProxyV2Base,
         if security_group and context:
             sg_id = security_group.get('id')
             LOG.debug("Callback create sg_id: %s", sg_id)
-            self.bsn_create_security_group(sg_id=sg_id, context=context)
+            self._dispatch(('securitygroup', sg_id),
+                           self.bsn_create_security_group, sg_id,
+                           None, self._dispatch_context(context),
+                           coalesce='update')
 
     def bsn_delete_sg_callback(self, resource, event, trigger, **kwargs):
         sg_id = kwargs.get('security_group_id')
         context = kwargs.get('context')
         if sg_id and context:
             LOG.debug("Callback delete sg_id: %s", sg_id)
-            self.bsn_delete_security_group(sg_id=sg_id, context=context)
+            self._dispatch(('securitygroup', sg_id),
+                           self.bsn_delete_security_group, sg_id,
+                           self._dispatch_context(context))
 
     def bsn_update_sg_callback(self, resource, event, trigger, **kwargs):
         security_group = kwargs.get('security_group')
@@ -206,7 +242,10 @@ class BigSwitchMechanismDriver(plugin.NeutronRestProxyV2Base,
         if security_group and context:
             sg_id = security_group.get('id')
             LOG.debug("Callback update sg_id: %s", sg_id)
-            self.bsn_create_security_group(sg_id=sg_id, context=context)
+            self._dispatch(('securitygroup', sg_id),
+                           self.bsn_create_security_group, sg_id,
+                           None, self._dispatch_context(context),
+                           coalesce='update')
 
     def bsn_create_sg_rule_callback(self, resource, event, trigger, **kwargs):
         rule = kwargs.get('security_group_rule')
@@ -214,7 +253,10 @@ class BigSwitchMechanismDriver(plugin.NeutronRestProxyV2Base,
         if rule and context:
             sg_id = rule.get('security_group_id')
             LOG.debug("Callback create rule in sg_id: %s", sg_id)
-            self.bsn_create_security_group(sg_id=sg_id, context=context)
+            self._dispatch(('securitygroup', sg_id),
+                           self.bsn_create_security_group, sg_id,
+                           None, self._dispatch_context(context),
+                           coalesce='update')
 
     def bsn_delete_sg_rule(self, sg_rule, context):
         LOG.debug("Deleting security group rule from BCF: %s", sg_rule)
@@ -285,7 +327,8 @@ class BigSwitchMechanismDriver(plugin.NeutronRestProxyV2Base,
     @add_debug_log
     def create_network_postcommit(self, context):
         # create network on the network controller
-        self._send_create_network(context.current)
+        self._dispatch(('network', context.current['id']),
+                       self._send_create_network, dict(context.current))
 
     @add_debug_log
     def update_network_precommit(self, context):
@@ -294,7 +337,9 @@ class BigSwitchMechanismDriver(plugin.NeutronRestProxyV2Base,
     @add_debug_log
     def update_network_postcommit(self, context):
         # update network on the network controller
-        self._send_update_network(context.current)
+        self._dispatch(('network', context.current['id']),
+                       self._send_update_network, dict(context.current),
+                       coalesce='update')
 
     @add_debug_log
     def update_subnet_postcommit(self, context):
@@ -309,14 +354,15 @@ class BigSwitchMechanismDriver(plugin.NeutronRestProxyV2Base,
         self._trigger_network_update_from_subnet_transaction(context)
 
     def _trigger_network_update_from_subnet_transaction(self, context):
-        net = directory.get_plugin().get_network(
-            ctx.get_admin_context(), context.current['network_id'])
-        self._send_update_network(net)
+        net_id = context.current['network_id']
+        self._dispatch(('network', net_id), self._schedule_network_update,
+                       net_id, coalesce='update')
 
     @add_debug_log
     def delete_network_postcommit(self, context):
         # delete network on the network controller
-        self._send_delete_network(context.current)
+        self._dispatch(('network', context.current['id']),
+                       self._send_delete_network, dict(context.current))
 
     @add_debug_log
     def create_port_postcommit(self, context):
@@ -349,8 +395,11 @@ class BigSwitchMechanismDriver(plugin.NeutronRestProxyV2Base,
             if port[portbindings.VIF_TYPE] == portbindings.VIF_TYPE_VHOST_USER:
                 return
 
-            self.async_port_create(port["network"]["tenant_id"],
-                                   port["network"]["id"], port)
+            self._dispatch(('network', port["network"]["id"]),
+                           self.async_port_create,
+                           port["network"]["tenant_id"],
+                           port["network"]["id"], port,
+                           coalesce=('update', port['id']))
 
     @add_debug_log
     def update_port_postcommit(self, context):
@@ -367,9 +416,9 @@ class BigSwitchMechanismDriver(plugin.NeutronRestProxyV2Base,
             LOG.debug("update_port_postcommmit called for SRIOV port VM "
                       "detach case.")
             # remove port from BCF and return
-            self.servers.rest_delete_port(network["tenant_id"],
-                                          network["id"],
-                                          port["id"])
+            self._dispatch(('network', network['id']),
+                           self.servers.rest_delete_port,
+                           network["tenant_id"], network["id"], port["id"])
             return
 
         # Else: regular port update,
@@ -382,23 +431,29 @@ class BigSwitchMechanismDriver(plugin.NeutronRestProxyV2Base,
             return
 
         if port:
-            try:
-                # For SR-IOV ports, we shouldn't update the port status
-                update_status = not self._is_port_sriov(port)
-                self.async_port_create(port["network"]["tenant_id"],
-                                       port["network"]["id"], port,
-                                       update_status)
-            except servermanager.RemoteRestError as e:
-                with excutils.save_and_reraise_exception() as ctxt:
-                    if (cfg.CONF.RESTPROXY.auto_sync_on_failure and
-                            e.status == httplib.NOT_FOUND and
-                            servermanager.NXNETWORK in e.reason):
-                        ctxt.reraise = False
-                        LOG.error("Inconsistency with backend controller "
-                                  "triggering full synchronization.")
-                        self._send_all_data_auto(
-                            triggered_by_tenant=port["network"]["tenant_id"]
-                        )
+            # For SR-IOV ports, we shouldn't update the port status
+            update_status = not self._is_port_sriov(port)
+            self._dispatch(('network', port["network"]["id"]),
+                           self._send_update_port, port, update_status,
+                           coalesce=('update', port['id']))
+
+    def _send_update_port(self, port, update_status):
+        try:
+            self.async_port_create(port["network"]["tenant_id"],
+                                   port["network"]["id"], port,
+                                   update_status)
+        except servermanager.RemoteRestError as e:
+            with excutils.save_and_reraise_exception() as ctxt:
+                if (cfg.CONF.RESTPROXY.auto_sync_on_failure and
+                        e.status == httplib.NOT_FOUND and
+                        servermanager.NXNETWORK in e.reason):
+                    ctxt.reraise = False
+                    LOG.error("Inconsistency with backend controller "
+                              "triggering full synchronization.")
+                    self._send_all_data_auto(
+                        triggered_by_tenant=port["network"]["tenant_id"],
+                        trigger=servermanager.TOPO_SYNC_TRIGGER_NXNETWORK
+                    )
 
     @add_debug_log
     def delete_port_postcommit(self, context):
@@ -412,17 +467,17 @@ class BigSwitchMechanismDriver(plugin.NeutronRestProxyV2Base,
         tenant_id = net['tenant_id']
         if not tenant_id:
             tenant_id = servermanager.SERVICE_TENANT
-        self.servers.rest_delete_port(tenant_id, net["id"], port['id'])
+        self._dispatch(('network', net['id']), self.servers.rest_delete_port,
+                       tenant_id, net["id"], port['id'])
 
     def _prepare_port_for_controller(self, context):
         """Make a copy so the context isn't changed for other drivers
 
         :exception can throw servermanager.TenantIDNotFound
         """
-        port = copy.deepcopy(context.current)
         net = context.network.current
-        port['network'] = net
-        port['bound_segment'] = context.top_bound_segment
+        port = dict(context.current, network=net,
+                    bound_segment=context.top_bound_segment)
         prepped_port = self._map_display_name_or_tenant(port)
         if prepped_port.get('description'):
             del (prepped_port['description'])
@@ -56,6 +56,29 @@ class CapabilitiesTests(test_router_db.RouterDBTestBase):
                 [mock.call(fip['tenant_id'], fip['id'])]
             )
 
+    def test_floating_ip_capability_disassociate(self):
+        with\
+            mock.patch(SERVERRESTCALL,
+                       return_value=(200, None, '["floatingip"]', None)),\
+            mock.patch(SERVERPOOL + '.rest_update_floatingip',
+                       return_value=(200, None, None, None)) as mock_update,\
+            mock.patch(SERVERPOOL + '.rest_update_network',
+                       return_value=(200, None, None, None)) as mock_netupdate:
+            with self.floatingip_with_assoc() as fip:
+                mock_netupdate.reset_mock()
+                l3_plugin = directory.get_plugin(plugin_constants.L3)
+                l3_plugin.disassociate_floatingips(
+                    context.get_admin_context(),
+                    fip['floatingip']['port_id'])
+                # only the disassociated floating ip is sent
+                mock_update.assert_called_once_with(
+                    fip['floatingip']['tenant_id'], mock.ANY,
+                    fip['floatingip']['id'])
+                sent_fip = mock_update.call_args[0][1]
+                self.assertIsNone(sent_fip['port_id'])
+                self.assertIn('floating_mac_address', sent_fip)
+                mock_netupdate.assert_not_called()
+
     def test_floating_ip_capability_neg(self):
         with\
             mock.patch(SERVERRESTCALL,
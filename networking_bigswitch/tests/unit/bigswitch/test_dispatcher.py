@@ -0,0 +1,151 @@
+# Copyright 2018 Big Switch Networks, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import eventlet
+from eventlet import event
+
+from neutron.tests import base
+
+from networking_bigswitch.plugins.bigswitch import dispatcher
+
+
+class DispatchQueueTests(base.BaseTestCase):
+
+    def setUp(self):
+        super(DispatchQueueTests, self).setUp()
+        self.queue = dispatcher.DispatchQueue(4, 100)
+        self.calls = []
+
+    def _call(self, name):
+        # yield so other keys get to run in between
+        eventlet.sleep(0)
+        self.calls.append(name)
+
+    def test_same_key_in_order(self):
+        for i in range(5):
+            self.queue.dispatch('port1', self._call, ('update%d' % i,))
+        self.queue.waitall()
+        self.assertEqual(['update%d' % i for i in range(5)], self.calls)
+        self.assertEqual(0, self.queue.pending())
+
+    def test_coalesce_queued_updates(self):
+        self.queue.dispatch('port1', self._call, ('create',))
+        for i in range(5):
+            self.queue.dispatch('port1', self._call, ('update%d' % i,),
+                                coalesce='update')
+        self.queue.dispatch('port1', self._call, ('delete',))
+        self.queue.waitall()
+        # updates supersede each other, but never the create or delete
+        self.assertEqual(['create', 'update4', 'delete'], self.calls)
+
+    def test_coalesce_interleaved_updates(self):
+        self.queue.dispatch('net1', self._call, ('create',))
+        for i in range(3):
+            for port in ('portA', 'portB'):
+                self.queue.dispatch('net1', self._call,
+                                    ('%s-update%d' % (port, i),),
+                                    coalesce=('update', port))
+        self.queue.dispatch('net1', self._call, ('portA-delete',))
+        self.queue.dispatch('net1', self._call, ('portA-update3',),
+                            coalesce=('update', 'portA'))
+        self.queue.waitall()
+        # updates of a port supersede each other across the updates of
+        # other ports, but never across a call that doesn't coalesce
+        self.assertEqual(['create', 'portA-update2', 'portB-update2',
+                          'portA-delete', 'portA-update3'], self.calls)
+        self.assertEqual(0, self.queue.pending())
+
+    def test_failed_call_does_not_block_key(self):
+        def fail():
+            raise Exception('controller down')
+
+        self.queue.dispatch('net1', fail)
+        self.queue.dispatch('net1', self._call, ('update',))
+        self.queue.waitall()
+        self.assertEqual(['update'], self.calls)
+
+    def test_backpressure(self):
+        queue = dispatcher.DispatchQueue(4, 2)
+        blocker = event.Event()
+        queue.dispatch('net1', blocker.wait)
+        queue.dispatch('net2', blocker.wait)
+        waiter = eventlet.spawn(queue.dispatch, 'net3', self._call, ('net3',))
+        eventlet.sleep(0)
+        # the third dispatch waits for a free slot
+        self.assertEqual(2, queue.pending())
+        blocker.send()
+        waiter.wait()
+        queue.waitall()
+        self.assertEqual(['net3'], self.calls)
+
+
+class DebouncerTests(base.BaseTestCase):
+
+    def test_merge_calls_within_window(self):
+        debouncer = dispatcher.Debouncer(0.01)
+        calls = []
+        for i in range(10):
+            debouncer.schedule('net1', calls.append, 'net1-%d' % i)
+        debouncer.schedule('net2', calls.append, 'net2')
+        self.assertEqual([], calls)
+        eventlet.sleep(0.05)
+        self.assertEqual(['net1-9', 'net2'], sorted(calls))
+
+        # calls after the window start a new one
+        debouncer.schedule('net1', calls.append, 'net1-again')
+        eventlet.sleep(0.05)
+        self.assertEqual('net1-again', calls[-1])
+
+
+class MicroBatcherTests(base.BaseTestCase):
+
+    def setUp(self):
+        super(MicroBatcherTests, self).setUp()
+        self.batches = []
+        self.results = []
+
+    def _process(self, items):
+        self.batches.append(items)
+        return [item * 2 for item in items]
+
+    def test_batch_within_window(self):
+        batcher = dispatcher.MicroBatcher(self._process, 0.01, 100)
+        for i in range(5):
+            batcher.submit(i, self.results.append)
+        self.assertEqual([], self.batches)
+        eventlet.sleep(0.05)
+        self.assertEqual([[0, 1, 2, 3, 4]], self.batches)
+        self.assertEqual([0, 2, 4, 6, 8], self.results)
+
+    def test_batch_max_size(self):
+        batcher = dispatcher.MicroBatcher(self._process, 10, 2)
+        for i in range(4):
+            batcher.submit(i, self.results.append)
+        eventlet.sleep(0)
+        # full batches don't wait for the window
+        self.assertEqual([[0, 1], [2, 3]], self.batches)
+        self.assertEqual([0, 2, 4, 6], self.results)
+
+    def test_failed_batch(self):
+        error = Exception('controller down')
+
+        def fail(items):
+            raise error
+
+        batcher = dispatcher.MicroBatcher(fail, 0.01, 100)
+        batcher.submit(1, self.results.append)
+        batcher.submit(2, self.results.append)
+        eventlet.sleep(0.05)
+        self.assertEqual([error, error], self.results)
@@ -14,6 +14,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import eventlet
+from eventlet import event
 import mock
 from oslo_config import cfg
 import webob.exc
@@ -25,12 +27,15 @@ from neutron.tests.unit.db import test_db_base_plugin_v2 as test_plugin
 from neutron_lib.api.definitions import portbindings
 from neutron_lib import constants
 from neutron_lib import context
+from neutron_lib import exceptions as n_exc
 from neutron_lib.plugins import directory
 
 from networking_bigswitch.plugins.bigswitch import config as pl_config
 from networking_bigswitch.plugins.bigswitch import constants as bsn_constants
+from networking_bigswitch.plugins.bigswitch import servermanager
 from networking_bigswitch.plugins.bigswitch.servermanager import\
     TenantIDNotFound
+from networking_bigswitch.plugins.bigswitch import topology
 from networking_bigswitch.tests.unit.bigswitch import fake_server
 from networking_bigswitch.tests.unit.bigswitch \
     import test_base as bsn_test_base
@@ -225,7 +230,8 @@ class TestBigSwitchProxyPortsV2(test_plugin.TestPortsV2,
                 plugin.evpool.waitall()
         call = mock.call(
             send_routers=True, send_floating_ips=True, timeout=None,
-            triggered_by_tenant=p['port']['tenant_id']
+            triggered_by_tenant=p['port']['tenant_id'],
+            trigger=servermanager.TOPO_SYNC_TRIGGER_NXNETWORK
         )
         mock_send_all.assert_has_calls([call])
         self.spawn_p.start()
@@ -343,6 +349,115 @@ class TestBigSwitchProxySync(BigSwitchProxyPluginV2TestCase):
         result = plugin_obj._send_all_data()
         self.assertEqual(result[0], 200)
 
+    def test_get_all_data_bulk_queries(self):
+        plugin_obj = directory.get_plugin()
+        with self.subnet() as s1, self.subnet() as s2,\
+                self.port(subnet=s1), self.port(subnet=s2),\
+                patch.object(plugin_obj, 'get_ports',
+                             wraps=plugin_obj.get_ports) as get_ports,\
+                patch.object(plugin_obj, 'get_subnets',
+                             wraps=plugin_obj.get_subnets) as get_subnets:
+            data = plugin_obj._get_all_data()
+            # ports and subnets are fetched once regardless of network count
+            self.assertEqual(1, get_ports.call_count)
+            self.assertEqual(1, get_subnets.call_count)
+            nets = dict((net['id'], net) for net in data['networks'])
+            for sub in (s1, s2):
+                net = nets[sub['subnet']['network_id']]
+                self.assertEqual([sub['subnet']['id']],
+                                 [s['id'] for s in net['subnets']])
+                self.assertEqual(1, len(net['ports']))
+
+    def test_get_all_data_sections_concurrent(self):
+        plugin_obj = directory.get_plugin()
+        routers_started = event.Event()
+
+        def networks_section(*args):
+            # only completes if the routers section runs alongside it
+            routers_started.wait()
+            return []
+
+        def routers_section(*args):
+            routers_started.send()
+            return []
+
+        with patch.object(plugin_obj, '_get_networks_section',
+                          side_effect=networks_section),\
+                patch.object(plugin_obj, '_get_routers_section',
+                             side_effect=routers_section),\
+                eventlet.Timeout(5):
+            data = plugin_obj._get_all_data()
+        self.assertEqual([], data['networks'])
+        self.assertEqual([], data['routers'])
+
+    def test_collected_network_mapped_once(self):
+        plugin_obj = directory.get_plugin()
+        with self.subnet() as s:
+            collector = topology.TopologyCollector(plugin_obj)
+            net = collector.get_network(s['subnet']['network_id'])
+            with patch.object(plugin_obj, '_map_subnet',
+                              wraps=plugin_obj._map_subnet) as map_subnet:
+                mapped = plugin_obj._get_collected_mapped_network(
+                    collector, net)
+                self.assertIs(mapped, plugin_obj._get_collected_mapped_network(
+                    collector, net))
+                mapped_subnet = plugin_obj._get_collected_mapped_subnet(
+                    collector, collector.get_subnet(s['subnet']['id']))
+                self.assertEqual(1, map_subnet.call_count)
+            # only the copy in the network has its name removed
+            self.assertNotIn('name', mapped['subnets'][0])
+            self.assertIn('name', mapped_subnet)
+
+    def test_collector_memoize_concurrent(self):
+        collector = topology.TopologyCollector(directory.get_plugin())
+        builds = []
+
+        def build():
+            builds.append(1)
+            eventlet.sleep(0.01)
+            return object()
+
+        threads = [eventlet.spawn(collector.memoize, 'kind', 'key', build)
+                   for i in range(3)]
+        results = [thread.wait() for thread in threads]
+        # the greenthreads share the result of a single build
+        self.assertEqual(1, len(builds))
+        self.assertIs(results[0], results[1])
+        self.assertIs(results[0], results[2])
+
+    def test_routers_section_skips_deleted_network(self):
+        plugin_obj = directory.get_plugin()
+        router = {'id': 'r1', 'tenant_id': 't1'}
+        collector = mock.Mock()
+        collector.get_router_interface_ports.return_value = [
+            {'fixed_ips': [{'subnet_id': 's1'}]}]
+        collector.get_subnet.return_value = {'id': 's1', 'network_id': 'n1'}
+        # the network was deleted after its subnet was fetched
+        collector.get_network.return_value = None
+        with patch.object(plugin_obj.l3_plugin, 'get_routers',
+                          return_value=[router]),\
+                patch.object(plugin_obj, '_map_display_name_or_tenant',
+                             side_effect=lambda r: dict(r)),\
+                patch.object(plugin_obj, '_get_collected_mapped_network') \
+                as map_mock:
+            routers = plugin_obj._get_routers_section(collector)
+        self.assertEqual([], routers[0]['interfaces'])
+        map_mock.assert_not_called()
+
+    def test_get_all_data_for_tenant(self):
+        plugin_obj = directory.get_plugin()
+        with self.network(tenant_id='other') as n1,\
+                self.subnet(network=n1) as s1, self.subnet() as s2,\
+                self.port(subnet=s1), self.port(subnet=s2) as p2:
+            data = plugin_obj._get_all_data(
+                tenant_id=s2['subnet']['tenant_id'])
+            # only the networks of the tenant and their ports are collected
+            nets = dict((net['id'], net) for net in data['networks'])
+            self.assertEqual([s2['subnet']['network_id']], list(nets))
+            self.assertEqual(
+                [p2['port']['id']],
+                [p['id'] for p in nets[s2['subnet']['network_id']]['ports']])
+
 
 class TestDisplayName(BigSwitchProxyPluginV2TestCase):
     def get_true(self):
@@ -446,6 +561,60 @@ class TestDisplayName(BigSwitchProxyPluginV2TestCase):
         self.assertEqual(expected_obj,
                          plugin_obj._map_display_name_or_tenant(test_obj))
 
+    def test_port_mapping_does_not_modify_input(self):
+        plugin_obj = directory.get_plugin()
+        network = {'id': 'net_id', 'tenant_id': ''}
+        port = {'id': 'port_id', 'tenant_id': '', 'admin_state_up': True,
+                'status': 'DOWN', 'network': network}
+
+        mapped_port = plugin_obj._map_state_and_status(port)
+        self.assertEqual('UP', mapped_port['state'])
+        self.assertNotIn('status', mapped_port)
+        self.assertEqual('DOWN', port['status'])
+
+        rest_port = plugin_obj._add_service_tenant_to_port(mapped_port)
+        self.assertEqual(servermanager.SERVICE_TENANT,
+                         rest_port['network']['tenant_id'])
+        self.assertEqual('', mapped_port['tenant_id'])
+        self.assertEqual('', network['tenant_id'])
+
+    def test_set_port_statuses(self):
+        plugin_obj = directory.get_plugin()
+        with self.port() as p1, self.port() as p2:
+            ids = [p1['port']['id'], p2['port']['id']]
+            results = plugin_obj._set_port_statuses(
+                [(ids[0], constants.PORT_STATUS_ERROR),
+                 ('missing', constants.PORT_STATUS_ACTIVE),
+                 (ids[1], constants.PORT_STATUS_DOWN)])
+            self.assertIsNone(results[0])
+            self.assertIsInstance(results[1], n_exc.PortNotFound)
+            self.assertIsNone(results[2])
+            ctx = context.get_admin_context()
+            self.assertEqual(constants.PORT_STATUS_ERROR,
+                             plugin_obj.get_port(ctx, ids[0])['status'])
+            self.assertEqual(constants.PORT_STATUS_DOWN,
+                             plugin_obj.get_port(ctx, ids[1])['status'])
+            self.assertRaises(n_exc.PortNotFound,
+                              plugin_obj._set_port_status, 'missing',
+                              constants.PORT_STATUS_ACTIVE)
+
+    def test_topology_revision(self):
+        plugin_obj = directory.get_plugin()
+        revision = plugin_obj._get_topology_revision()
+        self.assertEqual(revision, plugin_obj._get_topology_revision())
+        with self.port() as p:
+            created = plugin_obj._get_topology_revision()
+            self.assertNotEqual(revision, created)
+            # bulk status writes change the revision as well
+            plugin_obj._set_port_statuses(
+                [(p['port']['id'], constants.PORT_STATUS_ERROR)])
+            changed = plugin_obj._get_topology_revision()
+            self.assertNotEqual(created, changed)
+            # reporting the same status again doesn't
+            plugin_obj._set_port_statuses(
+                [(p['port']['id'], constants.PORT_STATUS_ERROR)])
+            self.assertEqual(changed, plugin_obj._get_topology_revision())
+
 
 class TestBigSwitchAddressPairs(test_addr_pair.TestAllowedAddressPairs,
                                 BigSwitchProxyPluginV2TestCase):
@@ -12,16 +12,22 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 import httplib
+import os
 import socket
 import ssl
 import time
+import zlib
 
+import eventlet
+from eventlet import event
 import mock
 from oslo_config import cfg
 from oslo_db import exception as db_exc
+from oslo_serialization import jsonutils
 from oslo_utils import importutils
 
 from networking_bigswitch.plugins.bigswitch.db import consistency_db
+from networking_bigswitch.plugins.bigswitch import dispatcher
 from networking_bigswitch.plugins.bigswitch import servermanager
 from networking_bigswitch.tests.unit.bigswitch \
     import test_restproxy_plugin as test_rp
@@ -217,6 +223,40 @@ class ServerManagerTests(test_rp.BigSwitchProxyPluginV2TestCase):
             rv.read.side_effect = ['{"a": "b"}', '["b","c","d"]']
             self.assertEqual(set(['a', 'b', 'c', 'd']), sp.get_capabilities())
 
+    def test_capabilities_retrieval_does_not_wait_for_down_server(self):
+        sp = servermanager.ServerPool()
+        up, down = sp.servers
+        blocker = event.Event()
+
+        def up_capabilities():
+            up.capabilities = ['a', 'b']
+            return up.capabilities
+
+        def down_capabilities():
+            blocker.wait()
+            return []
+
+        with mock.patch.object(up, 'get_capabilities',
+                               side_effect=up_capabilities),\
+                mock.patch.object(down, 'get_capabilities',
+                                  side_effect=down_capabilities):
+            self.assertEqual(set(['a', 'b']), sp.get_capabilities())
+            blocker.send()
+            eventlet.sleep(0)
+
+    def test_capabilities_kept_while_server_unreachable(self):
+        sp = servermanager.ServerPool()
+        server = sp.servers[0]
+        with mock.patch.object(server, 'rest_call',
+                               return_value=(200, 'OK', '["a"]', None)):
+            self.assertEqual(['a'], server.get_capabilities())
+        with mock.patch.object(server, 'rest_call',
+                               return_value=(0, None, None, None)):
+            self.assertEqual(['a'], server.get_capabilities())
+            # until they expire
+            server.capabilities_expire = time.time() - 1
+            self.assertEqual([], server.get_capabilities())
+
     def test_reconnect_on_timeout_change(self):
         sp = servermanager.ServerPool()
         with mock.patch(HTTPCON) as conmock:
@@ -245,13 +285,13 @@ class ServerManagerTests(test_rp.BigSwitchProxyPluginV2TestCase):
             self.assertEqual(resp, (0, None, None, None))
 
     def test_reconnect_cached_connection(self):
-        self.skipTest("cached connections are currently disabled because "
-                      "their assignment to the servermanager object is not "
-                      "thread-safe")
         sp = servermanager.ServerPool()
-        with mock.patch(HTTPCON) as conmock:
+        with mock.patch(HTTPCON) as conmock,\
+                mock.patch(SERVERMANAGER + '.ConnectionPool._is_healthy',
+                           return_value=True):
             rv = conmock.return_value
             rv.getresponse.return_value.getheader.return_value = 'HASH'
+            rv.getresponse.return_value.will_close = False
             sp.servers[0].capabilities = ['keep-alive']
             sp.servers[0].rest_call('GET', '/first')
             # raise an error on re-use to verify reconnect
@@ -268,16 +308,16 @@ class ServerManagerTests(test_rp.BigSwitchProxyPluginV2TestCase):
         self.assertEqual(uris, expected)
 
     def test_no_reconnect_recurse_to_infinity(self):
-        self.skipTest("cached connections are currently disabled because "
-                      "their assignment to the servermanager object is not "
-                      "thread-safe")
         # retry uses recursion when a reconnect is necessary
         # this test makes sure it stops after 1 recursive call
         sp = servermanager.ServerPool()
-        with mock.patch(HTTPCON) as conmock:
+        with mock.patch(HTTPCON) as conmock,\
+                mock.patch(SERVERMANAGER + '.ConnectionPool._is_healthy',
+                           return_value=True):
             rv = conmock.return_value
             # hash header must be string instead of mock object
             rv.getresponse.return_value.getheader.return_value = 'HASH'
+            rv.getresponse.return_value.will_close = False
             sp.servers[0].capabilities = ['keep-alive']
             sp.servers[0].rest_call('GET', '/first')
             # after retrying once, the rest call should raise the
@@ -289,6 +329,147 @@ class ServerManagerTests(test_rp.BigSwitchProxyPluginV2TestCase):
             # 1 for the first call, 2 for the second with retry
             self.assertEqual(rv.request.call_count, 3)
 
+    def test_keep_alive_reuses_connection(self):
+        sp = servermanager.ServerPool()
+        with mock.patch(HTTPCON) as conmock,\
+                mock.patch(SERVERMANAGER + '.ConnectionPool._is_healthy',
+                           return_value=True):
+            rv = conmock.return_value
+            rv.getresponse.return_value.will_close = False
+            sp.servers[0].capabilities = ['keep-alive']
+            sp.servers[0].rest_call('GET', '/first')
+            sp.servers[0].rest_call('GET', '/second')
+        # both requests went over the same pooled connection
+        self.assertEqual(1, conmock.call_count)
+        self.assertEqual(2, rv.request.call_count)
+        self.assertEqual('keep-alive',
+                         rv.request.mock_calls[1][1][3]['Connection'])
+        self.assertFalse(rv.close.called)
+
+    def test_no_keep_alive_without_capability(self):
+        sp = servermanager.ServerPool()
+        with mock.patch(HTTPCON) as conmock:
+            rv = conmock.return_value
+            rv.getresponse.return_value.will_close = False
+            sp.servers[0].rest_call('GET', '/first')
+            sp.servers[0].rest_call('GET', '/second')
+        self.assertEqual(2, conmock.call_count)
+        self.assertEqual(2, rv.close.call_count)
+        self.assertEqual(0, len(sp.servers[0].connection_pool))
+
+    def test_bounded_transport_shares_connections(self):
+        cfg.CONF.set_override('http_transport', 'bounded', 'RESTPROXY')
+        cfg.CONF.set_override('connection_pool_size', 1, 'RESTPROXY')
+        sp = servermanager.ServerPool()
+        with mock.patch(HTTPCON) as conmock,\
+                mock.patch(SERVERMANAGER + '.ConnectionPool._is_healthy',
+                           return_value=True):
+            rv = conmock.return_value
+            rv.getresponse.return_value.will_close = False
+            # yield while a request is in flight
+            rv.request.side_effect = lambda *args: eventlet.sleep(0)
+            threads = [eventlet.spawn(sp.servers[0].rest_call, 'GET', '/')
+                       for x in range(3)]
+            for thread in threads:
+                thread.wait()
+        # the requests took turns on a single keep-alive connection
+        self.assertEqual(1, conmock.call_count)
+        self.assertEqual(3, rv.request.call_count)
+        self.assertEqual('keep-alive',
+                         rv.request.mock_calls[0][1][3]['Connection'])
+
+    def test_bounded_transport_releases_slot_on_error(self):
+        cfg.CONF.set_override('http_transport', 'bounded', 'RESTPROXY')
+        cfg.CONF.set_override('connection_pool_size', 1, 'RESTPROXY')
+        sp = servermanager.ServerPool()
+        server = sp.servers[0]
+        server.capabilities = [servermanager.GZIP_CAPABILITY]
+        with mock.patch(HTTPCON) as conmock:
+            resp = conmock.return_value.getresponse.return_value
+            resp.status = httplib.OK
+            resp.read.return_value = b'not gzip'
+            resp.getheader.return_value = 'gzip'
+            self.assertRaises(zlib.error, server.rest_call, 'GET', '/')
+            # the slot was handed back, the next request isn't blocked
+            resp.getheader.return_value = None
+            resp.read.return_value = '{}'
+            self.assertEqual(httplib.OK, server.rest_call('GET', '/')[0])
+
+    def test_bounded_transport_acquire_timeout(self):
+        cfg.CONF.set_override('http_transport', 'bounded', 'RESTPROXY')
+        cfg.CONF.set_override('connection_pool_size', 1, 'RESTPROXY')
+        sp = servermanager.ServerPool()
+        server = sp.servers[0]
+        # the only slot is taken by another request
+        self.assertTrue(server.transport._slots.acquire())
+        with mock.patch(HTTPCON) as conmock:
+            self.assertEqual((0, None, None, None),
+                             server._rest_call('GET', '/', timeout=0.01))
+            conmock.assert_not_called()
+        server.transport._slots.release()
+
+    def test_probe_servers_concurrently(self):
+        pl = directory.get_plugin()
+        probed = []
+        started_before_done = []
+
+        def probe(*args, **kwargs):
+            probed.append(args)
+            eventlet.sleep(0)
+            started_before_done.append(len(probed))
+            return (200, 'OK', '', '')
+
+        with mock.patch(SERVERMANAGER + '.ServerProxy.rest_call',
+                        side_effect=probe):
+            pl.servers.probe_servers()
+        self.assertEqual([('GET', servermanager.HEALTH_PATH)] * 2, probed)
+        # all probes were started before any of them completed
+        self.assertEqual([2, 2], started_before_done)
+
+    def test_connection_pool_bounded(self):
+        factory = mock.Mock(side_effect=lambda timeout: mock.Mock())
+        pool = servermanager.ConnectionPool(factory, 2, 60)
+        conns = [pool.get(10)[0] for x in range(3)]
+        for conn in conns:
+            pool.put(conn)
+        # only max_size idle connections are kept, the rest are closed
+        self.assertEqual(2, len(pool))
+        self.assertFalse(conns[0].close.called)
+        self.assertFalse(conns[1].close.called)
+        self.assertTrue(conns[2].close.called)
+
+    def test_connection_pool_idle_eviction(self):
+        factory = mock.Mock(side_effect=lambda timeout: mock.Mock())
+        pool = servermanager.ConnectionPool(factory, 2, 60)
+        conn, reused = pool.get(10)
+        self.assertFalse(reused)
+        pool.put(conn)
+        with mock.patch(SERVERMANAGER + '.time.time',
+                        return_value=time.time() + 61):
+            new_conn, reused = pool.get(10)
+        # the expired connection is closed and a new one is created
+        self.assertFalse(reused)
+        self.assertTrue(conn.close.called)
+        self.assertIsNot(conn, new_conn)
+
+    def test_connection_pool_health_check(self):
+        factory = mock.Mock(side_effect=lambda timeout: mock.Mock())
+        pool = servermanager.ConnectionPool(factory, 2, 60)
+        conn, reused = pool.get(10)
+        pool.put(conn)
+        # socket readable while idle means the controller closed it
+        with mock.patch(SERVERMANAGER + '.select.select',
+                        return_value=([conn.sock], [], [])):
+            new_conn, reused = pool.get(10)
+        self.assertFalse(reused)
+        self.assertTrue(conn.close.called)
+        pool.put(new_conn)
+        with mock.patch(SERVERMANAGER + '.select.select',
+                        return_value=([], [], [])):
+            same_conn, reused = pool.get(10)
+        self.assertTrue(reused)
+        self.assertIs(new_conn, same_conn)
+
     def test_socket_error(self):
         sp = servermanager.ServerPool()
         with mock.patch(HTTPCON) as conmock:
@@ -356,6 +537,160 @@ class ServerManagerTests(test_rp.BigSwitchProxyPluginV2TestCase):
         self.assertFalse(pl.servers.server_failure((404,),
                                                    ignore_codes=[404]))
 
+    def test_circuit_breaker(self):
+        breaker = servermanager.CircuitBreaker(3, 5)
+        now = time.time()
+        with mock.patch(SERVERMANAGER + '.time.time', return_value=now) as t:
+            for i in range(3):
+                self.assertTrue(breaker.allow_request())
+                breaker.before_request()
+                breaker.record_failure()
+            self.assertEqual(servermanager.CircuitBreaker.OPEN, breaker.state)
+            self.assertFalse(breaker.allow_request())
+
+            # a single trial request once the reset timeout has passed
+            t.return_value = now + 5
+            self.assertTrue(breaker.allow_request())
+            self.assertTrue(breaker.before_request())
+            self.assertEqual(servermanager.CircuitBreaker.HALF_OPEN,
+                             breaker.state)
+            self.assertFalse(breaker.allow_request())
+            # other greenthreads fail fast while the trial is in progress,
+            # and their results don't end it
+            self.assertFalse(eventlet.spawn(breaker.before_request).wait())
+            eventlet.spawn(breaker._end_request).wait()
+            self.assertFalse(breaker.allow_request())
+
+            # failed trial doubles the reset timeout
+            breaker.record_failure()
+            self.assertEqual(now + 15, breaker.open_until)
+
+            t.return_value = now + 15
+            breaker.before_request()
+            breaker.record_success(0.5)
+            self.assertEqual(servermanager.CircuitBreaker.CLOSED,
+                             breaker.state)
+            self.assertEqual(0.5, breaker.latency)
+
+    def test_rest_call_half_open_single_trial(self):
+        pl = directory.get_plugin()
+        server = pl.servers.servers[0]
+        server.breaker.state = servermanager.CircuitBreaker.HALF_OPEN
+        trial_sent = event.Event()
+        finish_trial = event.Event()
+
+        def trial_call(*args, **kwargs):
+            trial_sent.send()
+            finish_trial.wait()
+            return httplib.OK, 'OK', '', ''
+
+        with mock.patch.object(server, '_rest_call',
+                               side_effect=trial_call) as call_mock:
+            trial = eventlet.spawn(server.rest_call, 'GET', '/')
+            trial_sent.wait()
+            # the other requests fail fast until the trial completes
+            self.assertEqual((0, None, None, None),
+                             server.rest_call('GET', '/'))
+            self.assertEqual(1, call_mock.call_count)
+            finish_trial.send()
+            self.assertEqual(httplib.OK, trial.wait()[0])
+        self.assertEqual(servermanager.CircuitBreaker.CLOSED,
+                         server.breaker.state)
+        self.assertTrue(server.breaker.allow_request())
+
+    def test_rest_call_skips_open_circuit(self):
+        pl = directory.get_plugin()
+        bad_server, good_server = pl.servers.servers
+        for i in range(cfg.CONF.RESTPROXY.circuit_breaker_threshold):
+            bad_server.breaker.record_failure()
+        with mock.patch.object(bad_server, 'rest_call') as bad_mock,\
+                mock.patch.object(good_server, 'rest_call',
+                                  return_value=(200, None, None, None)):
+            resp = pl.servers.rest_call('GET', '/', '', None, [])
+            self.assertEqual(200, resp[0])
+            bad_mock.assert_not_called()
+
+            # with all circuits open, a server is still tried
+            for i in range(cfg.CONF.RESTPROXY.circuit_breaker_threshold):
+                good_server.breaker.record_failure()
+            pl.servers.rest_call('GET', '/', '', None, [])
+            self.assertEqual(1, bad_mock.call_count)
+
+    def test_rest_call_writes_to_leader(self):
+        pl = directory.get_plugin()
+        member, leader = pl.servers.servers
+
+        def redirect(*args, **kwargs):
+            member.redirect_location = 'http://localhost:8899/networkService'
+            return (httplib.FOUND, 'Found', '', '')
+
+        with mock.patch.object(member, '_rest_call',
+                               side_effect=redirect) as member_mock,\
+                mock.patch.object(leader, '_rest_call',
+                                  return_value=(200, 'OK', '', '')) \
+                as leader_mock:
+            resp = pl.servers.rest_call('PUT', '/', '', None, [])
+            self.assertEqual(200, resp[0])
+            self.assertIs(leader, pl.servers.leader)
+            self.assertEqual(1, member_mock.call_count)
+            self.assertFalse(member.failed)
+
+            # later writes skip the redirect, reads go to any member
+            pl.servers.rest_call('PUT', '/', '', None, [])
+            self.assertEqual(1, member_mock.call_count)
+            self.assertEqual(2, leader_mock.call_count)
+            member_mock.side_effect = None
+            member_mock.return_value = (200, 'OK', '', '')
+            leader.breaker.latency = 10
+            pl.servers.rest_call('GET', '/', '', None, [])
+            self.assertEqual(2, member_mock.call_count)
+
+            # a failure of the leader triggers rediscovery
+            leader_mock.return_value = (500, 'Error', '', '')
+            pl.servers.rest_call('PUT', '/', '', None, [])
+            self.assertIs(member, pl.servers.leader)
+
+    def test_rest_create_port_batched(self):
+        pl = directory.get_plugin()
+        pl.servers.port_batcher = dispatcher.MicroBatcher(
+            pl.servers.rest_create_ports, 0.01, 10)
+        ports = [{'id': 'port%d' % i, 'mac_address': 'fa:16:3e:00:00:0%d' % i,
+                  'device_id': 'vm%d' % i} for i in range(2)]
+        resp = (200, 'OK', '', {'ports': [
+            {'status': 200},
+            {'status': 404, 'message': servermanager.NXNETWORK}]})
+        with mock.patch(SERVER_GET_CAPABILITIES,
+                        return_value=[servermanager.PORT_BULK_CAPABILITY]),\
+                mock.patch.object(pl.servers, 'rest_action',
+                                  return_value=resp) as rmock:
+            threads = [eventlet.spawn(pl.servers.rest_create_port,
+                                      'tenant', 'net', port)
+                       for port in ports]
+            threads[0].wait()
+            e = self.assertRaises(servermanager.RemoteRestError,
+                                  threads[1].wait)
+            self.assertEqual(404, e.status)
+            # both ports were sent in a single request
+            rmock.assert_called_once_with(
+                'POST', servermanager.PORT_ATTACHMENTS_PATH, mock.ANY,
+                mock.ANY)
+            sent = rmock.call_args[0][2]['ports']
+            self.assertEqual(['port0', 'port1'],
+                             [p['port']['id'] for p in sent])
+            self.assertEqual({'id': 'vm0', 'mac': 'fa:16:3e:00:00:00'},
+                             sent[0]['attachment'])
+            self.assertEqual('net', sent[0]['network_id'])
+
+    def test_rest_call_records_server_health(self):
+        pl = directory.get_plugin()
+        server = pl.servers.servers[0]
+        with mock.patch.object(server, '_rest_call',
+                               return_value=(0, None, None, None)):
+            for i in range(cfg.CONF.RESTPROXY.circuit_breaker_threshold):
+                server.rest_call('GET', '/')
+        self.assertEqual(servermanager.CircuitBreaker.OPEN,
+                         server.breaker.state)
+
     def test_retry_on_unavailable(self):
         pl = directory.get_plugin()
         with mock.patch(SERVERMANAGER + '.ServerProxy.rest_call',
@@ -392,7 +727,9 @@ class ServerManagerTests(test_rp.BigSwitchProxyPluginV2TestCase):
                                  'data': '',
                                  'errstr': "Unable to DELETE query to BCF: %s",
                                  'ignore_codes': []})
-            topo_mock.assert_called_once_with(**{'check_ts': True})
+            topo_mock.assert_called_once_with(
+                **{'check_ts': True,
+                   'trigger': servermanager.TOPO_SYNC_TRIGGER_REST_FAILURE})
 
     def test_post_failure_forces_topo_sync(self):
         pl = directory.get_plugin()
@@ -410,7 +747,9 @@ class ServerManagerTests(test_rp.BigSwitchProxyPluginV2TestCase):
                               **{'action': 'POST', 'resource': '/', 'data': '',
                                  'errstr': "Unable to POST query to BCF: %s",
                                  'ignore_codes': []})
-            topo_mock.assert_called_once_with(**{'check_ts': True})
+            topo_mock.assert_called_once_with(
+                **{'check_ts': True,
+                   'trigger': servermanager.TOPO_SYNC_TRIGGER_REST_FAILURE})
 
     def test_topo_sync_failure_does_not_force_topo_sync(self):
         pl = directory.get_plugin()
@@ -431,6 +770,315 @@ class ServerManagerTests(test_rp.BigSwitchProxyPluginV2TestCase):
                                  'ignore_codes': []})
             topo_mock.assert_not_called()
 
+    def test_concurrent_topo_syncs_coalesce(self):
+        pl = directory.get_plugin()
+        blocker = event.Event()
+        runs = []
+
+        def topo_sync(check_ts, triggers):
+            runs.append((check_ts, dict(triggers)))
+            if len(runs) == 1:
+                blocker.wait()
+            return True, servermanager.TOPO_RESPONSE_OK
+
+        with mock.patch.object(pl.servers, '_topo_sync',
+                               side_effect=topo_sync):
+            first = eventlet.spawn(
+                pl.servers.force_topo_sync, check_ts=True,
+                trigger=servermanager.TOPO_SYNC_TRIGGER_STARTUP)
+            eventlet.sleep(0)
+            waiters = [eventlet.spawn(
+                pl.servers.force_topo_sync, check_ts=check_ts,
+                trigger=trigger) for check_ts, trigger in [
+                (True, servermanager.TOPO_SYNC_TRIGGER_REST_FAILURE),
+                (True, servermanager.TOPO_SYNC_TRIGGER_REST_FAILURE),
+                (False, servermanager.TOPO_SYNC_TRIGGER_KEYSTONE)]]
+            eventlet.sleep(0)
+            blocker.send()
+            first.wait()
+            for waiter in waiters:
+                self.assertEqual((True, servermanager.TOPO_RESPONSE_OK),
+                                 waiter.wait())
+        # the requests made during the first sync share a single run
+        self.assertEqual(
+            [(True, {servermanager.TOPO_SYNC_TRIGGER_STARTUP: 1}),
+             (False, {servermanager.TOPO_SYNC_TRIGGER_REST_FAILURE: 2,
+                      servermanager.TOPO_SYNC_TRIGGER_KEYSTONE: 1})], runs)
+        self.assertFalse(pl.servers._topo_sync_running)
+
+    def test_topo_sync_requested_by_running_sync(self):
+        pl = directory.get_plugin()
+        results = []
+
+        def section():
+            return pl.servers.force_topo_sync(
+                trigger=servermanager.TOPO_SYNC_TRIGGER_KEYSTONE)
+
+        def topo_sync(check_ts, triggers):
+            # requests from the sync and the greenthreads it spawns return
+            # right away instead of waiting for the sync to finish
+            results.append(section())
+            results.append(eventlet.spawn(
+                pl.servers.topo_sync_section(section)).wait())
+            return True, servermanager.TOPO_RESPONSE_OK
+
+        with mock.patch.object(pl.servers, '_topo_sync',
+                               side_effect=topo_sync) as sync_mock:
+            self.assertEqual((True, servermanager.TOPO_RESPONSE_OK),
+                             pl.servers.force_topo_sync())
+        self.assertEqual([(False, servermanager.TOPO_RESPONSE_OK)] * 2,
+                         results)
+        sync_mock.assert_called_once()
+        self.assertFalse(pl.servers._topo_sync_running)
+        self.assertFalse(pl.servers._topo_sync_threads)
+
+    def test_topo_sync_uses_current_snapshot(self):
+        pl = directory.get_plugin()
+        pl.servers.capabilities = []
+        data = {'networks': [{'id': 'n1', 'name': 'a'}]}
+        with mock.patch.object(pl.servers, 'get_topo_function',
+                               return_value=data) as topo_mock,\
+                mock.patch.object(pl.servers, 'get_topo_revision_function',
+                                  side_effect=['rev1', 'rev2']) as rev_mock,\
+                mock.patch(SERVERMANAGER + '.ServerPool.rest_call',
+                           return_value=(httplib.OK, 0, 0, 0)):
+            # the DB changed while collecting, the topology isn't kept
+            pl.servers._topo_snapshot = None
+            pl.servers._build_topo_snapshot()
+            self.assertIsNone(pl.servers._topo_snapshot)
+
+            rev_mock.side_effect = None
+            rev_mock.return_value = 'rev2'
+            pl.servers._build_topo_snapshot()
+            self.assertEqual(('rev2', data), pl.servers._topo_snapshot)
+            self.assertEqual(2, topo_mock.call_count)
+            # unchanged since the snapshot was taken, it is sent as is and
+            # dropped
+            pl.servers.force_topo_sync(check_ts=False)
+            self.assertEqual(2, topo_mock.call_count)
+            self.assertIsNone(pl.servers._topo_snapshot)
+
+            # syncs without a snapshot collect the topology and don't keep it
+            pl.servers.force_topo_sync(check_ts=False)
+            self.assertEqual(3, topo_mock.call_count)
+            self.assertIsNone(pl.servers._topo_snapshot)
+
+            pl.servers._build_topo_snapshot()
+            rev_mock.return_value = 'rev3'
+            pl.servers.force_topo_sync(check_ts=False)
+            self.assertEqual(5, topo_mock.call_count)
+            self.assertIsNone(pl.servers._topo_snapshot)
+
+    def test_tenant_sync(self):
+        pl = directory.get_plugin()
+        data = {'networks': [], 'tenants': {'t1': 'tenant1'}}
+        with mock.patch.object(pl.servers, 'get_topo_function',
+                               return_value=data) as topo_mock,\
+                mock.patch.object(
+                    pl.servers, 'get_capabilities',
+                    return_value=[servermanager.TENANT_TOPOLOGY_CAPABILITY]),\
+                mock.patch(SERVERMANAGER + '.ServerPool.rest_call',
+                           return_value=(httplib.OK, 0, 0, 0)) as rmock,\
+                mock.patch(SERVERMANAGER + '.ServerPool.force_topo_sync',
+                           return_value=(True,
+                                         servermanager.TOPO_RESPONSE_OK))\
+                as topo_sync:
+            self.assertEqual((True, (httplib.OK, 0, 0, 0)),
+                             pl.servers.force_tenant_sync('t1'))
+            topo_mock.assert_called_once_with(
+                tenant_id='t1', **pl.servers.get_topo_function_args)
+            # sent under the TOPO_SYNC lock with its fencing token
+            rmock.assert_called_once_with(
+                'POST', servermanager.TENANT_TOPOLOGY_PATH % 't1', data,
+                {servermanager.TOPO_SYNC_TOKEN_HEADER: mock.ANY}, [])
+            topo_sync.assert_not_called()
+            # the lock is released, keeping the last topo_sync timestamp
+            record = consistency_db.HashHandler()._get_current_record()
+            self.assertNotIn('TOPO_SYNC', record.hash)
+
+            # a failed tenant sync falls back to a full sync
+            rmock.return_value = (httplib.INTERNAL_SERVER_ERROR, 0, 0, 0)
+            pl.servers.force_tenant_sync(
+                't1', trigger=servermanager.TOPO_SYNC_TRIGGER_NXNETWORK)
+            topo_sync.assert_called_once_with(
+                trigger=servermanager.TOPO_SYNC_TRIGGER_NXNETWORK)
+
+    def test_topology_delta(self):
+        synced = {'networks': [{'id': 'n1', 'name': 'a'},
+                               {'id': 'n2', 'name': 'b'}],
+                  'tenants': {'t1': 'tenant1'}}
+        synced_hashes = servermanager.TopologyDelta(
+            synced, {}).get_updated_hashes()
+        current = {'networks': [{'id': 'n1', 'name': 'a'},
+                                {'id': 'n2', 'name': 'changed'},
+                                {'id': 'n3', 'name': 'c'}],
+                   'tenants': {'t2': 'tenant2'}}
+        delta = servermanager.TopologyDelta(current, synced_hashes)
+        self.assertEqual(set([('networks', 'n2'), ('networks', 'n3'),
+                              ('tenants', 't2')]), delta.updated)
+        self.assertEqual(set([('tenants', 't1')]), delta.removed)
+        payload = delta.get_payload()
+        self.assertEqual(
+            servermanager.get_topology_hash(synced_hashes),
+            payload['previous-hash'])
+        self.assertEqual(['n2', 'n3'], sorted(
+            n['id'] for n in payload['updated']['networks']))
+        self.assertEqual({'t2': 'tenant2'}, payload['updated']['tenants'])
+        self.assertEqual({'tenants': ['t1']}, payload['removed'])
+
+    def test_topo_sync_sends_delta(self):
+        pl = directory.get_plugin()
+        pl.servers.capabilities = [servermanager.TOPO_DELTA_CAPABILITY]
+        data = {'networks': [{'id': 'n1', 'name': 'a'}]}
+        synced_hashes = servermanager.TopologyDelta(
+            data, {}).get_updated_hashes()
+        with mock.patch.object(pl.servers, 'get_topo_function',
+                               return_value=data),\
+                mock.patch(CONSISTENCYDB + '.HashHandler.get_topo_hashes',
+                           return_value=synced_hashes),\
+                mock.patch(CONSISTENCYDB + '.HashHandler.update_topo_hashes')\
+                as uhmock,\
+                mock.patch(SERVERMANAGER + '.ServerPool.rest_call',
+                           return_value=(httplib.OK, 0, 0, 0)) as rmock:
+            pl.servers.force_topo_sync(check_ts=True)
+            rmock.assert_called_once_with(
+                'POST', servermanager.TOPOLOGY_DELTA_PATH, mock.ANY,
+                {servermanager.TOPO_SYNC_TOKEN_HEADER: mock.ANY}, [])
+            payload = rmock.call_args[0][2]
+            self.assertEqual({}, payload['updated'])
+            self.assertEqual({}, payload['removed'])
+            uhmock.assert_called_once_with({}, removed=set())
+
+    def test_topo_sync_delta_conflict_falls_back_to_full(self):
+        pl = directory.get_plugin()
+        pl.servers.capabilities = [servermanager.TOPO_DELTA_CAPABILITY]
+        data = {'networks': [{'id': 'n1', 'name': 'a'}]}
+        with mock.patch.object(pl.servers, 'get_topo_function',
+                               return_value=data),\
+                mock.patch(CONSISTENCYDB + '.HashHandler.get_topo_hashes',
+                           return_value={('networks', 'n1'): 'oldhash'}),\
+                mock.patch(CONSISTENCYDB + '.HashHandler.update_topo_hashes')\
+                as uhmock,\
+                mock.patch(SERVERMANAGER + '.ServerPool.rest_call',
+                           side_effect=[(httplib.CONFLICT, 0, 0, 0),
+                                        (httplib.OK, 0, 0, 0)]) as rmock:
+            pl.servers.force_topo_sync(check_ts=True)
+            self.assertEqual(servermanager.TOPOLOGY_DELTA_PATH,
+                             rmock.call_args_list[0][0][1])
+            self.assertEqual(servermanager.TOPOLOGY_PATH,
+                             rmock.call_args_list[1][0][1])
+            self.assertIsInstance(rmock.call_args_list[1][0][2],
+                                  servermanager.JSONBodySpool)
+            # full sync replaces the recorded state
+            uhmock.assert_called_once_with(
+                {('networks', 'n1'): mock.ANY}, replace=True)
+
+    def test_json_body_spool_chunked(self):
+        data = {'networks': [{'id': 'n%d' % i, 'name': u'net\u00e9'}
+                             for i in range(100)]}
+        spool = servermanager.JSONBodySpool(data, chunk_size=64,
+                                            max_memory=256)
+        self.addCleanup(spool.close)
+        self.assertEqual(len(jsonutils.dumps(data)), spool.size)
+        # the spool can be streamed repeatedly, e.g. for retries
+        for x in range(2):
+            reader = spool.chunked_reader()
+            framed = b''
+            block = reader.read(8192)
+            while block:
+                framed += block
+                block = reader.read(8192)
+            body = b''
+            while True:
+                size_line, framed = framed.split(b'\r\n', 1)
+                size = int(size_line, 16)
+                self.assertLessEqual(size, 64)
+                body += framed[:size]
+                framed = framed[size + 2:]
+                if not size:
+                    break
+            self.assertEqual(b'', framed)
+            self.assertEqual(data, jsonutils.loads(body))
+
+    def test_rest_call_streams_json_spool(self):
+        pl = directory.get_plugin()
+        spool = servermanager.JSONBodySpool({'networks': []})
+        self.addCleanup(spool.close)
+        with mock.patch(HTTPCON) as conmock:
+            rv = conmock.return_value
+            rv.getresponse.return_value.getheader.return_value = 'HASHHEADER'
+            pl.servers.servers[0].rest_call('POST', '/topology', spool)
+            body = rv.request.call_args[0][2]
+            headers = rv.request.call_args[0][3]
+            self.assertIsInstance(body, servermanager.ChunkedBodyReader)
+            self.assertEqual('chunked', headers['Transfer-Encoding'])
+
+    def test_rest_call_gzip_compression(self):
+        pl = directory.get_plugin()
+        server = pl.servers.servers[0]
+        cfg.CONF.set_override('request_compression_threshold', 100,
+                              'RESTPROXY')
+        big = {'networks': [{'id': 'n%d' % i} for i in range(50)]}
+        with mock.patch(HTTPCON) as conmock:
+            rv = conmock.return_value
+            rv.getresponse.return_value.getheader.return_value = None
+            # not compressed unless the controller supports it
+            server.rest_call('POST', '/topology', big)
+            headers = rv.request.call_args[0][3]
+            self.assertNotIn('Content-Encoding', headers)
+            self.assertNotIn('Accept-Encoding', headers)
+
+            server.capabilities = [servermanager.GZIP_CAPABILITY]
+            server.rest_call('POST', '/topology', big)
+            body, headers = rv.request.call_args[0][2:]
+            self.assertEqual('gzip', headers['Content-Encoding'])
+            self.assertEqual('gzip', headers['Accept-Encoding'])
+            self.assertEqual(big, jsonutils.loads(
+                zlib.decompress(body, servermanager.GZIP_WBITS)))
+
+            # small bodies are sent as is
+            server.rest_call('PUT', '/tenants/t1', {'id': 't1'})
+            headers = rv.request.call_args[0][3]
+            self.assertNotIn('Content-Encoding', headers)
+
+            # the caller's headers are reused for retries on other servers
+            # and are left untouched
+            caller_headers = {'X-Test': '1'}
+            server.rest_call('POST', '/topology', big,
+                             headers=caller_headers)
+            self.assertEqual({'X-Test': '1'}, caller_headers)
+            self.assertEqual('1', rv.request.call_args[0][3]['X-Test'])
+
+    def test_rest_call_gzip_response(self):
+        pl = directory.get_plugin()
+        server = pl.servers.servers[0]
+        server.capabilities = [servermanager.GZIP_CAPABILITY]
+        with mock.patch(HTTPCON) as conmock:
+            resp = conmock.return_value.getresponse.return_value
+            resp.status = httplib.OK
+            resp.read.return_value = servermanager.gzip_compress(
+                b'{"status": "ok"}')
+            resp.getheader.return_value = 'gzip'
+            ret = server.rest_call('GET', '/health')
+            self.assertEqual({'status': 'ok'}, ret[3])
+
+    def test_body_spool_gzipped_once(self):
+        data = {'networks': [{'id': 'n%d' % i} for i in range(100)]}
+        spool = servermanager.JSONBodySpool(data, chunk_size=64)
+        self.addCleanup(spool.close)
+        gzipped = spool.gzipped()
+        self.assertIs(gzipped, spool.gzipped())
+        self.assertLess(gzipped.size, spool.size)
+        compressed = b''
+        offset = 0
+        chunk = gzipped.read_chunk(offset)
+        while chunk:
+            compressed += chunk
+            offset += len(chunk)
+            chunk = gzipped.read_chunk(offset)
+        self.assertEqual(data, jsonutils.loads(
+            zlib.decompress(compressed, servermanager.GZIP_WBITS)))
+
     def test_not_found_sync_raises_error_without_topology(self):
         pl = directory.get_plugin()
         pl.servers.get_topo_function = None
@@ -469,6 +1117,137 @@ class ServerManagerTests(test_rp.BigSwitchProxyPluginV2TestCase):
             self.assertRaises(Exception, pl._send_all_data())  # noqa
             tmock.assert_called_once()
 
+    def test_tenant_cache_shared_between_workers(self):
+        pl = directory.get_plugin()
+        project = mock.Mock(id='tenant1')
+        project.name = 'tenant1name'
+        keystone_client = pl.servers._get_keystone_client()
+        keystone_client.projects.list.return_value = [project]
+        # refresh is due, this worker lists the projects from keystone
+        self.assertTrue(pl.servers._update_tenant_cache(reconcile=False,
+                                                        refresh_after=0))
+        self.assertEqual({'tenant1': 'tenant1name'},
+                         consistency_db.TenantCacheHandler().get_tenants())
+
+        # another worker loads the shared cache instead of listing
+        keystone_client.projects.list.reset_mock()
+        pl.servers.keystone_tenants = {}
+        self.assertTrue(pl.servers._update_tenant_cache(reconcile=False))
+        keystone_client.projects.list.assert_not_called()
+        self.assertEqual('tenant1name', pl.servers.keystone_tenants['tenant1'])
+        self.assertIn(servermanager.SERVICE_TENANT,
+                      pl.servers.keystone_tenants)
+
+    def test_tenant_cache_miss_single_flight(self):
+        pl = directory.get_plugin()
+
+        def slow_sync(**kwargs):
+            eventlet.sleep(0.01)
+
+        with mock.patch(SERVERMANAGER + '.ServerPool._refresh_tenant_cache',
+                        side_effect=slow_sync) as sync_mock:
+            threads = [eventlet.spawn(pl.servers._ensure_tenant_cache,
+                                      'unknown%d' % i) for i in range(5)]
+            for thread in threads:
+                thread.wait()
+            # concurrent misses share one sync
+            self.assertEqual(1, sync_mock.call_count)
+
+            # unknown tenants are not looked up again until the ttl expires
+            pl.servers._ensure_tenant_cache('unknown0')
+            self.assertEqual(1, sync_mock.call_count)
+            with mock.patch(SERVERMANAGER + '.time.time',
+                            return_value=time.time() +
+                            servermanager.UNKNOWN_TENANT_TTL):
+                pl.servers._ensure_tenant_cache('unknown0')
+            self.assertEqual(2, sync_mock.call_count)
+
+    def test_tenant_cache_miss_reconciles_without_lock(self):
+        pl = directory.get_plugin()
+        diff = servermanager.DictDiffer({'tenant3': 'tenant3name'}, {})
+
+        def reconcile(changes):
+            self.assertIs(diff, changes)
+            self.assertFalse(pl.servers._tenant_cache_lock.locked())
+
+        with mock.patch(SERVERMANAGER + '.ServerPool._refresh_tenant_cache',
+                        return_value=diff),\
+                mock.patch(SERVERMANAGER + '.ServerPool._reconcile_tenants',
+                           side_effect=reconcile) as reconcile_mock:
+            pl.servers._ensure_tenant_cache('tenant3')
+        reconcile_mock.assert_called_once_with(diff)
+
+    def test_tenant_cache_incremental_update(self):
+        pl = directory.get_plugin()
+        project = mock.Mock(id='tenant2')
+        project.name = 'tenant2name'
+        keystone_client = pl.servers._get_keystone_client()
+        keystone_client.projects.get.return_value = project
+        keystone_client.projects.list.reset_mock()
+        with mock.patch(SERVERMANAGER + '.ServerPool.rest_action') as ramock:
+            pl.servers.rest_create_tenant('tenant2')
+            keystone_client.projects.get.assert_called_once_with('tenant2')
+            keystone_client.projects.list.assert_not_called()
+            self.assertEqual('tenant2name',
+                             pl.servers.keystone_tenants['tenant2'])
+            self.assertIn('tenant2',
+                          consistency_db.TenantCacheHandler().get_tenants())
+            ramock.assert_called_once_with(
+                'POST', servermanager.TENANT_RESOURCE_PATH,
+                {'tenant_id': 'tenant2', 'tenant_name': 'tenant2name'},
+                mock.ANY)
+
+            pl.servers.rest_delete_tenant('tenant2')
+            self.assertNotIn('tenant2', pl.servers.keystone_tenants)
+            self.assertNotIn('tenant2',
+                             consistency_db.TenantCacheHandler().get_tenants())
+
+    def test_tenant_cache_renamed_tenant(self):
+        pl = directory.get_plugin()
+        project = mock.Mock(id='tenant5')
+        project.name = 'tenant5new'
+        keystone_client = pl.servers._get_keystone_client()
+        keystone_client.projects.get.return_value = project
+        pl.servers.keystone_tenants['tenant5'] = 'tenant5old'
+        with mock.patch(SERVERMANAGER + '.ServerPool.rest_action'),\
+                mock.patch(SERVERMANAGER + '.ServerPool.force_topo_sync') \
+                as tmock:
+            pl.servers.rest_create_tenant('tenant5')
+            tmock.assert_called_once_with(
+                check_ts=False,
+                trigger=servermanager.TOPO_SYNC_TRIGGER_KEYSTONE)
+
+            # same name, nothing to resync
+            tmock.reset_mock()
+            pl.servers.rest_create_tenant('tenant5')
+            tmock.assert_not_called()
+
+            # the service tenant is not a keystone project
+            keystone_client.projects.get.reset_mock()
+            pl.servers.rest_create_tenant(servermanager.SERVICE_TENANT)
+            keystone_client.projects.get.assert_not_called()
+
+    def test_tenant_cache_miss_with_shared_cache(self):
+        pl = directory.get_plugin()
+        project = mock.Mock(id='tenant1')
+        project.name = 'tenant1name'
+        keystone_client = pl.servers._get_keystone_client()
+        keystone_client.projects.list.return_value = [project]
+        self.assertTrue(pl.servers._update_tenant_cache(reconcile=False,
+                                                        refresh_after=0))
+        keystone_client.projects.list.reset_mock()
+
+        # the shared cache was refreshed recently and predates tenant4, it
+        # is looked up in keystone by itself
+        project4 = mock.Mock(id='tenant4')
+        project4.name = 'tenant4name'
+        keystone_client.projects.get.return_value = project4
+        pl.servers._ensure_tenant_cache('tenant4')
+        keystone_client.projects.list.assert_not_called()
+        keystone_client.projects.get.assert_called_once_with('tenant4')
+        self.assertEqual('tenant4name', pl.servers.keystone_tenants['tenant4'])
+        self.assertNotIn('tenant4', pl.servers._unknown_tenants)
+
     def test_floating_calls(self):
         pl = directory.get_plugin()
         with mock.patch(SERVERMANAGER + '.ServerPool.rest_action') as ramock:
@@ -540,6 +1319,43 @@ class ServerManagerTests(test_rp.BigSwitchProxyPluginV2TestCase):
         self.assertEqual(con._tunnel_port, 3128)
         self.assertEqual(con.sock, self.wrap_mock())
 
+    def test_HTTPSConnectionWithValidation_context_cache(self):
+        cache = self.sm.SSLContextCache('SOMECERTS.pem')
+        con = self.sm.HTTPSConnectionWithValidation(
+            'www.example.org', 443, timeout=90)
+        con.ssl_context_cache = cache
+        con.source_address = '127.0.0.1'
+        with mock.patch(SERVERMANAGER + '.ssl.SSLContext') as ctxmock,\
+                mock.patch(SERVERMANAGER + '.os.stat') as statmock:
+            statmock.return_value.st_mtime = 1
+            con.request("GET", "/")
+            context = ctxmock.return_value
+            context.load_verify_locations.assert_called_once_with(
+                cafile='SOMECERTS.pem')
+            self.assertEqual(ssl.CERT_REQUIRED, context.verify_mode)
+            self.assertEqual(con.sock, context.wrap_socket.return_value)
+            self.assertFalse(self.wrap_mock.called)
+
+            # the context is reused until the certificate file changes
+            cache.get_context()
+            self.assertEqual(1, ctxmock.call_count)
+            statmock.return_value.st_mtime = 2
+            cache.get_context()
+            self.assertEqual(2, ctxmock.call_count)
+
+    def test_ssl_context_cache_without_cert(self):
+        cache = self.sm.SSLContextCache(None)
+        with mock.patch(SERVERMANAGER + '.ssl.SSLContext') as ctxmock:
+            context = ctxmock.return_value
+            cache.wrap_socket('sock1')
+            cache.wrap_socket('sock2')
+            # one context, without certificate validation, for all sockets
+            self.assertEqual(1, ctxmock.call_count)
+            self.assertEqual(ssl.CERT_NONE, context.verify_mode)
+            context.load_verify_locations.assert_not_called()
+            context.wrap_socket.assert_has_calls([mock.call('sock1'),
+                                                  mock.call('sock2')])
+
     def test_is_unicode_enabled(self):
         """Verify that unicode is enabled only when both conditions are True:
 
@@ -669,14 +1485,75 @@ class HashLockingTests(test_rp.BigSwitchProxyPluginV2TestCase):
         hh2_ts_hh1_ts_plus_1780 = float(handler1.lock_ts) + 1780
         handler2 = consistency_db.HashHandler(
             hash_id='1', timestamp_ms=hh2_ts_hh1_ts_plus_1780)
-        with mock.patch(CONSISTENCYDB + '.eventlet.sleep',
-                        side_effect=[Exception]) as emock:
-            try:
-                handler2.lock(check_ts=False)
-            except Exception:
-                pass
-        self.assertEqual(1, emock.call_count)
+        waiter = eventlet.spawn(handler2.lock, check_ts=False)
+        eventlet.sleep(0)
+        # handler2 waits for the lock
+        self.assertFalse(waiter.dead)
+        start = time.time()
+        handler1.unlock()
+        # and gets it as soon as it is released
+        self.assertTrue(waiter.wait())
+        self.assertLess(time.time() - start,
+                        consistency_db.TOPO_SYNC_LOCK_POLL_SECS)
+        self.assertEqual(handler1.lock_ts, handler2.prev_lock_ts)
+        self.assertEqual(handler1.fencing_token + 1, handler2.fencing_token)
+        handler2.unlock()
+
+    def test_lock_lease_expired(self):
+        handler1 = consistency_db.HashHandler()
+        self.assertTrue(handler1.lock())
+        # handler1 crashed and stopped renewing its lease
+        handler1._heartbeat.kill()
+        handler1.put_hash('TOPO_SYNC[%s]LEASE[%.6f]' % (handler1.lock_ts,
+                                                        time.time() - 1))
+        handler2 = consistency_db.HashHandler()
+        self.assertTrue(handler2.lock())
         self.assertEqual(handler1.lock_ts, handler2.prev_lock_ts)
+        self.assertGreater(handler2.fencing_token, handler1.fencing_token)
+        handler2.unlock()
+
+    def test_lock_lease_renewal(self):
+        handler = consistency_db.HashHandler()
+        handler.lock()
+        handler._heartbeat.kill()
+        lease = consistency_db.get_lock_lease(handler.lock_marker)
+        stop = mock.Mock()
+        # renew once, then stop
+        stop.ready.side_effect = [False, True]
+        with mock.patch.object(consistency_db, 'TOPO_SYNC_LEASE_SECS', 120):
+            handler._renew_lease(stop)
+        self.assertEqual(2, stop.wait.call_count)
+        self.assertGreater(consistency_db.get_lock_lease(handler.lock_marker),
+                           lease)
+        self.assertEqual(handler.lock_marker,
+                         self._get_hash_from_handler_db(handler))
+
+    def test_unlock_waits_for_lease_renewal(self):
+        handler = consistency_db.HashHandler()
+        handler.lock()
+        handler._heartbeat.kill()
+        renewing = event.Event()
+        update_hash = handler._optimistic_update_hash
+
+        def slow_update(*args):
+            if not renewing.ready():
+                renewing.send()
+            eventlet.sleep(0.01)
+            return update_hash(*args)
+
+        with mock.patch.object(handler, '_optimistic_update_hash',
+                               side_effect=slow_update),\
+                mock.patch.object(consistency_db, 'TOPO_SYNC_LEASE_SECS',
+                                  0.03):
+            handler._heartbeat_stop = event.Event()
+            heartbeat = handler._heartbeat = eventlet.spawn(
+                handler._renew_lease, handler._heartbeat_stop)
+            renewing.wait()
+            # the renewal in progress completes before the lock is released
+            handler.unlock()
+        self.assertTrue(heartbeat.dead)
+        self.assertEqual(handler.lock_ts,
+                         self._get_hash_from_handler_db(handler))
 
     def test_lock_check_ts_true_prev_lock_not_expired(self):
         handler1 = consistency_db.HashHandler()
@@ -755,8 +1632,9 @@ class HashLockingTests(test_rp.BigSwitchProxyPluginV2TestCase):
         handler2 = consistency_db.HashHandler()
 
         with mock.patch.object(handler2._FACADE, 'get_engine') as ge, \
-                mock.patch(CONSISTENCYDB + '.eventlet.sleep',
-                           side_effect=[None]) as emock:
+                mock.patch.object(handler2, '_next_fencing_token',
+                                  return_value=2), \
+                mock.patch(CONSISTENCYDB + '.eventlet.sleep') as emock:
             conn = ge.return_value.begin.return_value.__enter__.return_value
             firstresult = mock.Mock()
             # a rowcount of 0 simulates the effect of another db client
@@ -769,8 +1647,48 @@ class HashLockingTests(test_rp.BigSwitchProxyPluginV2TestCase):
             self.assertTrue(h2)
             # update should have been called again after the failure
             self.assertEqual(2, conn.execute.call_count)
-            # sleep should have been called once, during first result failure
-            emock.assert_called_once()
+            # without sleeping in between
+            emock.assert_not_called()
+        handler2.unlock()
+
+    def test_topo_hashes(self):
+        handler = consistency_db.HashHandler()
+        self.assertEqual({}, handler.get_topo_hashes())
+        handler.update_topo_hashes({('networks', 'n1'): 'h1',
+                                    ('networks', 'n2'): 'h2'}, replace=True)
+        handler.update_topo_hashes({('networks', 'n1'): 'h1new',
+                                    ('routers', 'r1'): 'h3'},
+                                   removed=[('networks', 'n2')])
+        self.assertEqual({('networks', 'n1'): 'h1new',
+                          ('routers', 'r1'): 'h3'},
+                         handler.get_topo_hashes())
+        handler.update_topo_hashes({('tenants', 't1'): 'h4'}, replace=True)
+        self.assertEqual({('tenants', 't1'): 'h4'},
+                         handler.get_topo_hashes())
+
+    def test_topo_sync_triggers(self):
+        handler = consistency_db.HashHandler()
+        self.assertEqual({}, handler.get_topo_sync_triggers())
+        handler.put_topo_sync_triggers({'startup': 1})
+        handler.put_topo_sync_triggers({'rest-failure': 3, 'keystone': 1})
+        self.assertEqual({'rest-failure': 3, 'keystone': 1},
+                         handler.get_topo_sync_triggers())
+
+    def test_engine_kept_until_fork(self):
+        facade = consistency_db.get_engine_facade()
+        consistency_db.HashHandler()
+        self.assertIs(facade, consistency_db.get_engine_facade())
+        with mock.patch.object(consistency_db.HashHandler, '_FACADE',
+                               facade),\
+                mock.patch.object(consistency_db.HashHandler, '_facade_pid',
+                                  os.getpid()),\
+                mock.patch(CONSISTENCYDB + '.os.getpid',
+                           return_value=os.getpid() + 1):
+            self.assertEqual({}, consistency_db.get_pool_stats())
+            forked = consistency_db.get_engine_facade()
+            self.assertIsNot(facade, forked)
+            # the parent's pool is not touched by the forked worker
+            self.assertIs(forked, consistency_db.get_engine_facade())
 
     def test_clear_lock(self):
         handler = consistency_db.HashHandler()
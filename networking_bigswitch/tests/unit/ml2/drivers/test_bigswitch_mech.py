@@ -337,7 +337,8 @@ class TestBigSwitchMechDriverPortsV2(test_db_base_plugin_v2.TestPortsV2,
                     send_routers=True,
                     send_floating_ips=True,
                     timeout=None,
-                    triggered_by_tenant=p['port']['tenant_id']
+                    triggered_by_tenant=p['port']['tenant_id'],
+                    trigger=servermanager.TOPO_SYNC_TRIGGER_NXNETWORK
                 )
             ])
         self.spawn_p.start()
@@ -361,10 +362,27 @@ class TestBigSwitchMechDriverPortsV2(test_db_base_plugin_v2.TestPortsV2,
                     send_routers=True,
                     send_floating_ips=True,
                     timeout=None,
-                    triggered_by_tenant=p['port']['tenant_id']
+                    triggered_by_tenant=p['port']['tenant_id'],
+                    trigger=servermanager.TOPO_SYNC_TRIGGER_NXNETWORK
                 )
             ])
 
+    def test_port_updates_dispatched_behind_network(self):
+        mm = directory.get_plugin().mechanism_manager
+        bigdriver = mm.mech_drivers['bsn_ml2'].obj
+        with mock.patch.object(bigdriver, 'dispatcher') as dmock,\
+                self.port(**{'device_id': 'devid',
+                             'binding:host_id': 'host',
+                             'arg_list': ('binding:host_id',)}) as p:
+            net_id = p['port']['network_id']
+            port_calls = [c for c in dmock.dispatch.mock_calls
+                          if c[1][1] == bigdriver.async_port_create]
+            self.assertTrue(port_calls)
+            for port_call in port_calls:
+                self.assertEqual(('network', net_id), port_call[1][0])
+                self.assertEqual(('update', p['port']['id']),
+                                 port_call[2]['coalesce'])
+
     def test_backend_request_contents(self):
         with\
             mock.patch(SERVER_POOL + '.rest_create_port') as mock_rest,\